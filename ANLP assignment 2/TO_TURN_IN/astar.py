@@ -0,0 +1,213 @@
+'''Agenda-based A* parsing with the CKY grammar indices
+
+CKY fills every cell of the chart, even when only the best parse is
+wanted. An agenda-based parser instead builds items (a symbol over a
+span) best first: every item which could be built is put on a priority
+queue, and the best one is taken off it, added to the chart and combined
+with the items already there to make new ones. The priority of an item
+is its inside score (the log probability of the best way found to build
+it) plus an estimate of its outside score (the best context it could
+appear in).
+
+CKY.outsideEstimate is worked out from the grammar alone: for each
+symbol, the best log probability of any tree from the start symbol with
+that symbol as one of its leaves. It is never less than the true outside
+score, and it is consistent (building a parent never raises the
+priority), so an item taken off the agenda already has its best inside
+score, and the first time the start symbol over the whole input comes
+off, it is the best parse (Klein and Manning, A* parsing, 2003). Parsing
+stops there, leaving most of the chart unbuilt.
+
+The agenda chart keeps only the best back-pointer of each label, so its
+ParseResult holds just the best parse: count() is 1 and trees() gives
+that tree alone. Use CKY.parse for every analysis.
+
+With a plain CFG every score is 0.0, so the agenda is a plain queue
+and the parser is an ordinary agenda-driven recogniser which still
+stops at the first complete parse.
+
+Usage:
+    python astar.py [grammar.pcfg sentences.txt]
+
+prints, for each sentence, the items A* pushed and popped against the
+labels CKY builds. With no arguments it uses grammar2, trained as in
+prune_eval, on prune_eval's sentences.
+'''
+import sys
+import heapq
+import itertools
+from cky_5 import CKY, Chart, Label, ParseResult
+
+class AStar:
+    '''A best-first parser sharing a CKY parser's grammar and indices
+
+    Like CKY, it holds nothing about any one sentence.'''
+
+    def __init__(self,grammar):
+        '''Create an A* parser
+
+        :type grammar: CKY or nltk.grammar.CFG
+        :param grammar: a CKY parser, whose indices and estimates are
+            shared rather than rebuilt, or a grammar to build one for
+        '''
+        if isinstance(grammar,CKY):
+            self.parser=grammar
+        else:
+            self.parser=CKY(grammar)
+        self.grammar=self.parser.grammar
+
+    def parse(self,tokens,verbose=False):
+        '''Postcondition: items have been taken off the agenda, best
+        first, until the goal was reached or nothing was left, and a
+        ParseResult for the agenda chart has been returned.
+
+        :type tokens: list(str)
+        :param tokens: the words to be parsed
+        :type verbose: bool
+        :param verbose: trace every item taken off the agenda if True
+        :rtype: cky_5.ParseResult
+        :return: the result; result.chart.popped and result.chart.pushed
+            count the items taken off and put on the agenda
+        '''
+        chart=AgendaChart(self.parser,tokens,verbose)
+        chart.fill()
+        return ParseResult(chart)
+
+class AgendaChart(Chart):
+    '''A chart filled best first from an agenda, rather than by CKY
+
+    Uses the same matrix of Cells and Labels as Chart, so the result can
+    be printed and its trees extracted in the same way.'''
+
+    def __init__(self,parser,tokens,verbose=False):
+        Chart.__init__(self,parser,tokens,verbose)
+        self.logprob=parser.logprob
+        self.estimate=parser.outsideEstimate
+        # the agenda: a heap of (-priority, tie-breaker, start, end,
+        #  symbol, inside score, children)
+        self.agenda=[]
+        self.tiebreak=itertools.count()
+        # best inside score put on the agenda so far, by (start, end, symbol)
+        self.best={}
+        # finished labels by where they start and by where they end, as
+        #  (other end, label) pairs, for finding neighbours to combine with
+        self.starting=[[] for i in range(self.n)]
+        self.ending=[[] for i in range(self.n)]
+        self.pushed=0
+        self.popped=0
+
+    def fill(self):
+        '''Postcondition: the goal has been finished, or every item which
+        can be built has been.
+
+        How: Put each word in its cell and combine it with what is
+        already finished. Then repeatedly pop the best item: if its span
+        and symbol are already finished, it is a worse duplicate and is
+        dropped; otherwise make its Label, put it in its cell, stop if it
+        is the goal, and combine it with its finished neighbours.
+        '''
+        for r in range(self.n-1):
+            label=Label(self.words[r])
+            self.matrix[r][r+1].insertLabel(label)
+            self.finish(r,r+1,label)
+        goal=self.grammar.start()
+        agenda=self.agenda
+        while agenda:
+            (merit,tie,start,end,symbol,
+             inside,children)=heapq.heappop(agenda)
+            cell=self.matrix[start][end]
+            if cell.label(symbol) is not None:
+                continue
+            self.popped+=1
+            self.log("pop %s %s-%s %.3f",symbol,start,end,-merit)
+            label=Label(symbol)
+            label.addBackpointer(children)
+            cell.insertLabel(label)
+            if symbol==goal and start==0 and end==self.n-1:
+                break
+            self.finish(start,end,label)
+
+    def finish(self,start,end,label):
+        '''Postcondition: every item which can be built from label and
+        the finished items beside it is on the agenda.
+
+        How: Push each unary parent of label over the same span. Push the
+        parent of every binary rule with label on the left and a finished
+        item starting where label ends on the right, and the same the
+        other way round.
+        '''
+        self.starting[start].append((end,label))
+        self.ending[end].append((start,label))
+        symbol=label.symbol()
+        for parent in self.unary.get(symbol,()):
+            self.push(start,end,parent,(label,))
+        for other_end,right in self.starting[end]:
+            for parent in self.binary.get((symbol,right.symbol()),()):
+                self.push(start,other_end,parent,(label,right))
+        for other_start,left in self.ending[start]:
+            for parent in self.binary.get((left.symbol(),symbol),()):
+                self.push(other_start,end,parent,(left,label))
+
+    def push(self,start,end,symbol,children):
+        '''Put one item on the agenda, unless it can never be part of a
+        parse or a better way of building it is on already'''
+        estimate=self.estimate.get(symbol)
+        if estimate is None or estimate==float('-inf'):
+            return
+        rhs=tuple(child.symbol() for child in children)
+        inside=self.logprob.get((symbol,rhs),0.0)
+        for child in children:
+            inside+=child.score(self.logprob)
+        key=(start,end,symbol)
+        if inside<=self.best.get(key,float('-inf')):
+            return
+        self.best[key]=inside
+        self.pushed+=1
+        heapq.heappush(self.agenda,(-(inside+estimate),next(self.tiebreak),
+                                    start,end,symbol,inside,children))
+
+def chart_size(chart):
+    '''The number of non-terminal labels in a chart'''
+    return sum(1 for row in chart.matrix for cell in row if cell is not None
+               for label in cell.labels() if label.backpointers())
+
+def compare(parser,sentences):
+    '''Parse each sentence with A* and with CKY and print how many items
+    each built and whether they found a parse with the same best score
+    (not always the same tree: parses can tie)
+
+    :type parser: CKY
+    :param parser: the grammar, shared by both
+    :type sentences: list(list(str))
+    :param sentences: the tokenised sentences
+    '''
+    astar=AStar(parser)
+    print('%-50s %7s %7s %7s %5s'%('sentence','pushed','popped','CKY','same'))
+    for tokens in sentences:
+        mine=astar.parse(tokens)
+        full=parser.parse(tokens)
+        same=mine.recognised==full.recognised and (
+            not mine or abs(mine.goal().score(parser.logprob)-
+                            full.kBest(1)[0][1])<1e-9)
+        print('%-50s %7d %7d %7d %5s'%(' '.join(tokens)[:50],
+                                       mine.chart.pushed,mine.chart.popped,
+                                       chart_size(full.chart),same))
+
+if __name__=='__main__':
+    from hw2_5 import tokenise
+    from prune_eval import SENTENCES
+    from nltk.grammar import PCFG
+    if len(sys.argv)>2:
+        with open(sys.argv[1]) as f:
+            grammar=PCFG.fromstring(f.read())
+        with open(sys.argv[2]) as f:
+            sentences=[tokenise(line) for line in f if line.strip()]
+    else:
+        from hw2_5 import grammar2
+        from grammar_tables import GrammarTables
+        import inside_outside
+        sentences=[tokenise(s) for s in SENTENCES]
+        tables=GrammarTables(grammar2)
+        inside_outside.train(tables,sentences,5,1)
+        grammar=tables.toPCFG()
+    compare(CKY(grammar),sentences)
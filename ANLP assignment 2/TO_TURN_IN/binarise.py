@@ -0,0 +1,214 @@
+'''Binarisation of grammars with long rules, and undoing it in trees
+
+CKY needs every rule to have one or two symbols on its right-hand side.
+A longer rule is split into a chain of binary rules through new
+intermediate symbols, each standing for part of the right-hand side.
+With right factoring the intermediate stands for everything after the
+first symbol:
+
+    VP -> V NP PP PP    becomes    VP -> V _<NP-PP-PP>
+                                   _<NP-PP-PP> -> NP _<PP-PP>
+                                   _<PP-PP> -> PP PP
+
+and with left factoring for everything before the last one:
+
+    VP -> V NP PP PP    becomes    VP -> _<V-NP-PP> PP
+                                   _<V-NP-PP> -> _<V-NP> PP
+                                   _<V-NP> -> V NP
+
+An intermediate is named after the symbols it stands for, not the rule
+it came from, so rules with the same prefix (left factoring) or suffix
+(right factoring) share it, whatever their left-hand sides: the chart
+then holds one label for it per span, not one per rule. Which of the two
+shares more depends on the grammar: rules which differ at the end (such
+as VP -> V NP and VP -> V NP PP) share under left factoring, rules which
+differ at the start under right factoring.
+
+An intermediate has only one rule, so it gets probability 1.0: the first
+rule of a chain keeps the long rule's probability. Every tree
+of the binarised grammar corresponds to exactly one of the original, so
+counts and probabilities are unchanged, and restore() turns one into
+the other by splicing the intermediates' children into their parents.
+
+CKY binarises a grammar with long rules itself; its binarisation
+attribute holds the Binarisation. To compare the two factorings:
+
+    python binarise.py grammar.cfg [right|left]
+
+(with no grammar, it checks that intermediates never share a name)
+'''
+from nltk.grammar import Nonterminal, Production, ProbabilisticProduction, CFG
+from nltk.tree import Tree
+import cfg_fix
+
+FACTORS=('right','left')
+
+class Binarisation:
+    '''A grammar with its long rules binarised, and how to undo it'''
+
+    def __init__(self,grammar,factor='right'):
+        '''Binarise grammar
+
+        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+        :param grammar: a grammar, with rules of any (non-zero) length
+        :type factor: str
+        :param factor: 'right' or 'left', see above
+        '''
+        if factor not in FACTORS:
+            raise ValueError('factor must be one of %s, not %r'%(
+                ', '.join(FACTORS),factor))
+        self.original=grammar
+        self.factor=factor
+        # the original grammar's symbols, which no new one may clash with
+        self._taken=set(production.lhs().symbol()
+                        for production in grammar.productions())
+        for production in grammar.productions():
+            self._taken.update(str(sym) for sym in production.rhs())
+        # the intermediate for each tuple of symbols
+        self.intermediates={}
+        # the right-hand side of each intermediate's one rule
+        self.chains={}
+        self.symbols=set()
+        self.binarised=0
+        productions=[]
+        seen=set()
+        for production in grammar.productions():
+            if len(production.rhs())>2:
+                self.binarised+=1
+            for rule in self.binariseProduction(production):
+                if rule not in seen:
+                    seen.add(rule)
+                    productions.append(rule)
+        self.added_rules=len(self.chains)
+        # a CFG of ProbabilisticProductions, like the grammars of the other
+        #  transforms, since a trimmed PCFG need not sum to one
+        self.grammar=CFG(grammar.start(),productions)
+
+    def binariseProduction(self,production):
+        '''The binary rules for one rule: the rule itself if it is short,
+        otherwise its top rule and the rules of every intermediate under
+        it (whether they were made for it or for an earlier rule)
+
+        :type production: nltk.grammar.Production
+        :param production: the rule
+        :rtype: list(nltk.grammar.Production)
+        :return: the rules which stand for it
+        '''
+        rhs=production.rhs()
+        if len(rhs)<=2:
+            return [production]
+        prob=production.prob() if hasattr(production,'prob') else None
+        if self.factor=='right':
+            top=(rhs[0],self.intermediate(rhs[1:]))
+            inter=top[1]
+        else:
+            top=(self.intermediate(rhs[:-1]),rhs[-1])
+            inter=top[0]
+        res=[_production(production.lhs(),top,prob)]
+        while inter is not None:
+            sub=self.chains[inter]
+            res.append(_production(inter,sub,None if prob is None else 1.0))
+            inter=sub[1] if self.factor=='right' else sub[0]
+            if inter not in self.symbols:
+                inter=None
+        return res
+
+    def intermediate(self,symbols):
+        '''The intermediate symbol standing for symbols, making it (and
+        the rest of its chain) if it is new
+
+        :type symbols: tuple
+        :param symbols: two or more symbols of a right-hand side
+        :rtype: nltk.grammar.Nonterminal
+        :return: the intermediate
+        '''
+        inter=self.intermediates.get(symbols)
+        if inter is not None:
+            return inter
+        # words are quoted, so that a word and a non-terminal with the same
+        #  name give different names; the names may still clash ((A-B, C)
+        #  and (A, B-C) are both _<A-B-C>), so each one made is taken too
+        name='_<%s>'%'-'.join(sym.symbol() if isinstance(sym,Nonterminal)
+                              else repr(sym) for sym in symbols)
+        while name in self._taken:
+            name='_'+name
+        self._taken.add(name)
+        inter=Nonterminal(name)
+        self.intermediates[symbols]=inter
+        self.symbols.add(inter)
+        if len(symbols)==2:
+            rhs=symbols
+        elif self.factor=='right':
+            rhs=(symbols[0],self.intermediate(symbols[1:]))
+        else:
+            rhs=(self.intermediate(symbols[:-1]),symbols[-1])
+        self.chains[inter]=rhs
+        return inter
+
+    def restore(self,tree):
+        '''The original grammar's tree for a tree of the binarised one
+
+        How: Rebuild the tree bottom up, replacing every child labelled
+        with an intermediate symbol by its own (already restored)
+        children.
+
+        :type tree: nltk.tree.Tree
+        :param tree: a tree of self.grammar
+        :rtype: nltk.tree.Tree
+        :return: the same tree with no intermediate symbols
+        '''
+        if not isinstance(tree,Tree):
+            return tree
+        children=[]
+        for child in tree:
+            child=self.restore(child)
+            if isinstance(child,Tree) and self.isIntermediate(child.label()):
+                children.extend(child)
+            else:
+                children.append(child)
+        return Tree(tree.label(),children)
+
+    def isIntermediate(self,label):
+        '''Whether a tree label (a string) is one of the new symbols'''
+        return Nonterminal(label) in self.symbols
+
+    def report(self):
+        '''A one-line summary of what binarisation added'''
+        return ('%s factoring: %d long rules binarised, %d symbols and %d '
+                'rules added'%(self.factor,self.binarised,len(self.symbols),
+                               self.added_rules))
+
+def _production(lhs,rhs,prob):
+    if prob is None:
+        return Production(lhs,rhs)
+    return ProbabilisticProduction(lhs,rhs,prob=prob)
+
+def has_long_rules(grammar):
+    '''Whether any rule of grammar has more than two symbols on its right'''
+    return any(len(production.rhs())>2
+               for production in grammar.productions())
+
+if __name__=='__main__':
+    import sys
+    from cfg_fix import parse_grammar
+    if len(sys.argv)<2:
+        # symbols whose names run together when joined: each tuple must
+        #  still get an intermediate of its own
+        clash=parse_grammar('''
+S -> X A-B C | Y A B-C | X 'a' A C
+X -> 'x'
+Y -> 'y'
+A-B -> 'ab'
+A -> 'a'
+B-C -> 'bc'
+C -> 'c'
+''')
+        for factor in FACTORS:
+            binarisation=Binarisation(clash,factor)
+            assert len(binarisation.symbols)==len(binarisation.intermediates)
+            print(binarisation.report())
+        sys.exit()
+    with open(sys.argv[1]) as f:
+        grammar=parse_grammar(f.read())
+    for factor in sys.argv[2:] or FACTORS:
+        print(Binarisation(grammar,factor).report())
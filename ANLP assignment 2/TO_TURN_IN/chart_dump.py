@@ -0,0 +1,359 @@
+'''Writing filled charts compactly, and looking at parts of them
+
+Chart.pprint lays out every cell of the matrix, and each label in it,
+as strings before it prints anything, which for a long sentence is a
+great deal of text no one reads. Here a chart is first encoded as a
+CompactChart: a table of the symbols it uses, and flat arrays of
+numbers giving, for each label, its symbol and its back-pointers, as
+the numbers of the child labels. That can be written to a file, as
+binary or as JSON lines, and read back, and looked at a few spans at a
+time, or as a summary: a grid of how many labels each cell has.
+
+The binary form is the magic number and counts as 32-bit integers, then
+the words and the symbol names (each NUL-terminated UTF-8), then the
+arrays. The JSON lines form is a first line with the words and symbols,
+then one line per cell:
+
+    {"span": [0, 3], "labels": [[7, [[12, 15]]], [4, [[31]]]]}
+
+where each label is [symbol, back-pointers], and labels are numbered in
+the order they come in the file. Either way, only cells which have a
+label are written.
+
+To parse a sentence with grammar2, dump its chart to a file, read it
+back and show the labels over some spans (as start-end) or a summary:
+
+    python chart_dump.py [sentence] [span ...]
+'''
+import sys
+import json
+import struct
+from array import array
+from nltk.grammar import Nonterminal
+
+MAGIC=0x434b5943  # 'CKYC'
+VERSION=1
+# MAGIC, VERSION, then the number of words, symbols, non-terminal
+#  symbols, cells, labels and back-pointer entries
+HEADER=struct.Struct('<8i')
+
+# the most labels view() shows for one span
+LIMIT=8
+
+class CompactChart:
+    '''A filled chart as a table of symbols and flat arrays of numbers
+
+    Symbols are numbered with the non-terminals first. The labels of a
+    cell are numbered one after the other, cells in order of their start
+    and then their end. For label i, symbol[i] is its symbol's number and
+    pointers[first[i]:first[i+1]] are its back-pointers, each as the
+    number of children (1 or 2) followed by their label numbers.
+    '''
+
+    def __init__(self,words,symbols,nonterminals,spans,cell_first,
+                 symbol,first,pointers):
+        '''Use encode() or load() rather than calling this
+
+        :type words: list(str)
+        :param words: the chart's words
+        :type symbols: list(str)
+        :param symbols: the symbols' names, non-terminals first
+        :type nonterminals: int
+        :param nonterminals: how many of the symbols are non-terminals
+        :type spans: array
+        :param spans: start and end of each cell, one after the other
+        :type cell_first: array
+        :param cell_first: the number of each cell's first label, and of
+            the label after the last cell
+        :type symbol: array
+        :param symbol: each label's symbol number
+        :type first: array
+        :param first: where each label's back-pointers start in pointers
+            (and one more, for the end of the last)
+        :type pointers: array
+        :param pointers: the back-pointers
+        '''
+        self.words=words
+        self.symbols=symbols
+        self.nonterminals=nonterminals
+        self.spans=spans
+        self.cell_first=cell_first
+        self.symbol=symbol
+        self.first=first
+        self.pointers=pointers
+        self._cells=None
+
+    def cells(self):
+        '''(start, end) -> the numbers of the cell's first label and of
+        the label after its last'''
+        if self._cells is None:
+            spans=self.spans
+            cell_first=self.cell_first
+            self._cells=dict(((spans[2*i],spans[2*i+1]),
+                              (cell_first[i],cell_first[i+1]))
+                             for i in range(len(spans)//2))
+        return self._cells
+
+    def labels(self,start,end):
+        '''The names of the symbols in cell (start, end), in the order
+        they were added'''
+        first,last=self.cells().get((start,end),(0,0))
+        return [self.symbols[self.symbol[i]] for i in range(first,last)]
+
+    def backpointers(self,i):
+        '''Label i's back-pointers, as tuples of child label numbers'''
+        pointers=self.pointers
+        res=[]
+        j=self.first[i]
+        while j<self.first[i+1]:
+            arity=pointers[j]
+            res.append(tuple(pointers[j+1:j+1+arity]))
+            j+=1+arity
+        return res
+
+    def isNonterminal(self,i):
+        '''Whether label i is a non-terminal (rather than a word)'''
+        return self.symbol[i]<self.nonterminals
+
+    def __len__(self):
+        '''The number of labels'''
+        return len(self.symbol)
+
+def encode(chart):
+    '''A CompactChart for a filled chart
+
+    How: One pass over the cells numbers the labels and the symbols (a
+    dict from each label's id() to its number), a second writes each
+    label's back-pointers with those numbers. Nothing is made per label
+    but numbers in arrays.
+
+    :type chart: cky_5.Chart
+    :param chart: the chart
+    :rtype: CompactChart
+    '''
+    number={}
+    symbols={}
+    order=[]
+    spans=array('i')
+    cell_first=array('i',[0])
+    for row in chart.matrix:
+        for cell in row:
+            if cell is None or not cell.labels():
+                continue
+            for label in cell.labels():
+                number[id(label)]=len(order)
+                order.append(label)
+                symbols.setdefault(label.symbol(),None)
+            spans.append(cell._row)
+            spans.append(cell._column)
+            cell_first.append(len(order))
+    # non-terminals first, then the words, each in the order met
+    names=[sym for sym in symbols if isinstance(sym,Nonterminal)]
+    nonterminals=len(names)
+    names+=[sym for sym in symbols if not isinstance(sym,Nonterminal)]
+    sym_number=dict((sym,i) for i,sym in enumerate(names))
+    symbol=array('i',[sym_number[label.symbol()] for label in order])
+    first=array('i')
+    pointers=array('i')
+    for label in order:
+        first.append(len(pointers))
+        for children in label.backpointers():
+            pointers.append(len(children))
+            for child in children:
+                # a child pruned from its cell has no number: -1
+                pointers.append(number.get(id(child),-1))
+    first.append(len(pointers))
+    return CompactChart(list(chart.words),[str(sym) for sym in names],
+                        nonterminals,spans,cell_first,symbol,first,
+                        pointers)
+
+def dump(chart,f,form='binary'):
+    '''Postcondition: a chart has been written to f
+
+    :type chart: cky_5.Chart or CompactChart
+    :param chart: the chart
+    :type f: file
+    :param f: a file open for writing, in binary mode for 'binary' and
+        text mode for 'jsonl'
+    :type form: str
+    :param form: 'binary' or 'jsonl'
+    '''
+    if not isinstance(chart,CompactChart):
+        chart=encode(chart)
+    if form=='binary':
+        f.write(HEADER.pack(MAGIC,VERSION,len(chart.words),
+                            len(chart.symbols),chart.nonterminals,
+                            len(chart.spans)//2,len(chart.symbol),
+                            len(chart.pointers)))
+        for names in (chart.words,chart.symbols):
+            f.write(''.join(name+'\0' for name in names).encode('utf-8'))
+        for numbers in (chart.spans,chart.cell_first,chart.symbol,
+                        chart.first,chart.pointers):
+            if sys.byteorder!='little':
+                numbers=array('i',numbers)
+                numbers.byteswap()
+            f.write(numbers.tobytes())
+    elif form=='jsonl':
+        f.write(json.dumps({'words':chart.words,'symbols':chart.symbols,
+                            'nonterminals':chart.nonterminals})+'\n')
+        for (start,end),(first,last) in chart.cells().items():
+            f.write(json.dumps(
+                {'span':[start,end],
+                 'labels':[[chart.symbol[i],
+                            [list(children)
+                             for children in chart.backpointers(i)]]
+                           for i in range(first,last)]})+'\n')
+    else:
+        raise ValueError("form must be 'binary' or 'jsonl', not %r"%(form,))
+
+def load(path):
+    '''Read a chart written by dump, in either form
+
+    :type path: str
+    :param path: the file
+    :rtype: CompactChart
+    '''
+    with open(path,'rb') as f:
+        data=f.read()
+    if len(data)>=4 and struct.unpack('<i',data[:4])[0]==MAGIC:
+        return _loadBinary(data)
+    return _loadLines(data.decode('utf-8').splitlines())
+
+def _loadBinary(data):
+    (magic,version,words,symbols,nonterminals,cells,labels,
+     pointers)=HEADER.unpack_from(data)
+    if version!=VERSION:
+        raise ValueError('chart dump version %d, not %d'%(version,VERSION))
+    at=HEADER.size
+    names=[]
+    for count in (words,symbols):
+        found=[]
+        for i in range(count):
+            end=data.index(b'\0',at)
+            found.append(data[at:end].decode('utf-8'))
+            at=end+1
+        names.append(found)
+    arrays=[]
+    for count in (2*cells,cells+1,labels,labels+1,pointers):
+        numbers=array('i')
+        numbers.frombytes(data[at:at+4*count])
+        if sys.byteorder!='little':
+            numbers.byteswap()
+        arrays.append(numbers)
+        at+=4*count
+    return CompactChart(names[0],names[1],nonterminals,*arrays)
+
+def _loadLines(lines):
+    head=json.loads(lines[0])
+    spans=array('i')
+    cell_first=array('i',[0])
+    symbol=array('i')
+    first=array('i')
+    pointers=array('i')
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        cell=json.loads(line)
+        spans.extend(cell['span'])
+        for sym,backpointers in cell['labels']:
+            symbol.append(sym)
+            first.append(len(pointers))
+            for children in backpointers:
+                pointers.append(len(children))
+                pointers.extend(children)
+        cell_first.append(len(symbol))
+    first.append(len(pointers))
+    return CompactChart(head['words'],head['symbols'],head['nonterminals'],
+                        spans,cell_first,symbol,first,pointers)
+
+def view(chart,spans=None,limit=LIMIT,words=False):
+    '''The labels over some spans, one line per span, at most limit of
+    them each
+
+    :type chart: cky_5.Chart or CompactChart
+    :param chart: the chart
+    :type spans: iter(tuple(int, int))
+    :param spans: the (start, end) spans to show, or None for every span
+        with a label, widest last
+    :type limit: int
+    :param limit: the most labels to show for a span; the rest are only
+        counted
+    :type words: bool
+    :param words: whether to show the words labelled by each word's cell
+        too
+    :rtype: list(str)
+    '''
+    if not isinstance(chart,CompactChart):
+        chart=encode(chart)
+    if spans is None:
+        spans=sorted(chart.cells(),key=lambda span:(span[1]-span[0],span))
+    lines=[]
+    for start,end in spans:
+        first,last=chart.cells().get((start,end),(0,0))
+        names=[chart.symbols[chart.symbol[i]] for i in range(first,last)
+               if words or chart.isNonterminal(i)]
+        shown=' '.join(names[:limit])
+        if len(names)>limit:
+            shown+=' (+%d more)'%(len(names)-limit)
+        lines.append('%d-%d %s: %s'%(start,end,
+                                      ' '.join(chart.words[start:end]),
+                                      shown or '-'))
+    return lines
+
+def summary(chart):
+    '''A grid of the number of labels in each cell, laid out as
+    Chart.pprint lays out the labels themselves
+
+    :type chart: cky_5.Chart or CompactChart
+    :param chart: the chart
+    :rtype: list(str)
+    '''
+    if not isinstance(chart,CompactChart):
+        chart=encode(chart)
+    n=len(chart.words)
+    cells=chart.cells()
+    size=max([len(str(last-first)) for first,last in cells.values()]+
+             [len(str(n))])
+    index=len(str(n-1))
+    lines=[' '*(index+1)+' '.join(str(c).rjust(size) for c in range(1,n+1))]
+    for r in range(n):
+        row=[]
+        for c in range(1,n+1):
+            if c<=r:
+                row.append(' '*size)
+            else:
+                first,last=cells.get((r,c),(0,0))
+                row.append(str(last-first).rjust(size) if last>first
+                           else '.'.rjust(size))
+        lines.append(str(r).rjust(index)+' '+' '.join(row))
+    lines.append('%d labels in %d cells, %d back-pointer entries'%(
+        len(chart),len(cells),len(chart.pointers)))
+    return lines
+
+if __name__=='__main__':
+    import os
+    import time
+    import tempfile
+    from hw2_5 import grammar2, tokenise
+    from cky_5 import CKY
+    sentence=(sys.argv[1] if len(sys.argv)>1 else
+              'John gave Mary a book with a fork with a book with a fork '
+              'to John with a fork with mushrooms with a fork to Mary with '
+              'a book with a fork to John with a fork with salad today.')
+    spans=[tuple(int(x) for x in arg.split('-')) for arg in sys.argv[2:]]
+    result=CKY(grammar2).parse(tokenise(sentence))
+    directory=tempfile.mkdtemp()
+    for form,mode in (('binary','wb'),('jsonl','w')):
+        path=os.path.join(directory,'chart.'+form)
+        start=time.time()
+        with open(path,mode) as f:
+            dump(result.chart,f,form)
+        took=time.time()-start
+        start=time.time()
+        loaded=load(path)
+        print('%s: %d bytes, written in %.1fms, read in %.1fms'%(
+            form,os.path.getsize(path),took*1000,(time.time()-start)*1000))
+        os.remove(path)
+    os.rmdir(directory)
+    print('\n'.join(view(loaded,spans or None) if spans else
+                    summary(loaded)))
@@ -1,284 +0,0 @@
-import sys,re
-import nltk
-from collections import defaultdict
-import cfg_fix
-from cfg_fix import parse_grammar, CFG
-from pprint import pprint
-# The printing and tracing functionality is in a separate file in order
-#  to make this file easier to read
-from cky_print import CKY_pprint, CKY_log, Cell__str__, Cell_str, Cell_log
-
-class CKY:
-    """An implementation of the Cocke-Kasami-Younger (bottom-up) CFG recogniser.
-
-    Goes beyond strict CKY's insistance on Chomsky Normal Form.
-    It allows arbitrary unary productions, not just NT->T
-    ones, that is X -> Y with either Y -> A B or Y -> Z .
-    It also allows mixed binary productions, that is NT -> NT T or -> T NT"""
-
-    def __init__(self,grammar):
-        '''Create an extended CKY processor for a particular grammar
-
-        Grammar is an NLTK CFG
-        consisting of unary and binary rules (no empty rules,
-        no more than two symbols on the right-hand side
-
-        (We use "symbol" throughout this code to refer to _either_ a string or
-        an nltk.grammar.Nonterminal, that is, the two thinegs we find in
-        nltk.grammar.Production)
-
-        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
-        :param grammar: A context-free grammar
-        :return: none'''
-
-        self.verbose=False
-        assert(isinstance(grammar,CFG))
-        self.grammar=grammar
-        # split and index the grammar
-        self.buildIndices(grammar.productions())
-
-    def buildIndices(self,productions):
-        ''' Postcondition: The "defaultdict"s (subclasses of dictionaries that
-        call a factory function attribute) ‘unary’ and ‘binary’ are created and
-        populated with unary and binary productions from NLTK. The defaultdict 
-        subclass is an optimal data structure because it can create a 
-        dictionary, as in this case, where the values are stored as lists. 
-        When populating the CKY matrix, the left-hand-side rules need to be 
-        looked up quickly to see what right-hand-side rule(s) they map to. 
-        So the keys are RHSs because looking up a dictionary key is extremely 
-        fast. 
-
-        How: 
-
-        Create two specialised container datatypes i.e defaultdicts to store 
-        the production rules, one for unary rules and one for binary rules. 
-        Ensure the “rhs” has a length of one or two. If the length of “rhs”
-        for a production is equal to one, append it as the key with it’s 
-        associated “lhs” symbol as the value in the dictionary self.unary. 
-        If the length of “rhs” for a production is equal to two, append it as 
-        the key with its “lhs” symbol as the value in the dictionary 
-        self.binary.
-
-        :type productions: nltk.grammar.Production
-        :param productions: A binary or unary CFG rule
-        :return: none        
-               
-        '''
-        
-        self.unary=defaultdict(list)
-        self.binary=defaultdict(list)
-        for production in productions:
-            rhs=production.rhs()
-            lhs=production.lhs()
-            assert(len(rhs)>0 and len(rhs)<=2)
-            if len(rhs)==1:
-                self.unary[rhs[0]].append(lhs)
-            else:
-                self.binary[rhs].append(lhs)
-
-    def recognise(self,tokens,verbose=False):
-        '''Postcondition: A matrix has been initialized and filled using the
-        CKY algorithm. 
-        
-        How: Define "words" as the list of tokens in the input string. Define 
-        "n" as the number of tokens plus 1. Initialize an empty matrix and 
-        iteratively add n-1 rows and n columns. Call unaryFill() to fill the
-        cells with all possible unary productions. Call binaryScan() to fill
-        the cells with all possible binary productions. Return whether or not 
-        the starting symbol (the first listed rule in the grammar) is in the
-        matrix, indicating that the input string can be parsed according to 
-        the grammar.
-        
-        :type tokens: list(str)
-        :param tokens: The list of tokens (as strings) used to build the 
-            matrix.
-        :type verbose: bool
-        :param verbose: show debugging output if True, defaults to False
-        :rtype: bool
-        :return: True if the CKY recognizer recognizes some valid parse for 
-            the input string, otherwise False
-
-        '''
-        
-        self.verbose=verbose
-        self.words = tokens
-        self.n = len(self.words)+1
-        self.matrix = []
-        # We index by row, then column
-        #  So Y below is 1,2 and Z is 0,3
-        #    1   2   3  ...
-        # 0  .   .   Z
-        # 1      Y   .
-        # 2          .
-        # ...
-        for r in range(self.n-1):
-             # rows
-             row=[]
-             for c in range(self.n):
-                 # columns
-                 if c>r:
-                     # This is one we care about, add a cell
-                     row.append(Cell(r,c,self))
-                 else:
-                     # just a filler
-                     row.append(None)
-             self.matrix.append(row)
-        self.unaryFill()
-        self.binaryScan()
-        # Replace the line below for Q6
-        start_sym_in_matrix = self.grammar.start() in self.matrix[0][self.n-1].labels()
-        if start_sym_in_matrix == True:
-            print('Number of successful analyses: ', len(self.matrix[0][self.n-1].labels()), '\n')
-        else:
-            return False
-
-    def unaryFill(self):
-        ''' Postcondition: The middle cells of the matrix are filled moving 
-        along the diagonal from the top left to the bottom right with words 
-        and corresponding unary non-terminals.
-      
-        How: Iterate over the length of the input string. Add word 
-        corresponding to cell. Add the non-terminal symbol associated with the
-        word to the cell by looking up the word in the self.unary dictionary.
-
-         '''
-         
-        for r in range(self.n-1):
-            cell=self.matrix[r][r+1]
-            word=self.words[r]
-            cell.addLabel(word)
-
-    def binaryScan(self):
-        '''(The heart of the implementation.)
-
-Postcondition: the matrix has been filled with all constituents that
-can be built from the input words and grammar.
-
-How: Starting with constituents of length 2 (because length 1 has been
-done already), proceed across the upper-right diagonals from left to
-right and in increasing order of constituent length. Call maybeBuild
-for each possible choice of (start, mid, end) positions to try to
-build something at those positions.
-
-        '''
-        for span in range(2, self.n):
-            for start in range(self.n-span):
-                end = start + span
-                for mid in range(start+1, end):
-                    self.maybeBuild(start, mid, end)
-
-    def maybeBuild(self, start, mid, end):
-        '''Postcondition: The matrix has been populated with all possible 
-        binary productions
-        
-        How: Set s1 to the nonterminal in cell (start, mid). Set s2 to the 
-        nonterminal in cell (mid, end). If there is a RHS (s1, s2) in the
-        binary dictionary, add the corresponding LHS nonterminal to cell 
-        (start, end). If s is the RHS of a unary rule, call the unaryUpdate() 
-        function to add the corresponding LHS to cell (start, end).
-        
-        :type start: int
-        :param start: the beginning position of the token span in question
-        :type mid: int
-        :param mid: some position in the token span in question between start 
-            and end
-        :type end: int
-        :param end: the final position of the token span in question
-        :return: none
-        
-        '''
-        
-        self.log("%s--%s--%s:",start, mid, end)
-        cell=self.matrix[start][end]
-        for s1 in self.matrix[start][mid].labels():
-            for s2 in self.matrix[mid][end].labels():
-                if (s1,s2) in self.binary:
-                    for s in self.binary[(s1,s2)]:
-                        self.log("%s -> %s %s", s, s1, s2, indent=1)
-                        cell.addLabel(s)
-                        
-
-# helper methods from cky_print
-CKY.pprint=CKY_pprint
-CKY.log=CKY_log
-
-class Cell:
-    '''A cell in a CKY matrix'''
-    def __init__(self,row,column,matrix):
-        self._row=row
-        self._column=column
-        self.matrix=matrix
-        self._labels=[]
-
-    def addLabel(self,label):
-        if label in self._labels:
-            pass
-        else: 
-            self._labels.append(label)
-            self.unaryUpdate(label)
-                
-        
-        
-
-    def labels(self):
-        return self._labels
-
-
-    def unaryUpdate(self,symbol,depth=0,recursive=False):
-        ''' Postcondition: Cells in the matrix containing symbols (either words
-        or non-terminals) that are RHSs of a unary rule are expanded and the
-        corresponding LHS are added to the cell.
-
-        How: Add word (terminal symbol) to cell. If the word is in the 
-        dictionary self.unary, add the corresponding LHS (parent symbol) to 
-        the cell. If the parent symbol is in the dictionary self.unary, add
-        its respective parent symbol to the cell, recursively.
-
-        :type symbol: str OR nltk.grammar.Nonterminal
-        :param symbol: the symbol that will be passed through to find the
-                related unary rule(s)
-        :return: none
-       
-        '''
-        
-        if not recursive:
-            self.log(str(symbol),indent=depth)
-        if symbol in self.matrix.unary:
-            for parent in self.matrix.unary[symbol]:
-                self.matrix.log("%s -> %s",parent,symbol,indent=depth+1)
-                self.addLabel(parent)
-                self.unaryUpdate(parent,depth+1,True)
-
-# helper methods from cky_print
-Cell.__str__=Cell__str__
-Cell.str=Cell_str
-Cell.log=Cell_log
-
-class Label:
-    '''A label for a substring in a CKY chart Cell
-
-    Includes a terminal or non-terminal symbol, possibly other
-    information.  Add more to this docstring when you start using this
-    class'''
-    def __init__(self,symbol,
-                 # Fill in here, if more needed
-                 ):
-        '''Create a label from a symbol and ...
-        :type symbol: a string (for terminals) or an nltk.grammar.Nonterminal
-        :param symbol: a terminal or non-terminal
-        '''
-        self._symbol=symbol
-        # augment as appropriate, with comments
-
-    def __str__(self):
-        return str(self._symbol)
-
-    def __eq__(self,other):
-        '''How to test for equality -- other must be a label,
-        and symbols have to be equal'''
-        assert isinstance(other,Label)
-        return self._symbol==other._symbol
-
-    def symbol(self):
-        return self._symbol
-    # Add more methods as required, with docstring and comments
@@ -6,15 +6,26 @@ Created on Sat Nov  4 12:51:31 2017
 @author: s1680791
 """
 
-import sys,re
+import sys,re,math
 import nltk
 from collections import defaultdict
 import cfg_fix
 from cfg_fix import parse_grammar, CFG
+from nltk.grammar import Nonterminal
 from pprint import pprint
 # The printing and tracing functionality is in a separate file in order
 #  to make this file easier to read
 from cky_print import CKY_pprint, CKY_log, Cell__str__, Cell_str, Cell_log
+# k-best extraction from the forest in a chart is in a separate file too
+from cky_kbest import KBest
+from partial_parse import cover
+from tree_sampler import TreeSampler
+# and so are the grammar transforms: binarising longer rules and
+#  collapsing unary chains
+from binarise import Binarisation, has_long_rules
+from unary_collapse import UnaryCollapse
+# and removing useless rules before any of them
+from grammar_trim import Trimming
 
 class CKY:
     """An implementation of the Cocke-Kasami-Younger (bottom-up) CFG recogniser.
@@ -22,14 +33,24 @@ class CKY:
     Goes beyond strict CKY's insistance on Chomsky Normal Form.
     It allows arbitrary unary productions, not just NT->T
     ones, that is X -> Y with either Y -> A B or Y -> Z .
-    It also allows mixed binary productions, that is NT -> NT T or -> T NT"""
+    It also allows mixed binary productions, that is NT -> NT T or -> T NT
+    Useless productions are trimmed and longer ones binarised when the
+    parser is made, unary chains can be collapsed, and trees are given
+    back in terms of the original grammar. Productions can be added and
+    removed afterwards, without building a new parser.
 
-    def __init__(self,grammar):
+    This is the one parser: plain recognition, tracing, the packed forest
+    and PCFG scoring are modes of parse() (see STRATEGIES), chosen by
+    what the caller wants of the result."""
+
+    def __init__(self,grammar,factor='right',collapse=False,trim=True):
         '''Create an extended CKY processor for a particular grammar
 
         Grammar is an NLTK CFG
-        consisting of unary and binary rules (no empty rules,
-        no more than two symbols on the right-hand side
+        with no empty rules. Rules with more than two symbols on the
+        right-hand side are binarised first (see binarise), and the
+        grammar actually indexed is kept in self.grammar (as it was made:
+        productions() gives the rules as they are now)
 
         (We use "symbol" throughout this code to refer to _either_ a string or
         an nltk.grammar.Nonterminal, that is, the two thinegs we find in
@@ -37,13 +58,44 @@ class CKY:
 
         :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
         :param grammar: A context-free grammar
+        :type factor: str
+        :param factor: 'right' or 'left', how to binarise long rules
+        :type collapse: bool
+        :param collapse: if True, collapse unary chains into compound
+            symbols (see unary_collapse)
+        :type trim: bool
+        :param trim: if True, first remove the rules which can never be
+            part of a parse (see grammar_trim)
         :return: none'''
 
-        self.verbose=False
         assert(isinstance(grammar,CFG))
+        # the rules as given, before any transform, which addProduction
+        #  and removeProduction change
+        self.source=list(grammar.productions())
+        self.factor=factor
+        # what each transform did, so that trees can be put back, or None
+        self.trimming=None
+        self.binarisation=None
+        self.collapse=None
+        if trim:
+            self.trimming=Trimming(grammar)
+            grammar=self.trimming.grammar
+        if has_long_rules(grammar):
+            self.binarisation=Binarisation(grammar,factor)
+            grammar=self.binarisation.grammar
+        if collapse:
+            self.collapse=UnaryCollapse(grammar)
+            grammar=self.collapse.grammar
         self.grammar=grammar
         # split and index the grammar
         self.buildIndices(grammar.productions())
+        # the rules actually indexed
+        self.indexed=set(grammar.productions())
+        # how many times the indices have been changed since they were
+        #  built, so that anything derived from them can tell it is stale
+        self.version=0
+        # grammar-only bounds on outside scores, for pruning and A*
+        self.estimateOutside()
 
     def buildIndices(self,productions):
         ''' Postcondition: The "defaultdict"s (subclasses of dictionaries that
@@ -65,7 +117,9 @@ class CKY:
         associated “lhs” symbol as the value in the dictionary self.unary. 
         If the length of “rhs” for a production is equal to two, append it as 
         the key with its “lhs” symbol as the value in the dictionary 
-        self.binary.
+        self.binary. If the grammar is probabilistic (a PCFG), also record
+        the log probability of every rule in self.logprob, keyed by
+        (lhs, rhs); for a plain CFG every rule scores 0.0.
 
         :type productions: nltk.grammar.Production
         :param productions: A binary or unary CFG rule
@@ -75,42 +129,623 @@ class CKY:
         
         self.unary=defaultdict(list)
         self.binary=defaultdict(list)
+        self.logprob={}
+        self.probabilistic=False
+        # word -> how many rules have it on their right-hand side
+        self.lexicon={}
         for production in productions:
             rhs=production.rhs()
             lhs=production.lhs()
             assert(len(rhs)>0 and len(rhs)<=2)
+            self.countWords(rhs,1)
+            if hasattr(production,'prob'):
+                self.probabilistic=True
+                self.logprob[(lhs,rhs)]=_log2(production.prob())
             if len(rhs)==1:
                 self.unary[rhs[0]].append(lhs)
             else:
                 self.binary[rhs].append(lhs)
+        # Turn the indices into plain dicts, so that a lookup of a missing
+        #  key can never add one: a parse only ever reads them, so one CKY
+        #  object (and one copy of the grammar) can be shared by any number
+        #  of threads, each parsing into its own Chart
+        self.unary=dict(self.unary)
+        self.binary=dict(self.binary)
+
+    def estimateOutside(self):
+        '''Postcondition: self.outsideEstimate maps every non-terminal X to
+        an upper bound on the log probability of any context X can appear
+        in, that is, of the best tree fragment from the start symbol with X
+        as one of its leaves and words as all the others.
+
+        How: First find the best inside score of every symbol over any
+        string at all (0.0 for a word), by applying rules until nothing
+        improves. Then do the same from the top down: the
+        start symbol's context costs nothing, and each child of a rule
+        A -> B C can do no better than A's context plus the rule plus the
+        best inside score of its sibling. Both only depend on the grammar,
+        so they are worked out once, when the parser is made (and brought
+        up to date by addProduction and removeProduction). The bound
+        is used as a cheap outside estimate by the figure of merit for
+        beam pruning.
+        '''
+        # the rules by left-hand side and by the symbols they use, so a
+        #  change to one symbol's estimate only revisits the rules it
+        #  can affect
+        self.byLhs={}
+        self.uses={}
+        for rhs,lhss in self.unary.items():
+            for lhs in lhss:
+                self.noteRule(lhs,(rhs,))
+        for rhs,lhss in self.binary.items():
+            for lhs in lhss:
+                self.noteRule(lhs,rhs)
+        self.insideEstimate={}
+        self.relaxInside([rule for rules in self.byLhs.values()
+                          for rule in rules])
+        self.resetOutside()
+
+    def noteRule(self,lhs,rhs):
+        '''Postcondition: the rule is in byLhs and uses'''
+        rule=(lhs,rhs)
+        self.byLhs[lhs]=self.byLhs.get(lhs,[])+[rule]
+        for sym in set(rhs):
+            if isinstance(sym,Nonterminal):
+                self.uses[sym]=self.uses.get(sym,[])+[rule]
+
+    def forgetRule(self,lhs,rhs):
+        '''Postcondition: the rule is in neither byLhs nor uses'''
+        rule=(lhs,rhs)
+        for index,syms in ((self.byLhs,[lhs]),(self.uses,set(rhs))):
+            for sym in syms:
+                rules=[other for other in index.get(sym,()) if other!=rule]
+                if rules:
+                    index[sym]=rules
+                else:
+                    index.pop(sym,None)
+
+    def relaxInside(self,rules):
+        '''Postcondition: no rule can improve self.insideEstimate, given
+        that only rules, and rules using a symbol whose estimate rises,
+        could have.
+
+        How: Work through a list of rules. If a rule gives its left-hand
+        side a better score than it has, record it and add every rule
+        using that symbol to the list.
+
+        :type rules: list(tuple)
+        :param rules: (lhs, rhs) pairs to try first
+        :rtype: set
+        :return: the symbols whose estimates rose
+        '''
+        best=self.insideEstimate
+        minus_inf=float('-inf')
+        changed=set()
+        todo=list(rules)
+        while todo:
+            lhs,rhs=todo.pop()
+            score=self.logprob.get((lhs,rhs),0.0)
+            for sym in rhs:
+                if isinstance(sym,Nonterminal):
+                    score+=best.get(sym,minus_inf)
+            if score>best.get(lhs,minus_inf):
+                best[lhs]=score
+                changed.add(lhs)
+                todo.extend(self.uses.get(lhs,()))
+        return changed
+
+    def relaxOutside(self,rules):
+        '''Postcondition: no rule can improve self.outsideEstimate, given
+        that only rules, and rules for a symbol whose estimate rises,
+        could have.
+
+        How: As relaxInside, top down: a rule whose left-hand side has an
+        estimate passes a context down to each of its children, and a
+        child whose estimate rises has all its own rules tried.
+
+        :type rules: list(tuple)
+        :param rules: (lhs, rhs) pairs to try first
+        '''
+        inside=self.insideEstimate
+        outside=self.outsideEstimate
+        minus_inf=float('-inf')
+        def bestInside(sym):
+            if isinstance(sym,Nonterminal):
+                return inside.get(sym,minus_inf)
+            return 0.0
+        todo=list(rules)
+        while todo:
+            lhs,rhs=todo.pop()
+            if lhs not in outside:
+                continue
+            lp=self.logprob.get((lhs,rhs),0.0)
+            for i,sym in enumerate(rhs):
+                if not isinstance(sym,Nonterminal):
+                    continue
+                score=outside[lhs]+lp+sum(bestInside(other)
+                                          for j,other in enumerate(rhs)
+                                          if j!=i)
+                if score>outside.get(sym,minus_inf):
+                    outside[sym]=score
+                    todo.extend(self.byLhs.get(sym,()))
+
+    def resetOutside(self):
+        '''Postcondition: self.outsideEstimate has been worked out afresh,
+        from the start symbol down'''
+        start=self.grammar.start()
+        self.outsideEstimate={start:0.0}
+        self.relaxOutside(self.byLhs.get(start,()))
+
+    def productions(self):
+        '''The grammar's rules as they now are, before any transform'''
+        return list(self.source)
+
+    def addProduction(self,production):
+        '''Postcondition: production is part of the grammar, and the
+        indices and estimates are up to date, without rebuilding them.
+
+        How: See updateIndex. Adding a rule can only make scores better,
+        so the estimates are relaxed from where they are, starting with
+        the new rules and the rules using a symbol whose inside estimate
+        rose; nothing else is looked at.
+
+        A parse running in another thread at the same time sees either
+        the old or the new entry for each right-hand side: entries are
+        replaced, never changed in place.
+
+        :type production: nltk.grammar.Production
+        :param production: the rule to add
+        :rtype: bool
+        :return: False if the grammar already had it
+        :raises ValueError: if the grammar has the same rule with another
+            probability
+        '''
+        if production in self.source:
+            return False
+        self.checkChangeable()
+        key=(production.lhs(),production.rhs())
+        for other in self.source:
+            if (other.lhs(),other.rhs())==key:
+                raise ValueError('the grammar already has %s: remove it '
+                                 'first to change its probability'%other)
+        self.source.append(production)
+        added,removed=self.updateIndex(production,True)
+        if removed:
+            self.refreshEstimates(removed,added)
+        else:
+            changed=self.relaxInside(added)
+            rules=list(added)
+            for sym in changed:
+                rules.extend(self.uses.get(sym,()))
+            self.relaxOutside(rules)
+        return True
+
+    def removeProduction(self,production):
+        '''Postcondition: production is no longer part of the grammar, and
+        the indices and estimates are up to date, without rebuilding them.
+
+        How: Removing a rule can make scores worse, so the inside
+        estimates of every symbol which could have been built with it
+        (its left-hand side and everything above that) are forgotten and
+        worked out again from the rest, which cannot have depended on it
+        (see refreshEstimates). A symbol which is left with no estimate
+        has become useless, and only then is the grammar trimmed again
+        (see updateIndex); removing a rule trimming had already removed
+        changes nothing.
+
+        :type production: nltk.grammar.Production
+        :param production: the rule to remove
+        :raises ValueError: if the grammar does not have it, or would have
+            no useful rules left without it
+        '''
+        if production not in self.source:
+            raise ValueError('%s is not in the grammar'%production)
+        self.checkChangeable()
+        self.source.remove(production)
+        key=(production.lhs(),production.rhs())
+        dropped=False
+        if len(production.rhs())<=2:
+            if production in self.indexed:
+                self.unindexProduction(production)
+                self.indexed=self.indexed-set([production])
+                self.version+=1
+                self.refreshEstimates([key],[])
+                dropped=True
+            # every symbol indexed, on either side of a rule, still useful
+            if self.trimming is None or all(
+                    sym in self.insideEstimate and sym in self.outsideEstimate
+                    for index in (self.byLhs,self.uses) for sym in index):
+                return
+        try:
+            added,removed=self.updateIndex(production,False)
+        except ValueError:
+            # trimming left nothing: keep the grammar as it was
+            self.source.append(production)
+            if dropped:
+                self.indexProduction(production)
+                self.indexed=self.indexed|set([production])
+                self.version+=1
+                self.relaxInside([key])
+                self.resetOutside()
+            raise
+        self.refreshEstimates(removed,added)
+
+    def checkChangeable(self):
+        '''Raise ValueError if the grammar cannot be changed in place'''
+        if self.collapse is not None:
+            raise ValueError('a grammar with collapsed unary chains cannot '
+                             'be changed; make a new parser')
+
+    def updateIndex(self,production,adding):
+        '''Postcondition: the unary and binary indices and logprob hold
+        exactly the (trimmed and binarised) rules of self.source.
+
+        How: Work out which indexed rules change. Without trimming, or
+        when a new rule only uses symbols already in the trimmed grammar
+        (so nothing else can become useful), that is just the new rule,
+        binarised if need be. Otherwise trim self.source again and compare
+        with what is indexed. Then add and remove just those rules.
+
+        :rtype: tuple(list, list)
+        :return: the (lhs, rhs) pairs added to and removed from the index
+        '''
+        self.checkChangeable()
+        def useful(sym):
+            # productive and reachable in the trimmed grammar
+            return sym in self.insideEstimate and sym in self.outsideEstimate
+        if adding and (self.trimming is None or (
+                useful(production.lhs()) and
+                all(useful(sym) for sym in production.rhs()
+                    if isinstance(sym,Nonterminal)))):
+            wanted=self.indexed|set(self.binarise([production]))
+        else:
+            rules=self.source
+            if self.trimming is not None:
+                self.trimming=Trimming(CFG(self.grammar.start(),rules))
+                rules=self.trimming.grammar.productions()
+            wanted=set(self.binarise(rules))
+        added=[p for p in wanted if p not in self.indexed]
+        removed=[p for p in self.indexed if p not in wanted]
+        for p in removed:
+            self.unindexProduction(p)
+        for p in added:
+            self.indexProduction(p)
+        self.indexed=wanted
+        self.version+=1
+        return ([(p.lhs(),p.rhs()) for p in added],
+                [(p.lhs(),p.rhs()) for p in removed])
+
+    def binarise(self,productions):
+        '''productions, with any long ones binarised'''
+        res=[]
+        for production in productions:
+            if len(production.rhs())<=2:
+                res.append(production)
+                continue
+            if self.binarisation is None:
+                self.binarisation=Binarisation(
+                    CFG(self.grammar.start(),self.source),self.factor)
+            res.extend(self.binarisation.binariseProduction(production))
+        return res
+
+    def indexProduction(self,production):
+        '''Postcondition: one (unary or binary) rule is in the indices'''
+        lhs=production.lhs()
+        rhs=production.rhs()
+        assert(len(rhs)>0 and len(rhs)<=2)
+        if hasattr(production,'prob'):
+            self.probabilistic=True
+            self.logprob[(lhs,rhs)]=_log2(production.prob())
+        if len(rhs)==1:
+            self.unary[rhs[0]]=self.unary.get(rhs[0],[])+[lhs]
+        else:
+            self.binary[rhs]=self.binary.get(rhs,[])+[lhs]
+        self.countWords(rhs,1)
+        self.noteRule(lhs,rhs)
+
+    def unindexProduction(self,production):
+        '''Postcondition: one (unary or binary) rule is not in the indices'''
+        lhs=production.lhs()
+        rhs=production.rhs()
+        index,key=(self.unary,rhs[0]) if len(rhs)==1 else (self.binary,rhs)
+        lhss=list(index.get(key,()))
+        if lhs in lhss:
+            lhss.remove(lhs)
+        if lhss:
+            index[key]=lhss
+        else:
+            index.pop(key,None)
+        self.logprob.pop((lhs,rhs),None)
+        self.countWords(rhs,-1)
+        self.forgetRule(lhs,rhs)
+
+    def countWords(self,rhs,change):
+        '''Postcondition: the words of rhs have had change added to their
+        counts in self.lexicon, and any left with none are not in it'''
+        for sym in rhs:
+            if not isinstance(sym,Nonterminal):
+                count=self.lexicon.get(sym,0)+change
+                if count>0:
+                    self.lexicon[sym]=count
+                else:
+                    self.lexicon.pop(sym,None)
+
+    def lexicalise(self,tokens,signature=None):
+        '''The words to look up for tokens, and those which are not in the
+        grammar at all
+
+        How: One pass over tokens, looking each up in self.lexicon. A
+        token which is not there is replaced by its signature, if a
+        signature function is given (see unknown_words), and is only
+        unknown if that is not there either.
+
+        :type tokens: list(str)
+        :param tokens: the words to be parsed
+        :type signature: function
+        :param signature: maps an unknown word to the word standing for
+            its class, or None
+        :rtype: tuple(list(str), list(tuple(int, str)))
+        :return: the words to parse (tokens itself if nothing was
+            replaced), and the position and token of each unknown word
+        '''
+        lexicon=self.lexicon
+        unknown=[(i,token) for i,token in enumerate(tokens)
+                 if token not in lexicon]
+        if not unknown or signature is None:
+            return tokens,unknown
+        words=list(tokens)
+        missing=[]
+        for i,token in unknown:
+            words[i]=signature(token)
+            if words[i] not in lexicon:
+                missing.append((i,token))
+        return words,missing
 
-    def parse(self,tokens,verbose=False):
-        '''Postcondition: A matrix has been initialized and filled using the
-        CKY algorithm and a complete parse has been generated. 
+    def refreshEstimates(self,removed,added):
+        '''Postcondition: the estimates are right again after rules were
+        removed (and perhaps others added).
+
+        How: Forget the inside estimate of each removed rule's left-hand
+        side and of every symbol above it, then relax just the rules for
+        those symbols (and the added ones); every other estimate stands.
+        Then work the outside estimates out afresh.
+        '''
+        stale=set()
+        todo=[lhs for lhs,rhs in removed]
+        while todo:
+            sym=todo.pop()
+            if sym in stale:
+                continue
+            stale.add(sym)
+            todo.extend(lhs for lhs,rhs in self.uses.get(sym,()))
+        for sym in stale:
+            self.insideEstimate.pop(sym,None)
+        self.relaxInside([rule for sym in stale
+                          for rule in self.byLhs.get(sym,())]+list(added))
+        self.resetOutside()
+
+    def parse(self,tokens,verbose=False,beam=None,threshold=None,
+              fom=False,allowed=None,required=None,forbidden=None,
+              width=None,signature=None,mode=None,want=None):
+        '''Postcondition: A chart has been initialized and filled using the
+        CKY algorithm, and a ParseResult describing it has been returned.
+        Nothing is printed (apart from the verbose trace, if asked for).
         
-        How: Define "words" as the list of tokens in the input string. Define 
-        "n" as the number of tokens plus 1. Initialize an empty matrix and 
-        iteratively add n-1 rows and n columns. Call unaryFill() to fill the
-        cells with all possible unary productions. Call binaryScan() to fill
-        the cells with all possible binary productions. Return whether or not 
-        the starting symbol (the first listed rule in the grammar) is in the
-        matrix, indicating that the input string can be parsed according to 
-        the grammar.
+        How: First look every token up in the grammar (see lexicalise):
+        if some token is in no rule, no chart can reach the start symbol,
+        so none is made, and the ParseResult just lists the unknown
+        tokens. Otherwise create a new Chart for the tokens, which holds all the state
+        of this one parse (the words, the matrix and the verbose flag), and
+        fill it. The parser itself only holds the grammar and its indices,
+        which are never changed by parsing, so parse() is reentrant and can
+        be called from several threads at once on the same CKY object.
+        Wrap the filled chart in a ParseResult, which records whether the
+        starting symbol (the first listed rule in the grammar) is in the
+        top cell of the chart. Counting and building trees is left to the
+        ParseResult, which only does it when asked.
         
         :type tokens: list(str)
         :param tokens: The list of tokens (as strings) used to build the 
             matrix.
         :type verbose: bool
         :param verbose: show debugging output if True, defaults to False
-        :rtype: bool
-        :return: True if the CKY recognizer recognizes some valid parse for 
-            the input string, otherwise False
+        :type beam: int
+        :param beam: if given, keep only the best beam labels in each cell
+            (see Cell.prune)
+        :type threshold: float
+        :param threshold: if given, drop every label in a cell whose merit
+            is less than threshold times that of the best label
+        :type fom: bool
+        :param fom: if True, rank labels for pruning by their inside score
+            plus the grammar's outside estimate, rather than by inside
+            score alone
+        :type allowed: dict
+        :param allowed: if given, maps (start, end) to the set of
+            non-terminals which may be built over that span; no other
+            non-terminal is added to the cell, and a span not in it is not
+            built at all (see coarse_to_fine)
+        :type required: iter(tuple(int, int))
+        :param required: if given, (start, end) spans of words known to be
+            constituents, such as named entities or chunks: no span
+            crossing one (overlapping it without containing it or being
+            inside it) is built, so every tree has each of them
+        :type forbidden: iter(tuple(int, int))
+        :param forbidden: if given, spans of two or more words known not
+            to be constituents, which are not built either
+        :type width: int
+        :param width: if given, no span of more than width words is built,
+            so filling the chart takes time linear in the number of words;
+            a longer sentence is then not recognised, but the chart still
+            holds its constituents of up to width words
+        :type signature: function
+        :param signature: if given, maps a token the grammar does not have
+            to a word standing for its class, such as
+            unknown_words.signature, to be parsed in its place (trees
+            still have the token itself as their leaf)
+        :type mode: str
+        :param mode: how much of what is found to keep (see STRATEGIES):
+            'recognise', 'first', 'forest' or 'trace' (the forest, with
+            the verbose trace); None to choose by want
+        :type want: str
+        :param want: what will be asked of the result, one of NEEDS, so
+            that the cheapest mode which can answer it is used (see
+            chooseMode); if neither this nor mode is given, the whole
+            forest is kept
+        :rtype: ParseResult
+        :return: the result of the parse, which is true if the CKY
+            recognizer recognizes some valid parse for the input string,
+            otherwise false
 
         '''
         
+        mode=self.chooseMode(mode,want,
+                             beam is not None or threshold is not None)
+        words,unknown=self.lexicalise(tokens,signature)
+        if unknown:
+            return ParseResult(None,tokens,unknown)
+        chart=Chart(self,words,verbose or mode=='trace',beam,threshold,fom,
+                    allowed,required,forbidden,width,mode)
+        chart.fill()
+        return ParseResult(chart,tokens)
+
+    def chooseMode(self,mode=None,want=None,pruning=False):
+        '''The strategy to fill a chart with
+
+        How: An explicit mode is checked and used as it is. Otherwise
+        the first of CHEAPEST which can answer want is used: the fewer
+        back-pointers a chart keeps, the less it costs to fill. Pruning
+        ranks labels by their scores, which need every back-pointer, so
+        it always gets the forest.
+
+        :rtype: str
+        :raises ValueError: for an unknown mode or need, or a mode which
+            cannot be used with pruning
+        '''
+        if mode is not None:
+            if mode not in STRATEGIES:
+                raise ValueError('mode must be one of %s, not %r'%(
+                    ', '.join(STRATEGIES),mode))
+            if pruning and mode not in ('forest','trace'):
+                raise ValueError('pruning needs the whole forest, not the '
+                                 '%r mode'%mode)
+            return mode
+        if want is None:
+            return 'forest'
+        if want not in NEEDS:
+            raise ValueError('want must be one of %s, not %r'%(
+                ', '.join(NEEDS),want))
+        for mode in CHEAPEST:
+            if (answers(mode,want,self.probabilistic) and
+                not (pruning and mode!='forest')):
+                return mode
+
+    def recognise(self,tokens,verbose=False):
+        '''Whether tokens are a sentence of the grammar, found in the
+        cheapest way: with a chart which keeps no back-pointers
+
+        :rtype: bool
+        '''
+        return self.parse(tokens,verbose,want='recognise').recognised
+
+    def parseMany(self,sentences,**options):
+        '''Parse a batch of sentences, one after the other
+
+        :type sentences: iter(list(str))
+        :param sentences: the tokens of each sentence
+        :param options: passed on to parse()
+        :rtype: list(ParseResult)
+        :return: the results, in the same order
+        '''
+        return [self.parse(list(tokens),**options) for tokens in sentences]
+
+    def restoreTree(self,tree):
+        '''A tree from a chart of this parser, as a tree of the grammar it
+        was made with (with no binarisation or compound symbols in it)'''
+        if self.collapse is not None:
+            tree=self.collapse.restore(tree)
+        if self.binarisation is not None:
+            tree=self.binarisation.restore(tree)
+        return tree
+
+def _log2(prob):
+    '''log base 2, as NLTK uses, but with log(0) as minus infinity (NLTK
+    raises an error for a rule with probability zero, which re-estimation
+    can produce)'''
+    if prob<=0.0:
+        return float('-inf')
+    return math.log(prob,2)
+
+class Chart:
+    '''The state of a single parse: the words, the CKY matrix and the
+    tracing flag.
+
+    A new Chart is made by every call of CKY.parse, so nothing about a
+    sentence is ever stored on the (shared) CKY object itself.'''
+
+    # the strategy filling a chart (see STRATEGIES), if not the forest
+    mode='forest'
+
+    def __init__(self,parser,tokens,verbose=False,beam=None,threshold=None,
+                 fom=False,allowed=None,required=None,forbidden=None,
+                 width=None,mode='forest'):
+        '''Create an empty chart for tokens, with no cell for any span the
+        brackets or the width rule out
+
+        :type parser: CKY
+        :param parser: the parser whose grammar indices are used to fill
+            this chart
+        :type tokens: list(str)
+        :param tokens: the words to be parsed
+        :type verbose: bool
+        :param verbose: show debugging output if True, defaults to False
+        :type beam: int
+        :param beam: the most labels to keep in a cell, or None
+        :type threshold: float
+        :param threshold: the smallest fraction of the best label's merit
+            a label can have and be kept, or None
+        :type fom: bool
+        :param fom: rank by inside score plus outside estimate if True
+        :type allowed: dict
+        :param allowed: (start, end) -> set of the non-terminals allowed
+            over that span, or None to allow everything everywhere
+        :type required: iter(tuple(int, int))
+        :param required: spans no built span may cross, or None
+        :type forbidden: iter(tuple(int, int))
+        :param forbidden: spans not to build, or None
+        :type width: int
+        :param width: the most words a span built may have, or None
+        :type mode: str
+        :param mode: the strategy, which decides the cells' class
+        '''
+        self.parser=parser
+        self.mode=mode
+        cellClass=STRATEGIES[mode][0]
+        self.grammar=parser.grammar
+        self.unary=parser.unary
+        self.binary=parser.binary
         self.verbose=verbose
+        self.beam=beam
+        # thresholds are compared with log probabilities
+        self.threshold=None if threshold is None else _log2(threshold)
+        self.estimate=parser.outsideEstimate if fom else None
+        self.pruning=beam is not None or threshold is not None
+        # the number of labels removed by pruning
+        self.pruned=0
+        self.allowed=allowed
         self.words = tokens
         self.n = len(self.words)+1
+        blocked=self.blockedSpans(required,forbidden)
+        # the widest span to build
+        if width is not None and width<1:
+            raise ValueError('width must be at least 1, not %r'%(width,))
+        self.width=self.n-1 if width is None else min(width,self.n-1)
+        # split points binaryScan tried, and those it passed over because
+        #  a cell was ruled out (by the brackets, the width or allowed)
+        self.splits=0
+        self.skipped=0
+        # symbol -> the spans whose cells have a label for it, kept by the
+        #  cells as labels are added and pruned (see spans)
+        self.occurrences={}
         self.matrix = []
         # We index by row, then column
         #  So Y below is 1,2 and Z is 0,3
@@ -124,21 +759,52 @@ class CKY:
              row=[]
              for c in range(self.n):
                  # columns
-                 if c>r:
+                 if c>r and c-r<=self.width and (r,c) not in blocked:
                      # This is one we care about, add a cell
-                     row.append(Cell(r,c,self))
+                     row.append(cellClass(r,c,self,
+                                     None if allowed is None else
+                                     allowed.get((r,c),_NOTHING)))
                  else:
-                     # just a filler
+                     # just a filler, or a span ruled out by the brackets
                      row.append(None)
              self.matrix.append(row)
+
+    def blockedSpans(self,required,forbidden):
+        '''The spans the brackets rule out: each forbidden span, and every
+        span crossing a required one
+
+        :rtype: set(tuple(int, int))
+        :return: (start, end) of each span which gets no cell
+        :raises ValueError: if a bracket is not a span of the words, or a
+            forbidden one is a single word (which must have a cell)
+        '''
+        last=self.n-1
+        def check(spans,shortest):
+            spans=set(tuple(span) for span in spans or ())
+            for start,end in spans:
+                if not (0<=start and start+shortest<=end<=last):
+                    raise ValueError('(%s, %s) is not a bracket over %d words'
+                                     %(start,end,last))
+            return spans
+        required=check(required,1)
+        blocked=check(forbidden,2)
+        for a,b in required:
+            # starting before a and ending inside it, or starting inside
+            #  it and ending after b
+            for start in range(a):
+                for end in range(a+1,b):
+                    blocked.add((start,end))
+            for start in range(a+1,b):
+                for end in range(b+1,last+1):
+                    blocked.add((start,end))
+        return blocked
+
+    def fill(self):
+        '''Postcondition: the matrix has been filled, first with the words
+        and their unary parents, then with everything that can be built
+        from them by binary rules.'''
         self.unaryFill()
         self.binaryScan()
-        self.firstTree()
-        start_sym_in_matrix = self.grammar.start() in self.matrix[0][self.n-1].labels()
-        if start_sym_in_matrix == True:
-            print('Number of successful analyses: ', len(self.matrix[0][self.n-1].labels()), '\n')
-        else:
-            return False
 
     def unaryFill(self):
         ''' Postcondition: The middle cells of the matrix are filled moving 
@@ -146,8 +812,9 @@ class CKY:
         and corresponding unary non-terminals.
       
         How: Iterate over the length of the input string. Add word 
-        corresponding to cell. Add the non-terminal symbol associated with the
-        word to the cell by looking up the word in the self.unary dictionary.
+        corresponding to cell. Adding it looks the word up in the
+        self.unary dictionary and adds the non-terminal symbols associated
+        with it to the cell as well.
 
          '''
          
@@ -155,6 +822,8 @@ class CKY:
             cell=self.matrix[r][r+1]
             word=self.words[r]
             cell.addLabel(word)
+            if self.pruning:
+                cell.prune()
 
     def binaryScan(self):
         '''(The heart of the implementation.)
@@ -166,202 +835,360 @@ How: Starting with constituents of length 2 (because length 1 has been
 done already), proceed across the upper-right diagonals from left to
 right and in increasing order of constituent length. Call maybeBuild
 for each possible choice of (start, mid, end) positions to try to
-build something at those positions.
+build something at those positions. A span with no cell (see
+blockedSpans) is passed over, and so is every split point where either
+part has none. Spans wider than the chart's width are not visited at
+all.
 
         '''
-        for span in range(2, self.n):
+        matrix=self.matrix
+        for span in range(2, self.width+1):
             for start in range(self.n-span):
                 end = start + span
+                if matrix[start][end] is None or (
+                    self.allowed is not None and
+                    (start,end) not in self.allowed):
+                    # nothing may be built over this span
+                    self.skipped+=span-1
+                    continue
                 for mid in range(start+1, end):
+                    if matrix[start][mid] is None or matrix[mid][end] is None:
+                        self.skipped+=1
+                        continue
+                    self.splits+=1
                     self.maybeBuild(start, mid, end)
-                    
-                    
-                    
-    def firstTree(self):
-        
-         '''Postcondition: A complete parse tree is printed based on the traces 
-             derived from the CKY parser
-        
-        How: Convert the last cell (containing a start symbol 'S') in the matrix to a string.
-            Process and clean the string to extract only the string in bracket form that nltk.tree.Tree.fromstring() 
-            will accept to build a parse tree. Pass the string to the nltk.tree.Tree.fromstring() tool and then,
-            optionally, use the tree.draw() tool from NLTK to draw the parse tree.
-        
+                if self.pruning:
+                    # the cell is complete, so can be pruned before
+                    #  anything bigger is built from it
+                    self.matrix[start][end].prune()
+
+    def goal(self):
+        '''Find the label for the start symbol spanning the whole input
+
+        :rtype: Label or None
+        :return: the Label for grammar.start() in the top cell, or None if
+            the input was not recognised
         '''
-         #isolate the final cell of the CKY matrix as a string
-         lastcell=self.matrix[0][self.n-1]
-         strls = str(Cell.labels(lastcell))
-
-         #extract only the first parse string
-         lift_ps = strls.split('(S, \'', 3)
-         just_ps_with_extra_comma = lift_ps[1]
-         just_ps = just_ps_with_extra_comma[:-2]
-
-         #clean up the parse string of excess punctuation and ensure it has the correct number of parentheses
-         clean_ps = just_ps.replace("'",'').replace('"','').replace(',','').replace('\\','')
-
-         openbrac = 0
-         closedbrac = 0
-         for letter in clean_ps:
-             if letter == '(':
-                 openbrac += 1
-             if letter == ')':
-                 closedbrac += 1
-
-         cleanlist = clean_ps.split()
-         while closedbrac > openbrac:
-             openbrac += 1
-             cleanlist.insert(0,'(')
-    
-         while openbrac > closedbrac:
-             closedbrac += 1
-             cleanlist.insert(-1,')')
-         final_clean_ps = ''.join(cleanlist)
-
-         #print out the derived parse
-         tree = nltk.tree.Tree.fromstring(final_clean_ps)
-         #To display full parse trees in a separate window, uncomment the line below
-         #tree.draw()
-         print(tree.pprint())
-         return tree
-         
-         
+        if self.n<2 or self.matrix[0][self.n-1] is None:
+            return None
+        return self.matrix[0][self.n-1].label(self.grammar.start())
 
+    def spans(self,symbol):
+        '''Where a symbol was found: the spans with a label for it
 
+        How: Look it up in the chart's inverted index, which the cells
+        keep up to date as they fill, so this costs nothing like a scan
+        of the matrix. A name (a str) is taken as the non-terminal of that
+        name if the chart has one, and as a word otherwise.
+
+        :type symbol: nltk.grammar.Nonterminal or str
+        :param symbol: a non-terminal, a word, or a non-terminal's name
+        :rtype: list(tuple(int, int))
+        :return: the (start, end) spans, in order of start and then end
+        '''
+        found=None
+        if isinstance(symbol,str):
+            found=self.occurrences.get(Nonterminal(symbol))
+        if found is None:
+            found=self.occurrences.get(symbol,())
+        return sorted(found)
+
+    def symbols(self):
+        '''Every symbol with a label somewhere in the chart'''
+        return [symbol for symbol,spans in self.occurrences.items() if spans]
+
+    def labelsOver(self,start,end):
+        '''The symbols with a label over a span, in the order they were
+        added (none for a span with no cell)
+
+        :rtype: list(nltk.grammar.Nonterminal or str)
+        '''
+        if not 0<=start<end<self.n:
+            raise ValueError('(%s, %s) is not a span of %d words'%(
+                start,end,self.n-1))
+        cell=self.matrix[start][end]
+        if cell is None:
+            return []
+        return [label.symbol() for label in cell.labels()]
+
+    def firstTree(self):
+        '''Postcondition: A complete parse tree has been built from the
+        back-pointers in the chart and returned. Nothing is printed.
+
+        How: Find the Label for the start symbol in the last cell of the
+        matrix and follow its first back-pointer (and the first back-pointer
+        of each of its children, and so on) down to the words.
+        To display full parse trees in a separate window, call draw() on
+        the result.
+
+        :rtype: nltk.tree.Tree or None
+        :return: the first parse tree, or None if there is none
+        '''
+        goal=self.goal()
+        if goal is None:
+            return None
+        return self.parser.restoreTree(next(goal.trees()))
 
     def maybeBuild(self, start, mid, end):
-        '''Postcondition: The matrix has been populated with all possible 
-        binary productions and a sub-tree and a Label.tracetup instance have been generated
-        
-        How: Set s1 to the Label.tracetup in cell (start, mid). Set s2 to the 
-        Label.tracetup in cell (mid, end). If there is a RHS (s1[0], s2[0]) in the
-        binary dictionary, add the corresponding LHS nonterminal to cell 
-        (start, end). If s is the RHS of a unary rule, call the unaryUpdate() 
-        function to add the corresponding LHS to cell (start, end).
-        Generate a new sub-tree 'parse_string_bin' and combine it with the RHS non-terminal 's' to
-        create a new Label.tracetup instance 'newLabel'.
-        
+        '''Postcondition: The cell (start, end) contains a Label for every
+        non-terminal that can be built by a binary rule from a label in
+        cell (start, mid) and a label in cell (mid, end), each recording
+        (start, mid) and (mid, end) labels as one of its back-pointers.
+
+        How: For every s1 in cell (start, mid) and s2 in cell (mid, end),
+        if there is a RHS (s1, s2) in the binary dictionary, add each
+        corresponding LHS non-terminal to cell (start, end) with (s1, s2)
+        as its children. Adding a label which is new to the cell also adds
+        all its unary parents (see Cell.unaryUpdate).
+
         :type start: int
         :param start: the beginning position of the token span in question
         :type mid: int
-        :param mid: some position in the token span in question between start 
+        :param mid: some position in the token span in question between start
             and end
         :type end: int
         :param end: the final position of the token span in question
         :return: none
-        
+
         '''
-        
+
         self.log("%s--%s--%s:",start, mid, end)
         cell=self.matrix[start][end]
         for s1 in self.matrix[start][mid].labels():
             for s2 in self.matrix[mid][end].labels():
-                if (s1[0],s2[0]) in self.binary:
-                    for s in self.binary[(s1[0],s2[0])]:
+                rhs=(s1.symbol(),s2.symbol())
+                if rhs in self.binary:
+                    for s in self.binary[rhs]:
                         self.log("%s -> %s %s", s, s1, s2, indent=1)
-                        
-                        #derive sub-tree (in bracket form) for current rule expansion
-                        parse_string_bin = ('(' + str(s) +'(' + str(s1[-1]) + ')(' + str(s2[-1]) + '))')
-                        #create new Label.tracetup object from generated non-terminal and current sub-tree
-                        newLabel = Label.tracetup(s, parse_string_bin)
-                        #pass the Label.tracetup instance 'newLabel' to addLabel() to append the whole tuple to the cell
-                        cell.addLabel(newLabel)
-                        
+                        cell.addLabel(s,(s1,s2))
 
 # helper methods from cky_print
-CKY.pprint=CKY_pprint
-CKY.log=CKY_log
+Chart.pprint=CKY_pprint
+Chart.log=CKY_log
+
+# the allowed non-terminals of a span the chart's allowed dict leaves out
+_NOTHING=frozenset()
 
 class Cell:
     '''A cell in a CKY matrix'''
-    def __init__(self,row,column,matrix):
+    def __init__(self,row,column,matrix,allowed=None):
+        # matrix is the Chart this cell belongs to; allowed is the set of
+        #  non-terminals which may be added, or None for any of them
         self._row=row
         self._column=column
         self.matrix=matrix
+        self._allowed=allowed
         self._labels=[]
+        # the same labels, indexed by their symbol
+        self._index={}
+        # where the chart's inverted index records this cell's labels
+        self._span=(row,column)
 
-    def addLabel(self,label):
-        if label in self._labels:
-            pass
-        else: 
+    def addLabel(self,symbol,children=None,depth=0):
+        '''Postcondition: the cell has exactly one Label for symbol, and if
+        children were given they are one of that label's back-pointers.
+
+        How: Look symbol up in the cell's index. If there is no label for
+        it yet and the chart allows it here, make one, add it and add its
+        unary parents as well (see
+        unaryUpdate). Otherwise just record the new way of building it, so
+        that every analysis is kept but packed into a single label.
+
+        :type symbol: str OR nltk.grammar.Nonterminal
+        :param symbol: the word or non-terminal to add
+        :type children: tuple(Label)
+        :param children: the labels symbol was built from, or None for a word
+        :rtype: Label
+        :return: the label for symbol in this cell, or None if symbol is
+            not allowed in it
+        '''
+        label=self._index.get(symbol)
+        if label is None:
+            if (self._allowed is not None and
+                isinstance(symbol,Nonterminal) and
+                symbol not in self._allowed):
+                return None
+            label=Label(symbol)
+            self._index[symbol]=label
             self._labels.append(label)
-            self.unaryUpdate(label)
-        
+            # noteSymbol, inline: this is the hot path
+            spans=self.matrix.occurrences.get(symbol)
+            if spans is None:
+                spans=self.matrix.occurrences[symbol]={}
+            spans[self._span]=None
+            if children is not None:
+                label.addBackpointer(children)
+            self.unaryUpdate(label,depth)
+        elif children is not None:
+            label.addBackpointer(children)
+        return label
+
+    def insertLabel(self,label):
+        '''Postcondition: label is in the cell, as it is, in place of any
+        label for its symbol; unlike addLabel, no unary parents are added
+        (an agenda-based parser adds those itself, see astar)'''
+        old=self._index.get(label.symbol())
+        if old is not None:
+            self._labels.remove(old)
+        else:
+            self.noteSymbol(label.symbol())
+        self._index[label.symbol()]=label
+        self._labels.append(label)
+
+    def noteSymbol(self,symbol):
+        '''Postcondition: the chart's inverted index has this cell's span
+        for symbol (see Chart.spans)'''
+        occurrences=self.matrix.occurrences
+        spans=occurrences.get(symbol)
+        if spans is None:
+            # a dict, as an ordered set
+            spans=occurrences[symbol]={}
+        spans[self._span]=None
 
     def labels(self):
         return self._labels
 
+    def label(self,symbol):
+        '''The Label for symbol in this cell, or None'''
+        return self._index.get(symbol)
+
+    def prune(self):
+        '''Postcondition: only the labels within the chart's beam and
+        threshold are left in the cell (words are always kept).
 
-    def unaryUpdate(self,symbol,depth=0,recursive=False):
-        ''' Postcondition: Cells in the matrix containing either words
-        or Label.tracetup instances that are RHSs of a unary rule are expanded and the
-        corresponding LHS are added to the cell.
+        How: Score each non-terminal label by its best inside log
+        probability, plus the grammar's outside estimate for its symbol if
+        the chart uses the figure of merit. Drop labels scoring less than
+        the best plus the (log) threshold, then all but the best beam of
+        what is left. Ties keep the order labels were added in. A dropped
+        label is just taken out of the cell, so nothing bigger is built
+        from it, but a kept unary parent still keeps it as a child.
+        '''
+        chart=self.matrix
+        if chart.threshold is None and len(self._labels)<=chart.beam:
+            # nothing can be dropped, so don't spend time scoring
+            return
+        logprob=chart.parser.logprob
+        estimate=chart.estimate
+        scored=[]
+        for i,label in enumerate(self._labels):
+            if not label.backpointers():
+                continue
+            merit=label.score(logprob)
+            if estimate is not None:
+                merit+=estimate.get(label.symbol(),float('-inf'))
+            scored.append((merit,i,label))
+        if not scored:
+            return
+        scored.sort(key=lambda entry:(-entry[0],entry[1]))
+        keep=scored
+        if chart.threshold is not None:
+            floor=scored[0][0]+chart.threshold
+            keep=[entry for entry in keep if entry[0]>=floor]
+        if chart.beam is not None:
+            keep=keep[:chart.beam]
+        if len(keep)==len(scored):
+            return
+        dropped=set(id(entry[2]) for entry in scored)-set(
+            id(entry[2]) for entry in keep)
+        chart.pruned+=len(dropped)
+        occurrences=chart.occurrences
+        for merit,i,label in scored:
+            if id(label) in dropped:
+                del occurrences[label.symbol()][self._span]
+        self._labels=[label for label in self._labels
+                      if id(label) not in dropped]
+        self._index=dict((label.symbol(),label) for label in self._labels)
+
+    def unaryUpdate(self,label,depth=0,recursive=False):
+        ''' Postcondition: every unary parent of label, and every unary
+        parent of those, and so on, is in the cell with a back-pointer to
+        the label it was built from.
 
-        How: Add word (terminal symbol) to cell. If the word is in the 
-        dictionary self.unary, add the corresponding LHS (parent symbol) as a Label.tracetup instance to 
-        the cell. If the parent symbol is in the dictionary self.unary, add
-        its respective parent symbol and Label.tracetup instance to the cell, recursively.
+        How: Look up the label's symbol (a word or a non-terminal) in the
+        dictionary self.unary, and add each corresponding LHS (parent
+        symbol) to the cell with label as its only child. Adding a parent
+        which is new to the cell calls unaryUpdate on it in turn, so the
+        whole unary chain is added, recursively.
 
-        :type symbol: str OR Label.tracetup
-        :param symbol: the word or Label.tracetup that will be passed through to find the
-                related unary rule(s)
+        :type label: Label
+        :param label: the label whose unary parents are to be added
         :return: none
-       
+
         '''
         if not recursive:
-            self.log(str(symbol),indent=depth)
-        #this section applied to words (terminal symbols) because the symbol will be passed  to the function in the first stage
-        #of filling in the matrix
+            self.log(str(label),indent=depth)
+        symbol=label.symbol()
         if symbol in self.matrix.unary:
-            parse_string = ('(' + str(self.matrix.unary[symbol]).strip('[').strip(']') + '(' + str(symbol) + '))')
-            for parentsym in self.matrix.unary[symbol]:
-                parent = Label.tracetup(parentsym,parse_string)
-                #maybe come back and address the symbol argument below
+            for parent in self.matrix.unary[symbol]:
                 self.matrix.log("%s -> %s",parent,symbol,indent=depth+1)
-                self.addLabel(parent)
-                #MAYBE CHANGE BELOW TO parent[0]
-                self.unaryUpdate(parent,depth+1,True)
-        #this section deals with non-terminals because now 'symbol' is being pass in as the complex tuple Label.tracetup
-        #so the first element of symbol (symbol[0]) is the actual non-terminal symbol, which is used to generate the parentsym,
-        #which is ONE of the non-terminals in the lhs of the rule. The whole 'symbol' is used to construct the sub-tree at this
-        #stage. The the parentsym and the current sub-tree are used to construct the 'parent' instance of Label.tracetup, which
-        #is passed back into the unaryUpdate method as well as the addLabel method.
-        elif symbol[0] in self.matrix.unary:
-            if ',' in str(self.matrix.unary[symbol[0]]).strip('[').strip(']'):
-                no_comma_in_lhs = str(self.matrix.unary[symbol[0]]).strip('[').strip(']').split(',')
-                for non_term in no_comma_in_lhs:
-                    parse_string = ('(' + str(non_term) + '(' + str(symbol) + '))')
-                    for parentsym in self.matrix.unary[symbol[0]]:
-                        parent = Label.tracetup(parentsym,parse_string)
-                        self.matrix.log("%s -> %s",parent,symbol,indent=depth+1)
-                        self.addLabel(parent)
-                        self.unaryUpdate(parent,depth+1,True)
-            else:
-                parse_string = ('(' + str(self.matrix.unary[symbol[0]]).strip('[').strip(']') + '(' + str(symbol) + '))')
-                for parentsym in self.matrix.unary[symbol[0]]:
-                    parent = Label.tracetup(parentsym,parse_string)
-                    self.matrix.log("%s -> %s",parent,symbol,indent=depth+1)
-                    self.addLabel(parent)
-                    self.unaryUpdate(parent,depth+1,True)
+                self.addLabel(parent,(label,),depth+1)
 
 # helper methods from cky_print
 Cell.__str__=Cell__str__
 Cell.str=Cell_str
 Cell.log=Cell_log
 
+class RecogniserCell(Cell):
+    '''A cell which only recognises: it keeps one Label per symbol, as a
+    Cell does, but no back-pointers, so nothing is spent recording how
+    anything was built'''
+
+    def addLabel(self,symbol,children=None,depth=0):
+        return Cell.addLabel(self,symbol,None,depth)
+
+class FirstTreeCell(Cell):
+    '''A cell which keeps only the first back-pointer of each label:
+    enough for the first tree (the one Chart.firstTree builds) but not
+    for counting or ranking'''
+
+    def addLabel(self,symbol,children=None,depth=0):
+        label=self._index.get(symbol)
+        if label is not None:
+            return label
+        return Cell.addLabel(self,symbol,children,depth)
+
+# what can be asked of a ParseResult (see ParseResult.require)
+NEEDS=('recognise','tree','count','trees','kbest','sample','partial')
+
+# mode -> the class of the chart's cells, and what its results can
+#  answer; the modes differ only in which back-pointers the cells keep
+STRATEGIES={'recognise':(RecogniserCell,frozenset(['recognise'])),
+            'first':(FirstTreeCell,frozenset(['recognise','tree'])),
+            'forest':(Cell,frozenset(NEEDS)),
+            'trace':(Cell,frozenset(NEEDS))}
+
+# the modes CKY.chooseMode picks from, cheapest first
+CHEAPEST=('recognise','first','forest')
+
+def answers(mode,need,probabilistic=False):
+    '''Whether a chart filled in mode can answer need; with a PCFG the
+    first tree is not the best one, so only the forest has that'''
+    if need=='tree' and mode=='first' and probabilistic:
+        return False
+    return need in STRATEGIES[mode][1]
+
 class Label:
     '''A label for a substring in a CKY chart Cell
 
-    Includes a terminal symbol, non-terminal symbol, or tracetup, which is a tuple
-    containing a non-terminal symbol and a trace in the form of a sub-tree.
+    Includes a terminal or non-terminal symbol, and a list of
+    back-pointers, one for each way the symbol was built over this
+    substring. Each back-pointer is a tuple of the child Labels (one for a
+    unary rule, two for a binary rule), so a cell holds one Label per
+    symbol however ambiguous the sentence is, and all of the analyses are
+    packed into a forest which is only unpacked when trees are asked for.
     '''
-    def __init__(self,symbol, trace=None):
-        '''Create a label from a symbol and its child nodes
+    def __init__(self,symbol):
+        '''Create a label from a symbol, with no back-pointers yet
         :type symbol: a string (for terminals) or an nltk.grammar.Nonterminal
         :param symbol: a terminal or non-terminal
         '''
         self._symbol=symbol
-
+        self._backpointers=[]
+        # number of trees under this label, filled in by count()
+        self._count=None
+        # best inside log probability, filled in by score()
+        self._score=None
 
     def __str__(self):
         return str(self._symbol)
@@ -372,19 +1199,270 @@ class Label:
         assert isinstance(other,Label)
         return self._symbol==other._symbol
 
-    def tracetup(symbol, trace):
-        '''Postcondition: A tuple object has been created with prespecified elements. 
-        
-        How: Take two arguments, store as a tuple.
-        
-        :type symbol: str OR nltk.grammar.nonTerminal
-        :param symbol: The highest node in the subtree at some point in parsing
-        :type trace: str
-        :param trace: a string that represents the bracket form of a sub-tree
-        :rtype: tuple(str OR nltk.grammar.nonTerminal, str)
-        :return: a tuple that logs the highest node at some stage in parsing and the most developed sub-tree
+    # Labels are compared by symbol, but each one is a distinct node of
+    #  the forest
+    __hash__=object.__hash__
+
+    def symbol(self):
+        return self._symbol
+
+    def backpointers(self):
+        return self._backpointers
+
+    def addBackpointer(self,children):
+        '''Record one more way of building this label
 
+        :type children: tuple(Label)
+        :param children: the labels of the rule's right-hand side
         '''
-        tracetup = (symbol, trace)
-        
-        return tracetup
\ No newline at end of file
+        self._backpointers.append(children)
+
+    def score(self,logprob):
+        '''The log probability of the best tree under this label
+
+        How: 0.0 for a word; otherwise the best, over the back-pointers,
+        of the rule's log probability plus the children's scores. Cached,
+        so it must only be asked for once the label's cell is complete.
+
+        :type logprob: dict
+        :param logprob: rule log probabilities keyed by (lhs, rhs), as
+            CKY.logprob; rules not in it score 0.0
+        :rtype: float
+        :return: the (base 2) log probability
+        '''
+        if self._score is None:
+            if not self._backpointers:
+                self._score=0.0
+            else:
+                # a unary cycle back to here can never make it better
+                self._score=float('-inf')
+                best=float('-inf')
+                for children in self._backpointers:
+                    rhs=tuple(child.symbol() for child in children)
+                    score=logprob.get((self._symbol,rhs),0.0)
+                    for child in children:
+                        score+=child.score(logprob)
+                    if score>best:
+                        best=score
+                self._score=best
+        return self._score
+
+    def count(self):
+        '''Postcondition: the exact number of distinct trees under this
+        label has been computed and cached on it and on all of its
+        descendants.
+
+        How: A word has just one tree. Otherwise sum, over the
+        back-pointers, the product of the counts of the children. Each
+        label is only counted once, so this is linear in the size of the
+        forest, not in the number of trees.
+
+        :rtype: int
+        :return: the number of trees
+        '''
+        if self._count is None:
+            if not self._backpointers:
+                self._count=1
+            else:
+                # mark as in progress, so a unary cycle fails loudly
+                #  instead of recursing for ever
+                self._count=-1
+                total=0
+                for children in self._backpointers:
+                    product=1
+                    for child in children:
+                        product*=child.count()
+                    total+=product
+                self._count=total
+        elif self._count<0:
+            raise ValueError('unary cycle through %s: '
+                             'infinitely many trees'%self._symbol)
+        return self._count
+
+    def trees(self):
+        '''Generate every tree under this label, one at a time
+
+        How: A word is its own (only) tree. Otherwise, for each
+        back-pointer in turn, generate every combination of the
+        children's trees. Nothing is built until it is asked for.
+
+        :rtype: iter(nltk.tree.Tree or str)
+        :return: the trees, as NLTK Trees (or the word itself)
+        '''
+        if not self._backpointers:
+            yield self._symbol
+            return
+        for children in self._backpointers:
+            for kids in _combinations(children):
+                yield nltk.tree.Tree(str(self._symbol),list(kids))
+
+def _combinations(children):
+    '''Lazily generate every choice of one tree from each of children'''
+    if not children:
+        yield ()
+        return
+    for first in children[0].trees():
+        for rest in _combinations(children[1:]):
+            yield (first,)+rest
+
+class ParseResult:
+    '''The result of CKY.parse for one sentence
+
+    Holds the filled chart and whether the start symbol was found over
+    the whole input. The number of parses and the trees are only worked
+    out when asked for, and nothing is printed unless pprint() is called,
+    so parsing a large batch spends no time on output.
+
+    A ParseResult is true if the sentence was recognised, so it can be
+    tested just like the old boolean result. A sentence with words the
+    grammar does not have gets a result with no chart at all, listing
+    them in unknown.'''
+
+    def __init__(self,chart,tokens=None,unknown=()):
+        '''Create the result for a filled chart
+
+        :type chart: Chart
+        :param chart: a chart on which fill() has been called, or None if
+            the sentence was rejected before parsing
+        :type tokens: list(str)
+        :param tokens: the sentence, if the chart was filled with other
+            words standing for some of them, or it has no chart
+        :type unknown: list(tuple(int, str))
+        :param unknown: the position and token of each word which
+            stopped the sentence being parsed
+        '''
+        self.chart=chart
+        self.tokens=chart.words if tokens is None else tokens
+        self.unknown=list(unknown)
+        self._goal=None if chart is None else chart.goal()
+        self.recognised=self._goal is not None
+        # made the first time a best tree is asked for
+        self._kbest=None
+
+    def __bool__(self):
+        return self.recognised
+
+    def __repr__(self):
+        return '<ParseResult %s: %s>'%(' '.join(self.tokens),
+                                       self.recognised)
+
+    def goal(self):
+        '''The Label for the start symbol over the whole input, or None'''
+        return self._goal
+
+    def answers(self,need):
+        '''Whether the chart kept enough to answer need (one of NEEDS)'''
+        if self.chart is None:
+            return True
+        return answers(self.chart.mode,need,
+                       getattr(self.chart.parser,'probabilistic',False))
+
+    def require(self,need):
+        ''':raises ValueError: if the chart's mode cannot answer need'''
+        if not self.answers(need):
+            raise ValueError('a chart filled in the %r mode cannot answer '
+                             '%r: parse with want=%r'%(self.chart.mode,
+                                                       need,need))
+
+    def count(self):
+        '''The exact number of successful analyses (0 if not recognised)'''
+        self.require('count')
+        if not self.recognised:
+            return 0
+        return self._goal.count()
+
+    def bestTree(self):
+        '''The best parse tree, only built when this is called
+
+        With a PCFG this is the most probable tree; otherwise it is the
+        first tree, as built by Chart.firstTree.
+
+        :rtype: nltk.tree.Tree or None
+        :return: a tree, or None if the sentence was not recognised
+        '''
+        best=self.kBest(1)
+        if not best:
+            return None
+        return best[0][0]
+
+    def kBest(self,k):
+        '''The k best parse trees, with their scores
+
+        Derivations are enumerated lazily from the back-pointers (see
+        cky_kbest), so only the trees returned are ever built. With a
+        PCFG they are ranked by log probability, otherwise every score is
+        0.0 and they come in a fixed order.
+
+        :type k: int
+        :param k: how many trees are wanted
+        :rtype: list(tuple(nltk.tree.Tree, float))
+        :return: up to k (tree, score) pairs, best first
+        '''
+        self.require('tree' if k==1 else 'kbest')
+        if not self.recognised:
+            return []
+        if self._kbest is None:
+            self._kbest=KBest(self.chart)
+        return [(self.restoreTree(tree),score)
+                for tree,score in self._kbest.best(self._goal,k)]
+
+    def trees(self):
+        '''Lazily generate every parse tree, one at a time
+
+        :rtype: iter(nltk.tree.Tree)
+        :return: the trees (none if the sentence was not recognised)
+        '''
+        self.require('trees')
+        if not self.recognised:
+            return iter(())
+        return (self.restoreTree(tree) for tree in self._goal.trees())
+
+    def sampler(self,proportional=False,seed=None):
+        '''A TreeSampler drawing trees at random from the chart, all
+        equally likely or, if proportional, in proportion to their PCFG
+        probability (see tree_sampler)
+
+        :raises ValueError: if the sentence was not recognised
+        '''
+        self.require('sample')
+        return TreeSampler(self,proportional,seed)
+
+    def partial(self):
+        '''The fewest constituents from the chart which cover the
+        sentence, for when it was not recognised (see partial_parse)
+
+        :rtype: partial_parse.PartialParse or None
+        :return: the pieces, or None if the sentence has no chart
+        '''
+        self.require('partial')
+        return cover(self)
+
+    def restoreTree(self,tree):
+        '''A tree from the chart, as a tree of the grammar the parser was
+        made with, over the sentence as it was given'''
+        tree=self.chart.parser.restoreTree(tree)
+        if self.tokens is not self.chart.words:
+            leaves=iter(self.tokens)
+            def relabel(t):
+                if not isinstance(t,nltk.tree.Tree):
+                    return next(leaves)
+                return nltk.tree.Tree(t.label(),[relabel(child)
+                                                 for child in t])
+            tree=relabel(tree)
+        return tree
+
+    def pprint(self):
+        '''Print the number of analyses and the first tree, if any (as
+        much of that as the chart's mode kept)'''
+        if self.recognised:
+            if self.answers('count'):
+                print('Number of successful analyses: ', self.count(), '\n')
+            else:
+                print('Recognised\n')
+            if self.answers('tree'):
+                self.bestTree().pprint()
+        elif self.unknown:
+            print('Not in the grammar:',
+                  ' '.join(token for i,token in self.unknown),'\n')
+        else:
+            print('No successful analyses\n')
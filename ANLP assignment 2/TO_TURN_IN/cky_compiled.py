@@ -0,0 +1,224 @@
+'''CKY with binary rule matching compiled for one grammar
+
+Chart.maybeBuild tries every pair of labels from the two cells it
+combines, making a tuple of their symbols and looking it up in the
+parser's binary index, although most pairs are not the right-hand side
+of any rule. Which symbols a label can combine with on its right is
+known as soon as the grammar is: this module writes Python source with
+one function per left symbol, which looks up just those symbols in the
+right cell and adds the left-hand sides of their rules, all of them
+inlined as constants, and execs it. For example, for grammar2's NP
+
+    def _left_12(cell,s1,right):
+        s2=right(_s7)
+        if s2 is not None:
+            children=(s1,s2)
+            cell.addLabel(_s3,children)
+        ...
+
+The charts are the same as CKY's (the same Cells and Labels, with the
+same pruning and allowed spans); only the order labels are added to a
+cell can differ, so trees may come out in another order.
+
+How much this saves is small. The generated code still dispatches on
+each left label (a dict look-up keyed by NLTK Nonterminals, whose hash
+is a Python method) and probes the right cell once per possible partner,
+so it does about as many look-ups as the generic all-pairs loop when
+cells are small. On grammar2, matching is only a minor share of the
+time anyway: adding labels and their unary parents takes most of it. So
+a whole pass over prune_eval's sentences is only some 5-7% faster, and
+single sentences vary more than that from run to run (the compiled
+engine is sometimes the slower one on the longest). It is kept as a base
+for grammars with larger cells, where probing only the partners a label
+can have saves more.
+
+To compare with the generic engine on prune_eval's sentences (checking
+both give the same analyses):
+
+    python cky_compiled.py
+'''
+import time
+from cky_5 import CKY, Chart, ParseResult
+
+class CompiledCKY:
+    '''A CKY parser whose binary rules are matched by generated code
+
+    Shares a CKY parser's indices. The code is generated again, when
+    the next sentence is parsed, if the parser's grammar is changed with
+    addProduction or removeProduction.'''
+
+    def __init__(self,grammar):
+        '''Create a parser, and compile the code for its grammar
+
+        :type grammar: CKY or nltk.grammar.CFG
+        :param grammar: a CKY parser, whose indices are shared rather
+            than rebuilt, or a grammar to build one for
+        '''
+        if isinstance(grammar,CKY):
+            self.parser=grammar
+        else:
+            self.parser=CKY(grammar)
+        self.grammar=self.parser.grammar
+        self.compile()
+
+    def compile(self):
+        '''Postcondition: self.dispatch maps every symbol which is the
+        first child of some binary rule to a function adding everything
+        it builds, and self.source is the code they were compiled from.
+
+        How: See generate. self.seconds is how long it took.
+        '''
+        started=time.time()
+        self.version=self.parser.version
+        self.source,constants=generate(self.parser.binary)
+        namespace=dict(constants)
+        exec(compile(self.source,'<cky_compiled>','exec'),namespace)
+        self.dispatch=namespace['DISPATCH']
+        self.seconds=time.time()-started
+
+    def parse(self,tokens,verbose=False,beam=None,threshold=None,
+              fom=False,allowed=None,required=None,forbidden=None,
+              width=None,signature=None,mode=None,want=None):
+        '''Postcondition: a CompiledChart has been filled for tokens and a
+        ParseResult for it has been returned; see CKY.parse for the
+        arguments. With verbose, rules are matched by the generic code,
+        which traces them.
+
+        :rtype: cky_5.ParseResult
+        :return: the result of the parse
+        '''
+        if self.version!=self.parser.version:
+            self.compile()
+        mode=self.parser.chooseMode(mode,want,
+                                    beam is not None or threshold is not None)
+        words,unknown=self.parser.lexicalise(tokens,signature)
+        if unknown:
+            return ParseResult(None,tokens,unknown)
+        chart=CompiledChart(self.parser,words,verbose or mode=='trace',beam,
+                            threshold,fom,allowed,required,forbidden,width,
+                            self.dispatch,mode)
+        chart.fill()
+        return ParseResult(chart,tokens)
+
+class CompiledChart(Chart):
+    '''A chart whose binary rules are matched by a CompiledCKY's code'''
+
+    def __init__(self,parser,tokens,verbose,beam,threshold,fom,allowed,
+                 required,forbidden,width,dispatch,mode='forest'):
+        Chart.__init__(self,parser,tokens,verbose,beam,threshold,fom,allowed,
+                       required,forbidden,width,mode)
+        self.dispatch=dispatch
+
+    def maybeBuild(self, start, mid, end):
+        '''Postcondition: as Chart.maybeBuild
+
+        How: For every label in cell (start, mid) which begins some binary
+        rule, call its function with the (start, end) cell and a way of
+        looking up labels in cell (mid, end).
+        '''
+        if self.verbose:
+            Chart.maybeBuild(self,start,mid,end)
+            return
+        cell=self.matrix[start][end]
+        right=self.matrix[mid][end].label
+        dispatch=self.dispatch
+        for s1 in self.matrix[start][mid].labels():
+            build=dispatch.get(s1.symbol())
+            if build is not None:
+                build(cell,s1,right)
+
+def generate(binary):
+    '''Python source matching the rules of a binary index
+
+    How: Group the rules by their first child, then by their second.
+    Write one function for each first child, which looks up each second
+    child in the right cell and, if it is there, adds every left-hand
+    side. Symbols are not written out in the source (words can be any
+    string, and non-terminals must be the very objects the rest of the
+    parser uses) but given to it as constants _s0, _s1 and so on.
+
+    :type binary: dict(tuple, list)
+    :param binary: (first, second) -> left-hand sides, as CKY.binary
+    :rtype: tuple(str, dict)
+    :return: the source, which defines DISPATCH (first child ->
+        function), and the constants it needs
+    '''
+    names={}
+    def name(sym):
+        if sym not in names:
+            names[sym]='_s%d'%len(names)
+        return names[sym]
+    by_first={}
+    for (first,second),lhss in binary.items():
+        by_first.setdefault(first,[]).append((second,lhss))
+    lines=['# %d binary right-hand sides, %d first children'%(
+        len(binary),len(by_first))]
+    entries=[]
+    for i,(first,seconds) in enumerate(by_first.items()):
+        function='_left_%d'%i
+        lines.append('def %s(cell,s1,right):'%function)
+        for second,lhss in seconds:
+            lines.append('    s2=right(%s)'%name(second))
+            lines.append('    if s2 is not None:')
+            lines.append('        children=(s1,s2)')
+            for lhs in lhss:
+                lines.append('        cell.addLabel(%s,children)'%name(lhs))
+        entries.append('%s:%s'%(name(first),function))
+    lines.append('DISPATCH={%s}'%','.join(entries))
+    constants=dict((n,sym) for sym,n in names.items())
+    return '\n'.join(lines)+'\n',constants
+
+def same_analyses(a,b):
+    '''Whether two ParseResults have the same trees (in any order), and
+    the same best score'''
+    if a.count()!=b.count():
+        return False
+    if sorted(map(str,a.trees()))!=sorted(map(str,b.trees())):
+        return False
+    goal_a,goal_b=a.goal(),b.goal()
+    if goal_a is None or goal_b is None:
+        return goal_a is goal_b
+    logprob=a.chart.parser.logprob
+    return goal_a.score(logprob)==goal_b.score(logprob)
+
+if __name__=='__main__':
+    from hw2_5 import grammar2, tokenise
+    from prune_eval import SENTENCES
+    from timing import best_time
+    # a difference smaller than this is put down to timing noise
+    NOISE=0.05
+    sentences=[tokenise(s) for s in SENTENCES]
+    generic=CKY(grammar2)
+    started=time.time()
+    compiled=CompiledCKY(generic)
+    took=time.time()-started
+    print('compiled %d lines in %.2fms'%(
+        compiled.source.count('\n'),took*1000))
+    print('%-10s %10s %10s %8s'%('','generic','compiled','same'))
+    g_total=c_total=0.0
+    for s,tokens in zip(SENTENCES,sentences):
+        g_time,g_result=best_time(lambda:generic.parse(tokens))
+        c_time,c_result=best_time(lambda:compiled.parse(tokens))
+        g_total+=g_time
+        c_total+=c_time
+        print('%-10s %10.2f %10.2f %8s'%(
+            '%d words'%len(tokens),g_time*1000,c_time*1000,
+            same_analyses(g_result,c_result)))
+    print('%-10s %10.2f %10.2f'%('total',g_total*1000,c_total*1000))
+    # whole passes, taking turns, for a steadier comparison
+    g_pass,c_pass=None,None
+    for i in range(3):
+        g_time=best_time(lambda:[generic.parse(t) for t in sentences],10)[0]
+        c_time=best_time(lambda:[compiled.parse(t) for t in sentences],10)[0]
+        g_pass=g_time if g_pass is None else min(g_pass,g_time)
+        c_pass=c_time if c_pass is None else min(c_pass,c_time)
+    change=(g_pass-c_pass)/g_pass
+    print('a whole pass: generic %.2fms, compiled %.2fms (%+.1f%%)'%(
+        g_pass*1000,c_pass*1000,-100*change))
+    if abs(change)<NOISE:
+        print('no difference beyond timing noise')
+    elif change>0:
+        print('compiling pays for itself after %.1f passes'%(
+            took/(g_pass-c_pass)))
+    else:
+        print('the compiled engine is slower on these sentences')
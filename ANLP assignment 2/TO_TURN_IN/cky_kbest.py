@@ -0,0 +1,165 @@
+'''k-best tree extraction from a filled CKY chart
+
+The chart is a packed forest: every Label holds back-pointers to the
+child Labels of each way it was built. Rather than unpacking every
+derivation and sorting them, KBest enumerates derivations lazily, best
+first, following Huang and Chiang's (2005) "lazy" algorithm: each label
+keeps the derivations found so far and a priority queue of candidates,
+and the (k+1)th best derivation of a label is only looked for when it is
+asked for. Getting the top k trees then costs little more than k steps
+per label actually visited, and no derivation outside the top k is ever
+built.
+
+With a PCFG derivations are ranked by log probability. With a plain CFG
+every rule scores 0.0, so all derivations tie and the order is the
+deterministic one given by the order of the back-pointers (the first
+tree is the one Chart.firstTree builds).
+'''
+import heapq
+import nltk
+
+class KBest:
+    '''Lazy k-best enumeration over the forest of one chart
+
+    Holds, for every label visited so far, its derivations in order and
+    its queue of candidates. Make one KBest per chart (it is cheap) and
+    ask it for as many trees as wanted; later calls reuse earlier work.'''
+
+    def __init__(self,chart):
+        '''Prepare to enumerate derivations from a filled chart
+
+        :type chart: cky_5.Chart
+        :param chart: a chart on which fill() has been called
+        '''
+        self.chart=chart
+        self.logprob=chart.parser.logprob
+        # label -> list of (score, backpointer index, child ranks),
+        #  best first
+        self._derivs={}
+        # label -> heap of (-score, backpointer index, child ranks)
+        self._cands={}
+        # label -> set of (backpointer index, child ranks) ever queued
+        self._seen={}
+
+    def ruleScore(self,label,children):
+        '''The log probability of the rule building label from children
+        (0.0 for a plain CFG)'''
+        rhs=tuple(child.symbol() for child in children)
+        return self.logprob.get((label.symbol(),rhs),0.0)
+
+    def _start(self,label):
+        '''Postcondition: label has a derivation list, and its queue holds
+        the best derivation of each of its back-pointers.'''
+        derivs=[]
+        self._derivs[label]=derivs
+        backpointers=label.backpointers()
+        if not backpointers:
+            # a word has exactly one derivation, itself
+            derivs.append((0.0,None,()))
+            return
+        cands=[]
+        seen=set()
+        for j,children in enumerate(backpointers):
+            ranks=(0,)*len(children)
+            score=self._score(label,j,ranks)
+            if score is not None:
+                cands.append((-score,j,ranks))
+                seen.add((j,ranks))
+        heapq.heapify(cands)
+        self._cands[label]=cands
+        self._seen[label]=seen
+
+    def _score(self,label,j,ranks):
+        '''The score of using back-pointer j of label with the children
+        at the given ranks, or None if one of them has too few
+        derivations'''
+        children=label.backpointers()[j]
+        score=self.ruleScore(label,children)
+        for child,rank in zip(children,ranks):
+            deriv=self.kth(child,rank)
+            if deriv is None:
+                return None
+            score+=deriv[0]
+        return score
+
+    def _next(self,label,j,ranks):
+        '''Postcondition: the neighbours of derivation (j, ranks) -- the
+        same back-pointer with one child moved one rank down -- are queued'''
+        cands=self._cands[label]
+        seen=self._seen[label]
+        for i in range(len(ranks)):
+            succ=ranks[:i]+(ranks[i]+1,)+ranks[i+1:]
+            if (j,succ) in seen:
+                continue
+            score=self._score(label,j,succ)
+            if score is not None:
+                seen.add((j,succ))
+                heapq.heappush(cands,(-score,j,succ))
+
+    def kth(self,label,k):
+        '''Postcondition: the first k+1 derivations of label (or all of
+        them, if there are fewer) have been found.
+
+        How: Each time the last derivation found is used, queue its
+        neighbours; then move the best candidate from the queue to the
+        list of derivations. Stop as soon as there are k+1.
+
+        :type label: cky_5.Label
+        :param label: the label whose derivation is wanted
+        :type k: int
+        :param k: the rank wanted, counting from 0 for the best
+        :rtype: tuple(float, int, tuple(int)) or None
+        :return: (score, backpointer index, child ranks) for the kth best
+            derivation, or None if label has no more than k derivations
+        '''
+        if label not in self._derivs:
+            self._start(label)
+        derivs=self._derivs[label]
+        while len(derivs)<=k:
+            cands=self._cands.get(label)
+            if cands is None:
+                break
+            if len(derivs)>0:
+                last=derivs[-1]
+                self._next(label,last[1],last[2])
+            if not cands:
+                break
+            negscore,j,ranks=heapq.heappop(cands)
+            derivs.append((-negscore,j,ranks))
+        if k<len(derivs):
+            return derivs[k]
+        return None
+
+    def tree(self,label,k=0):
+        '''Build the kth best tree under label
+
+        :rtype: nltk.tree.Tree or str
+        :return: the tree (or the word itself, for a word), or None if
+            there is no kth tree
+        '''
+        deriv=self.kth(label,k)
+        if deriv is None:
+            return None
+        score,j,ranks=deriv
+        if j is None:
+            return label.symbol()
+        children=label.backpointers()[j]
+        return nltk.tree.Tree(str(label.symbol()),
+                              [self.tree(child,rank)
+                               for child,rank in zip(children,ranks)])
+
+    def best(self,label,k):
+        '''The top k trees under label, with their scores
+
+        :type k: int
+        :param k: how many trees are wanted
+        :rtype: list(tuple(nltk.tree.Tree, float))
+        :return: up to k (tree, score) pairs, best first
+        '''
+        res=[]
+        for rank in range(k):
+            deriv=self.kth(label,rank)
+            if deriv is None:
+                break
+            res.append((self.tree(label,rank),deriv[0]))
+        return res
@@ -0,0 +1,371 @@
+'''Coarse-to-fine CKY parsing with projected grammars
+
+grammar2 has families of closely related non-terminals (NP, NP0 and NP1;
+N2sc, N2mp and N3; VP and its sub-types). A projection maps each
+non-terminal of the fine grammar to a coarse one, merging a family into
+a single symbol. Projecting every rule gives a much smaller coarse
+grammar, whose charts are cheap to fill.
+
+A sentence is parsed with the coarsest grammar first. Only the labels of
+that chart which are part of some complete parse (and, with a PCFG and a
+threshold, whose best complete parse is good enough) survive, and only
+fine symbols which project onto a survivor are allowed into the
+corresponding cell of the next, finer, chart. The last level is the fine
+grammar itself, whose result is returned.
+
+Projections are dicts from fine symbol names to coarse symbol names;
+a symbol not mentioned projects onto itself. Several can be given,
+coarsest first, as long as each is a refinement of the one before.
+
+Every level's CKY binarises its long rules and may collapse its unary
+chains, so its charts have symbols the grammar does not. A binarisation
+intermediate projects onto the intermediate of the projected symbols,
+and is allowed where that survived. A compound stands for its whole
+chain, all over the same span: a coarse compound which survives lets
+through every symbol of its chain, and a fine one is allowed where
+every symbol of its chain is.
+
+To see how much each level builds on grammar2, and check that a grammar
+with long rules gets the same answers as from CKY alone:
+
+    python coarse_to_fine.py
+'''
+import time
+from nltk.grammar import Nonterminal, CFG, Production, ProbabilisticProduction
+import cfg_fix
+from cky_5 import CKY, _log2
+
+# the options of CKY.parse which say what may be parsed at all, so are
+#  given to every level, not just the fine one
+LEXICAL=('signature','required','forbidden','width')
+
+# grammar2's families of non-terminals
+GRAMMAR2_PROJECTION={'NP0':'NP','NP1':'NP',
+                     'N2sc':'N2','N2mp':'N2','N3':'N2',
+                     'VPi':'VP','VPt':'VP','VPdt':'VP','VPo':'VP','VPio':'VP'}
+
+def project_grammar(grammar,projection):
+    '''The coarse grammar given by projecting every rule of grammar
+
+    Rules which become identical are merged; with a PCFG a merged rule
+    keeps the highest of their probabilities (so the coarse grammar is
+    no longer a proper PCFG, but its scores bound the fine ones from
+    above). A unary rule which projects onto X -> X is dropped.
+
+    :type grammar: nltk.grammar.CFG
+    :param grammar: the fine grammar
+    :type projection: dict(str, str)
+    :param projection: fine symbol name -> coarse symbol name
+    :rtype: nltk.grammar.CFG
+    :return: the coarse grammar
+    '''
+    def proj(sym):
+        if isinstance(sym,Nonterminal):
+            return Nonterminal(projection.get(sym.symbol(),sym.symbol()))
+        return sym
+    merged={}
+    order=[]
+    for production in grammar.productions():
+        lhs=proj(production.lhs())
+        rhs=tuple(proj(sym) for sym in production.rhs())
+        if rhs==(lhs,):
+            continue
+        prob=production.prob() if hasattr(production,'prob') else None
+        key=(lhs,rhs)
+        if key not in merged:
+            order.append(key)
+            merged[key]=prob
+        elif prob is not None and prob>merged[key]:
+            merged[key]=prob
+    productions=[Production(lhs,rhs) if merged[(lhs,rhs)] is None else
+                 ProbabilisticProduction(lhs,rhs,prob=merged[(lhs,rhs)])
+                 for lhs,rhs in order]
+    return CFG(proj(grammar.start()),productions)
+
+def survivors(result,threshold=None):
+    '''The labels of a parse which are part of a good enough whole parse
+
+    How: Work out, from the top cell down, the best outside score of
+    every label reachable from the goal (the best score of the rest of a
+    complete parse around it). Unary rules link labels in the same cell,
+    so each cell is relaxed until nothing changes. A label survives if it
+    is reachable and, given a threshold, its inside plus outside score
+    is at least the best parse's score plus the log threshold.
+
+    :type result: cky_5.ParseResult
+    :param result: the coarse parse
+    :type threshold: float
+    :param threshold: the smallest fraction of the best parse's
+        probability a label's best parse may have, or None
+    :rtype: dict
+    :return: (start, end) -> set of surviving symbols
+    '''
+    chart=result.chart
+    goal=result.goal()
+    if goal is None:
+        return {}
+    logprob=chart.parser.logprob
+    floor=None
+    if threshold is not None:
+        floor=goal.score(logprob)+_log2(threshold)
+    outside={goal:0.0}
+    res={}
+    n=chart.n
+    for width in range(n-1,0,-1):
+        for start in range(n-width):
+            end=start+width
+            cell=chart.matrix[start][end]
+            if cell is None:
+                continue
+            changed=True
+            while changed:
+                changed=False
+                for label in cell.labels():
+                    if label not in outside:
+                        continue
+                    for children in label.backpointers():
+                        rhs=tuple(child.symbol() for child in children)
+                        base=(outside[label]+
+                              logprob.get((label.symbol(),rhs),0.0))
+                        scores=[child.score(logprob) for child in children]
+                        for i,child in enumerate(children):
+                            out=base+sum(scores)-scores[i]
+                            if out>outside.get(child,float('-inf')):
+                                outside[child]=out
+                                # a unary child is in this same cell
+                                changed=changed or len(children)==1
+            kept=set()
+            for label in cell.labels():
+                if label not in outside or not label.backpointers():
+                    continue
+                if (floor is None or
+                    outside[label]+label.score(logprob)>=floor):
+                    kept.add(label.symbol())
+            if kept:
+                res[(start,end)]=kept
+    return res
+
+class CoarseToFine:
+    '''A parser which parses with projected grammars before the real one
+
+    Like CKY, it holds nothing about any one sentence, so one object can
+    be shared between threads.'''
+
+    def __init__(self,grammar,projections=(GRAMMAR2_PROJECTION,),
+                 threshold=None,collapse=False):
+        '''Build the coarse grammars and a parser for each level
+
+        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+        :param grammar: the fine grammar
+        :type projections: list(dict(str, str))
+        :param projections: the projection of every level but the last,
+            coarsest first
+        :type threshold: float
+        :param threshold: passed to survivors() for every coarse level
+        :type collapse: bool
+        :param collapse: collapse unary chains at every level (see CKY)
+        '''
+        self.threshold=threshold
+        # (name, parser, symbol -> its symbol one level coarser)
+        self.levels=[]
+        coarser=None
+        for i,projection in enumerate(projections):
+            self.levels.append(('coarse %d'%i,
+                                CKY(project_grammar(grammar,projection),
+                                    collapse=collapse),
+                                _link(grammar,projection,coarser)))
+            coarser=projection
+        self.parser=CKY(grammar,collapse=collapse)
+        self.levels.append(('fine',self.parser,_link(grammar,{},coarser)))
+        for (_,coarse,_),(_,fine,parent_of) in zip(self.levels,
+                                                   self.levels[1:]):
+            _link_intermediates(parent_of,fine,coarse)
+
+    def parse(self,tokens,fallback=True,**options):
+        '''Postcondition: tokens have been parsed at every level, each
+        chart only allowed what survived in the one before.
+
+        How: Parse with the coarsest grammar. Turn its survivors (each
+        compound as its chain) into the symbols allowed at the next level
+        (every symbol which projects onto a survivor of the same span,
+        and every compound whose chain is all allowed), and so on down
+        to the fine
+        grammar. The options in LEXICAL go to every level. A coarse
+        level with words it does not have (a signature the fine parser
+        was given rules for, say) cannot judge the sentence, so the fine
+        grammar parses it alone. If a threshold has pruned away every
+        fine parse and fallback is true, parse again with the fine
+        grammar alone.
+
+        :type tokens: list(str)
+        :param tokens: the words to be parsed
+        :type fallback: bool
+        :param fallback: re-parse exhaustively if pruning loses the parse
+        :param options: passed on to CKY.parse for the fine level, and
+            those in LEXICAL to the coarse ones too
+        :rtype: cky_5.ParseResult
+        :return: the fine level's result, with result.levels set to a
+            list of (level name, seconds, labels allowed or built)
+        '''
+        lexical=dict((key,value) for key,value in options.items()
+                     if key in LEXICAL)
+        timings=[]
+        allowed=None
+        result=None
+        for name,parser,parent_of in self.levels:
+            start=time.time()
+            if allowed is not None:
+                allowed=self.expand(allowed,parent_of,parser)
+            if parser is self.parser:
+                result=parser.parse(tokens,allowed=allowed,**options)
+            else:
+                result=parser.parse(tokens,allowed=allowed,**lexical)
+            took=time.time()-start
+            if parser is self.parser:
+                timings.append((name,took,_size(result)))
+                break
+            if result.unknown:
+                timings.append((name,took,0))
+                start=time.time()
+                result=self.parser.parse(tokens,**options)
+                timings.append(('fine, unpruned',time.time()-start,
+                                _size(result)))
+                break
+            if not result:
+                # the coarse grammar accepts more than the fine one, so
+                #  the fine one cannot succeed either
+                timings.append((name,took,0))
+                result=self.parser.parse(tokens,allowed={},**options)
+                break
+            allowed=survivors(result,self.threshold)
+            timings.append((name,took,sum(len(s) for s in allowed.values())))
+            allowed=_unfold(allowed,parser)
+        if not result and fallback and self.threshold is not None:
+            start=time.time()
+            result=self.parser.parse(tokens,**options)
+            timings.append(('fine, unpruned',time.time()-start,
+                            _size(result)))
+        result.levels=timings
+        return result
+
+    @staticmethod
+    def expand(allowed,parent_of,parser=None):
+        '''The symbols of a level allowed by the survivors of the level
+        before, given the level's map from its symbols to those, and
+        with parser (the level's CKY) its compounds whose chains are
+        allowed'''
+        children={}
+        for fine,coarse in parent_of.items():
+            children.setdefault(coarse,[]).append(fine)
+        chains=()
+        if parser is not None and parser.collapse is not None:
+            chains=parser.collapse.chains.items()
+        res={}
+        for span,symbols in allowed.items():
+            fines=set(fine for coarse in symbols
+                      for fine in children.get(coarse,()))
+            fines.update([compound for compound,chain in chains
+                          if fines.issuperset(chain)])
+            res[span]=fines
+        return res
+
+def _link(grammar,finer,coarser):
+    '''Map each symbol of the level projected by finer to its symbol in
+    the level projected by coarser (None for the first level), checking
+    that finer really is a refinement of coarser'''
+    if coarser is None:
+        return None
+    res={}
+    for fine in _nonterminals(grammar):
+        name=fine.symbol()
+        here=Nonterminal(finer.get(name,name))
+        there=Nonterminal(coarser.get(name,name))
+        if res.setdefault(here,there)!=there:
+            raise ValueError('%s is split between %s and %s by the coarser '
+                             'projection'%(here,res[here],there))
+        res[here]=there
+    return res
+
+def _link_intermediates(parent_of,fine,coarse):
+    '''Postcondition: parent_of also maps each of the fine parser's
+    binarisation intermediates to the coarse parser's intermediate for
+    the same symbols, projected, if it has one'''
+    if fine.binarisation is None or coarse.binarisation is None:
+        return
+    coarser=coarse.binarisation.intermediates
+    for symbols,inter in fine.binarisation.intermediates.items():
+        projected=tuple(parent_of.get(sym,sym) for sym in symbols)
+        if projected in coarser:
+            parent_of[inter]=coarser[projected]
+
+def _unfold(allowed,parser):
+    '''allowed with each of parser's compounds replaced by its chain'''
+    if parser.collapse is None:
+        return allowed
+    chains=parser.collapse.chains
+    res={}
+    for span,symbols in allowed.items():
+        res[span]=set(sym for symbol in symbols
+                      for sym in chains.get(symbol,(symbol,)))
+    return res
+
+def _nonterminals(grammar):
+    res=set([grammar.start()])
+    for production in grammar.productions():
+        res.add(production.lhs())
+        res.update(sym for sym in production.rhs()
+                   if isinstance(sym,Nonterminal))
+    return res
+
+def _size(result):
+    '''The number of non-terminal labels in a result's chart'''
+    chart=result.chart
+    if chart is None:
+        return 0
+    return sum(1 for row in chart.matrix for cell in row if cell is not None
+               for label in cell.labels() if label.backpointers())
+
+if __name__=='__main__':
+    from hw2_5 import grammar2, tokenise
+    parser=CoarseToFine(grammar2)
+    for s in ["John gave a book to Mary.",
+              "John ate salad with mushrooms with a fork.",
+              "John told Mary that he will book a flight today."]:
+        result=parser.parse(tokenise(s))
+        print(s, result.recognised, result.count())
+        for name,seconds,labels in result.levels:
+            print('   %-8s %8.2fms %4d labels'%(name,seconds*1000,labels))
+    # a long rule, binarised at both levels, and unary chains to collapse
+    long_rules=cfg_fix.parse_grammar('''
+S -> NP VP Adv '.' | NP VP '.'
+NP -> PropN | Det N
+VP -> V NP | V NP NP
+PropN -> 'John' | 'Mary'
+Det -> 'a'
+N -> 'book'
+V -> 'gave' | 'saw'
+Adv -> 'today'
+''')
+    projection={'NP':'X','VP':'X'}
+    for collapse in (False,True):
+        plain=CKY(long_rules,collapse=collapse)
+        staged=CoarseToFine(long_rules,[projection],collapse=collapse)
+        for s in ['John gave Mary a book today.','John saw Mary.',
+                  'John saw today.']:
+            tokens=tokenise(s)
+            a,b=plain.parse(tokens),staged.parse(tokens)
+            assert a.recognised==b.recognised and a.count()==b.count(),s
+    print('CoarseToFine agrees with CKY on a grammar with long rules')
+    # unknown words, with signatures the fine parser has rules for
+    from unknown_words import signature, add_signatures
+    parser=CoarseToFine(grammar2)
+    add_signatures(parser.parser)
+    plain=CKY(grammar2)
+    add_signatures(plain)
+    for s in ['Smith gave a sandwich to Mary.','John gave Zorg a qwerty.']:
+        tokens=tokenise(s)
+        a=plain.parse(tokens,signature=signature)
+        b=parser.parse(tokens,signature=signature)
+        assert a.recognised==b.recognised and a.count()==b.count(),s
+        assert b.recognised,s
+    print('and with signatures for unknown words')
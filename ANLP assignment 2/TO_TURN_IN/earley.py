@@ -0,0 +1,354 @@
+'''An Earley parser with the same grammar and result API as CKY
+
+CKY only takes rules with one or two symbols on the right-hand side.
+Earley's algorithm takes rules of any length, so a grammar with long
+rules can be parsed as it is, without binarising it by hand.
+
+For each position i in the input there is a set of dotted items: a
+rule, how much of its right-hand side has been found (the dot), and the
+position it started at. Three steps fill the sets, left to right:
+
+ predictor  an item waiting for a non-terminal B at i adds an item with
+            the dot at the start for every rule B can begin with, found
+            (transitively, through the first symbols of rules) in an
+            index built once from the grammar
+ scanner    an item waiting for the word at i moves its dot over it, into
+            the set for i+1
+ completer  a complete item for A from j to i moves the dot over A in
+            every item of set j waiting for A, found in an index of set
+            j's items by the symbol they wait for
+
+Complete items are recorded as Labels in the same matrix of Cells as
+CKY's, one per symbol and span, with one back-pointer (a tuple of child
+Labels, as long as the rule) per way of building it. So the result is
+the same packed forest, and ParseResult (count, trees, kBest, pprint)
+works on it unchanged.
+
+Earley.parse takes CKY's options which say what may be parsed
+(signature, required, forbidden, width), but not its pruning ones (beam,
+threshold, fom, allowed), which need CKY's scores per cell: it raises
+ValueError for those. parser_for(grammar) gives CKY, which binarises long
+rules itself and takes every option, unless Earley is asked for.
+'''
+import cfg_fix
+from cfg_fix import CFG
+from nltk.grammar import Nonterminal
+from cky_5 import CKY, Chart, Cell, Label, ParseResult, _log2
+
+class Earley:
+    '''An Earley parser for a CFG or PCFG with rules of any length
+
+    Like CKY, it holds only the grammar and its indices, which parsing
+    never changes, so one object can be shared between threads.'''
+
+    # the same choice of mode as CKY's, recognition through it, and the
+    #  same look-up of words (self.lexicon is the set of them)
+    chooseMode=CKY.chooseMode
+    recognise=CKY.recognise
+    lexicalise=CKY.lexicalise
+
+    def __init__(self,grammar):
+        '''Create an Earley parser for a particular grammar
+
+        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+        :param grammar: a context-free grammar with no empty rules
+        '''
+        assert(isinstance(grammar,CFG))
+        self.grammar=grammar
+        self.buildIndices(grammar.productions())
+
+    def buildIndices(self,productions):
+        '''Postcondition: self.rules lists every rule as an (lhs, rhs)
+        pair, and self.predict maps each non-terminal to the numbers of the
+        rules which can start an analysis of it.
+
+        How: First index the rules by their left-hand side. A rule for B
+        whose right-hand side begins with a non-terminal C means that
+        predicting B also predicts C, so close each non-terminal's rules
+        over first symbols, once, here. The predictor then adds all the
+        rules for B in one go, and never has to predict C separately.
+        As in CKY, a PCFG's rule log probabilities go in self.logprob.
+
+        :type productions: list(nltk.grammar.Production)
+        :param productions: the rules of the grammar
+        '''
+        self.rules=[]
+        self.logprob={}
+        self.lexicon=set()
+        self.probabilistic=False
+        by_lhs={}
+        for production in productions:
+            lhs=production.lhs()
+            rhs=production.rhs()
+            assert(len(rhs)>0)
+            self.lexicon.update(sym for sym in rhs
+                                if not isinstance(sym,Nonterminal))
+            if hasattr(production,'prob'):
+                self.probabilistic=True
+                self.logprob[(lhs,rhs)]=_log2(production.prob())
+            by_lhs.setdefault(lhs,[]).append(len(self.rules))
+            self.rules.append((lhs,rhs))
+        self.predict={}
+        for symbol in by_lhs:
+            rules=[]
+            seen=set([symbol])
+            todo=[symbol]
+            while todo:
+                for r in by_lhs.get(todo.pop(),()):
+                    rules.append(r)
+                    first=self.rules[r][1][0]
+                    if isinstance(first,Nonterminal) and first not in seen:
+                        seen.add(first)
+                        todo.append(first)
+            self.predict[symbol]=rules
+        self.longest=max(len(rhs) for lhs,rhs in self.rules)
+
+    def parse(self,tokens,verbose=False,beam=None,threshold=None,
+              fom=False,allowed=None,required=None,forbidden=None,
+              width=None,signature=None,mode=None,want=None):
+        '''Postcondition: an Earley chart has been filled for tokens and a
+        ParseResult describing it has been returned.
+
+        How: As CKY does, look the words up first (see lexicalise), and
+        give a result with no chart if some are not in the grammar.
+        mode and want are checked as CKY checks them (see
+        CKY.chooseMode), so the same calls work on either parser, but the
+        completer needs every complete item, so the chart always keeps
+        the whole forest, which answers any need. A complete item over a
+        span the brackets or the width rule out makes no Label, so no
+        constituent is built there.
+
+        :type tokens: list(str)
+        :param tokens: the words to be parsed
+        :type verbose: bool
+        :param verbose: show debugging output if True, defaults to False
+        :param beam, threshold, fom, allowed: CKY's pruning, which
+            Earley cannot do: only the defaults are accepted
+        :param required, forbidden, width, signature: as for CKY.parse
+        :type mode: str
+        :param mode: as for CKY.parse; 'trace' is the same as verbose
+        :type want: str
+        :param want: as for CKY.parse: what will be asked of the result
+        :rtype: cky_5.ParseResult
+        :return: the result of the parse, true if the start symbol was
+            found over the whole input
+        :raises ValueError: for an unknown mode or want, or any pruning
+        '''
+        pruning=[name for name,value in (('beam',beam),
+                                         ('threshold',threshold),
+                                         ('allowed',allowed))
+                 if value is not None]+(['fom'] if fom else [])
+        if pruning:
+            raise ValueError('Earley does not prune (%s): use CKY'%
+                             ', '.join(pruning))
+        mode=self.chooseMode(mode,want)
+        words,unknown=self.lexicalise(tokens,signature)
+        if unknown:
+            return ParseResult(None,tokens,unknown)
+        chart=EarleyChart(self,words,verbose or mode=='trace',required,
+                          forbidden,width)
+        chart.fill()
+        result=ParseResult(chart,tokens)
+        if want is not None:
+            result.require(want)
+        return result
+
+    def restoreTree(self,tree):
+        '''Trees need no restoring: Earley parses the grammar as it is'''
+        return tree
+
+class Item:
+    '''A dotted rule: rule number, dot position and start position
+
+    links holds one (previous item, child Label) pair for each way the
+    dot got here; the previous item is None when the dot is at 1.'''
+
+    __slots__=('rule','dot','origin','links','_prefixes')
+
+    def __init__(self,rule,dot,origin):
+        self.rule=rule
+        self.dot=dot
+        self.origin=origin
+        self.links=[]
+        self._prefixes=None
+
+    def prefixes(self):
+        '''Every tuple of child Labels found so far for this item
+
+        Only asked of items whose set is complete, so it is cached.'''
+        if self._prefixes is None:
+            if self.dot==0:
+                self._prefixes=[()]
+            else:
+                self._prefixes=[kids+(child,) for prev,child in self.links
+                                for kids in (prev.prefixes() if prev
+                                             else [()])]
+        return self._prefixes
+
+class EarleyChart(Chart):
+    '''The state of a single Earley parse
+
+    Uses the same matrix of Cells as Chart, holding the words and a
+    Label for every complete item, so that it can be printed and read in
+    the same way; the item sets are kept beside it.'''
+
+    def __init__(self,parser,tokens,verbose=False,required=None,
+                 forbidden=None,width=None):
+        self.parser=parser
+        self.grammar=parser.grammar
+        self.verbose=verbose
+        self.words=tokens
+        self.n=len(tokens)+1
+        self.pruned=0
+        # the spans no Label may be built over, as Chart's
+        self.blocked=self.blockedSpans(required,forbidden)
+        if width is not None and width<1:
+            raise ValueError('width must be at least 1, not %r'%(width,))
+        self.width=self.n-1 if width is None else min(width,self.n-1)
+        # the inverted index, as Chart's
+        self.occurrences={}
+        self.matrix=[[Cell(r,c,self) if c>r else None for c in range(self.n)]
+                     for r in range(self.n-1)]
+        # sets[i] maps (rule, dot, origin) to its Item
+        self.sets=[{} for i in range(self.n)]
+        # waiting[i] maps a symbol to the items in set i whose dot is
+        #  before it: the completer's index
+        self.waiting=[{} for i in range(self.n)]
+        # the non-terminals already predicted at each position
+        self.predicted=[set() for i in range(self.n)]
+        # todo[i] holds the new items of set i, and (start, Label) pairs
+        #  for its new complete labels, still to be worked through
+        self.todo=[[] for i in range(self.n)]
+
+    def fill(self):
+        '''Postcondition: every item that can be found has been, and every
+        complete one is a Label in the matrix.
+
+        How: Put the words in the matrix and predict the start symbol at
+        0. Then, for each position in turn, work through its items until
+        none are left: predict for each item waiting for a non-terminal,
+        and complete each new Label against the items waiting for its
+        symbol where it starts. Then scan every item waiting for the next
+        word, which puts the first items into the next set.
+        '''
+        for r in range(self.n-1):
+            self.matrix[r][r+1].insertLabel(Label(self.words[r]))
+        self.predictSymbol(self.grammar.start(),0)
+        rules=self.parser.rules
+        for i in range(self.n):
+            todo=self.todo[i]
+            scans=[]
+            while todo:
+                entry=todo.pop()
+                if isinstance(entry,tuple):
+                    # a new Label and where it starts
+                    self.complete(entry[0],entry[1],i)
+                    continue
+                symbol=rules[entry.rule][1][entry.dot]
+                self.waiting[i].setdefault(symbol,[]).append(entry)
+                if isinstance(symbol,Nonterminal):
+                    self.predictSymbol(symbol,i)
+                elif i<self.n-1 and self.words[i]==symbol:
+                    scans.append(entry)
+            # scan once the set is finished, so that every item scanned
+            #  has all its links
+            for entry in scans:
+                self.advance(entry,self.matrix[i][i+1].labels()[0],i+1)
+
+    def predictSymbol(self,symbol,i):
+        '''Postcondition: set i holds an item with the dot at the start for
+        every rule which can begin an analysis of symbol'''
+        if symbol in self.predicted[i]:
+            return
+        rules=self.parser.rules
+        for r in self.parser.predict.get(symbol,()):
+            self.predicted[i].add(rules[r][0])
+            key=(r,0,i)
+            if key not in self.sets[i]:
+                item=Item(r,0,i)
+                self.sets[i][key]=item
+                self.log("%s: predict %s",i,self.itemString(item))
+                self.todo[i].append(item)
+
+    def complete(self,start,label,i):
+        '''Postcondition: every item waiting for label's symbol at start,
+        where label starts, has moved its dot over label, into set i'''
+        for item in list(self.waiting[start].get(label.symbol(),())):
+            self.advance(item,label,i)
+
+    def advance(self,item,child,end):
+        '''Postcondition: set end holds item with its dot moved over child,
+        with a link recording child; if that completes the rule, its
+        Label over (item.origin, end) has a back-pointer for every way of
+        building it through this link.
+
+        :type item: Item
+        :param item: an item whose next symbol is child's
+        :type child: Label
+        :param child: a word or complete Label, which ends at end
+        :type end: int
+        :param end: the position after child
+        '''
+        key=(item.rule,item.dot+1,item.origin)
+        items=self.sets[end]
+        new=items.get(key)
+        created=new is None
+        if created:
+            new=Item(*key)
+            items[key]=new
+        link=(item if item.dot>0 else None,child)
+        if link in new.links:
+            return
+        new.links.append(link)
+        lhs,rhs=self.parser.rules[new.rule]
+        if new.dot<len(rhs):
+            if created:
+                self.log("%s: %s",end,self.itemString(new))
+                self.todo[end].append(new)
+            return
+        if end-new.origin>self.width or (new.origin,end) in self.blocked:
+            return
+        cell=self.matrix[new.origin][end]
+        label=cell.label(lhs)
+        if label is None:
+            label=Label(lhs)
+            cell.insertLabel(label)
+            self.log("%s: complete %s over %s-%s",end,lhs,new.origin,end)
+            self.todo[end].append((new.origin,label))
+        prefixes=link[0].prefixes() if link[0] else [()]
+        for kids in prefixes:
+            label.addBackpointer(kids+(child,))
+
+    def itemString(self,item):
+        lhs,rhs=self.parser.rules[item.rule]
+        syms=[str(sym) for sym in rhs]
+        syms.insert(item.dot,'.')
+        return '%s -> %s [%s]'%(lhs,' '.join(syms),item.origin)
+
+    def goal(self):
+        if self.n<2:
+            return None
+        return self.matrix[0][self.n-1].label(self.grammar.start())
+
+# the engines parser_for can give
+ENGINES=('cky','earley')
+
+def parser_for(grammar,engine='cky'):
+    '''A parser for grammar: CKY, which binarises any long rules itself
+    and takes every option of parse(), unless Earley is asked for
+    (earley_bench shows it parsing long rules as they are faster, but it
+    cannot prune)
+
+    :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+    :param grammar: a context-free grammar with no empty rules
+    :type engine: str
+    :param engine: one of ENGINES
+    :rtype: CKY or Earley
+    :return: a parser whose parse(tokens) returns a ParseResult
+    '''
+    if engine not in ENGINES:
+        raise ValueError('engine must be one of %s, not %r'%(
+            ', '.join(ENGINES),engine))
+    if engine=='earley':
+        return Earley(grammar)
+    return CKY(grammar)
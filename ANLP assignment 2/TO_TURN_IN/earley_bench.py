@@ -0,0 +1,81 @@
+'''Benchmark the Earley engine against CKY
+
+Two comparisons:
+
+ grammar2   both engines on the same grammar and the prune_eval sentences
+ long(k)    synthetic grammars with rules k symbols long: Earley parses
+            them as they are, CKY binarises them first (see binarise)
+
+For each, report the time taken (the fastest of several runs) and check
+that both engines find the same number of analyses.
+
+Usage:
+    python earley_bench.py [k ...]
+
+The k default to 3, 5 and 8.
+'''
+import sys
+import random
+from nltk.grammar import Nonterminal, Production, CFG
+import cfg_fix
+from cky_5 import CKY
+from earley import Earley
+from timing import best_time
+
+def long_rule_grammar(k):
+    '''A grammar whose clauses are one rule k symbols long
+
+    Each clause is k phrases, and each phrase is a word or a word with
+    a modifier after it, which can attach to the phrase or to the
+    clause, so clauses are ambiguous. Clauses can be conjoined.'''
+    S,C,P,M=(Nonterminal(x) for x in ('S','C','P','M'))
+    productions=[Production(S,[C]),Production(S,[C,'and',S]),
+                 Production(C,[P]*k),Production(C,[P]*(k-1)+[M]),
+                 Production(P,['w']),Production(P,['w',M]),
+                 Production(M,['m'])]
+    return CFG(S,productions)
+
+def generate(grammar,rand):
+    '''One random sentence from grammar; below depth 3, a rule which
+    repeats its left-hand side is only chosen if there is no other, so
+    the sentences stay short'''
+    def expand(sym,depth):
+        if not isinstance(sym,Nonterminal):
+            return [sym]
+        options=grammar.productions(lhs=sym)
+        if depth>3:
+            options=[p for p in options if sym not in p.rhs()] or options
+        production=rand.choice(options)
+        return [word for child in production.rhs()
+                for word in expand(child,depth+1)]
+    return expand(grammar.start(),0)
+
+def parse_all(parser,sentences):
+    '''The parser's results for each of sentences'''
+    return [parser.parse(tokens) for tokens in sentences]
+
+def compare(name,earley,cky,sentences):
+    '''Time both engines and print a line of the report'''
+    e_time,e_results=best_time(lambda:parse_all(earley,sentences))
+    c_time,c_results=best_time(lambda:parse_all(cky,sentences))
+    agree=all(e.count()==c.count() for e,c in zip(e_results,c_results))
+    print('%-12s %6d %10.2f %10.2f %7.2f %6s'%(
+        name,len(sentences),e_time*1000,c_time*1000,
+        e_time/c_time if c_time else 0.0,agree))
+
+if __name__=='__main__':
+    from hw2_5 import grammar2, tokenise
+    from prune_eval import SENTENCES
+    print('%-12s %6s %10s %10s %7s %6s'%(
+        'grammar','sents','Earley ms','CKY ms','ratio','agree'))
+    compare('grammar2',Earley(grammar2),CKY(grammar2),
+            [tokenise(s) for s in SENTENCES])
+    rand=random.Random(0)
+    for k in [int(arg) for arg in sys.argv[1:]] or [3,5,8]:
+        grammar=long_rule_grammar(k)
+        sentences=[generate(grammar,rand) for i in range(20)]
+        for factor in ('right','left'):
+            cky=CKY(grammar,factor)
+            compare('long(%d) %s'%(k,factor[0]),Earley(grammar),cky,
+                    sentences)
+        print('   ',cky.binarisation.report())
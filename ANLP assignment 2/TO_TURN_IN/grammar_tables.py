@@ -0,0 +1,235 @@
+'''Compiled grammar tables: a CFG or PCFG as flat integer-indexed arrays
+
+The CKY class indexes its grammar with dictionaries of symbols, which is
+what recognition wants. Numerical work over a whole corpus (training
+rule probabilities, counting rules) wants the same grammar with every
+symbol and every rule numbered, so that charts and counts can be numpy
+arrays. GrammarTables is that compiled form.
+
+Rules are numbered in the order of grammar.productions(). A rule with
+more than two symbols on its right is binarised first (see binarise),
+and its place taken by its binary rules; it is still written out whole,
+with the probability of the first of them, so the grammar written reads
+back in as the grammar given. Each rule is one of three kinds:
+
+ binary   A -> B C, where B and C are symbols (non-terminals, or terminals
+          such as '.' which appear in binary rules)
+ unary    A -> B, where B is a non-terminal
+ lexical  A -> 'w', where 'w' is a word
+'''
+import numpy as np
+from nltk.grammar import Nonterminal, PCFG
+import cfg_fix
+from binarise import Binarisation, has_long_rules
+
+class GrammarTables:
+    '''A grammar compiled to integer-indexed numpy arrays
+
+    Public attributes (all read-only once built):
+
+     symbols        list of the chart symbols: the non-terminals, then the
+                    terminals which appear in binary rules
+     symbol_index   symbol -> id
+     start          id of the start symbol
+     rules          list of (lhs, rhs) pairs, in rule id order
+     rule_lhs       int array, rule id -> lhs symbol id
+     probs          float array, rule id -> probability
+     bin_rules, bin_lhs, bin_left, bin_right
+                    int arrays of the binary rules: their rule ids and
+                    symbol ids
+     un_rules, un_lhs, un_child
+                    int arrays of the unary (non-terminal to non-terminal)
+                    rules
+     lexicon        word -> (rule ids, lhs ids) arrays of its lexical rules
+     term_symbols   word -> symbol id, for the terminals in binary rules
+     binarisation   the Binarisation of the grammar's long rules, or None
+     written        ids of the rules to write out, each (lhs, rhs) pair as
+                    the grammar has it
+    '''
+
+    def __init__(self,grammar):
+        '''Compile a grammar
+
+        If the grammar is a PCFG its rule probabilities are kept;
+        otherwise every left-hand side's rules start out equally likely.
+
+        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+        :param grammar: a grammar with no empty rules
+        '''
+        self.grammar=grammar
+        self.binarisation=None
+        productions=grammar.productions()
+        if has_long_rules(grammar):
+            self.binarisation=Binarisation(grammar)
+            productions=self.binarisation.grammar.productions()
+        nonterminals=[]
+        seen=set()
+        def note(nt):
+            if nt not in seen:
+                seen.add(nt)
+                nonterminals.append(nt)
+        note(grammar.start())
+        for production in productions:
+            note(production.lhs())
+            for sym in production.rhs():
+                if isinstance(sym,Nonterminal):
+                    note(sym)
+        terminals=[]
+        for production in productions:
+            rhs=production.rhs()
+            if len(rhs)==2:
+                for sym in rhs:
+                    if not isinstance(sym,Nonterminal) and sym not in seen:
+                        seen.add(sym)
+                        terminals.append(sym)
+        self.symbols=nonterminals+terminals
+        self.symbol_index=dict((sym,i) for i,sym in enumerate(self.symbols))
+        self.nonterminal_count=len(nonterminals)
+        self.start=self.symbol_index[grammar.start()]
+        self.term_symbols=dict((t,self.symbol_index[t]) for t in terminals)
+
+        self.rules=[]
+        probs=[]
+        bins=[]
+        uns=[]
+        lexicon={}
+        for rid,production in enumerate(productions):
+            lhs=production.lhs()
+            rhs=production.rhs()
+            assert(len(rhs)>0 and len(rhs)<=2)
+            self.rules.append((lhs,rhs))
+            probs.append(production.prob() if hasattr(production,'prob')
+                         else 0.0)
+            a=self.symbol_index[lhs]
+            if len(rhs)==2:
+                bins.append((rid,a,self.symbol_index[rhs[0]],
+                             self.symbol_index[rhs[1]]))
+            elif isinstance(rhs[0],Nonterminal):
+                uns.append((rid,a,self.symbol_index[rhs[0]]))
+            else:
+                lexicon.setdefault(rhs[0],[]).append((rid,a))
+        self.rule_lhs=np.array([self.symbol_index[lhs]
+                                for lhs,rhs in self.rules],dtype=np.int32)
+        bins=np.array(bins,dtype=np.int32).reshape(-1,4)
+        self.bin_rules,self.bin_lhs,self.bin_left,self.bin_right=bins.T.copy()
+        uns=np.array(uns,dtype=np.int32).reshape(-1,3)
+        self.un_rules,self.un_lhs,self.un_child=uns.T.copy()
+        self.lexicon=dict((word,(np.array([r for r,a in entries],
+                                          dtype=np.int32),
+                                 np.array([a for r,a in entries],
+                                          dtype=np.int32)))
+                          for word,entries in lexicon.items())
+        # rule id -> the long rule it is the first binary rule of
+        self._long={}
+        self.written=list(range(len(self.rules)))
+        if self.binarisation is not None:
+            ids=dict((rule,rid) for rid,rule in enumerate(self.rules))
+            for production in grammar.productions():
+                if len(production.rhs())>2:
+                    top=self.binarisation.binariseProduction(production)[0]
+                    self._long[ids[top.lhs(),top.rhs()]]=(production.lhs(),
+                                                          production.rhs())
+            intermediates=self.binarisation.symbols
+            self.written=[rid for rid,(lhs,rhs) in enumerate(self.rules)
+                          if lhs not in intermediates]
+        if isinstance(grammar,PCFG):
+            self.probs=np.array(probs,dtype=np.float64)
+        else:
+            self.probs=self.normalise(np.ones(len(self.rules)))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def normalise(self,counts):
+        '''Turn per-rule counts into per-rule probabilities
+
+        Each rule's count is divided by the total count of the rules with
+        the same left-hand side. A left-hand side whose rules all have
+        zero count keeps its current probabilities (or is made uniform,
+        before there are any).
+
+        :type counts: numpy.ndarray
+        :param counts: a count for every rule, indexed by rule id
+        :rtype: numpy.ndarray
+        :return: a probability for every rule, indexed by rule id
+        '''
+        totals=np.bincount(self.rule_lhs,weights=counts,
+                           minlength=len(self.symbols))
+        per_rule=totals[self.rule_lhs]
+        probs=np.zeros(len(self.rules))
+        np.divide(counts,per_rule,out=probs,where=per_rule>0)
+        unseen=per_rule<=0
+        if unseen.any():
+            old=getattr(self,'probs',None)
+            if old is None:
+                sizes=np.bincount(self.rule_lhs,minlength=len(self.symbols))
+                probs[unseen]=1.0/sizes[self.rule_lhs[unseen]]
+            else:
+                probs[unseen]=old[unseen]
+        return probs
+
+    def unaryClosure(self,probs=None):
+        '''The reflexive transitive closure of the unary rules
+
+        U[b,a] is the probability of rewriting a as b by one unary rule,
+        so the closure (I-U)^-1 sums every chain of unary rules, of any
+        length, from a down to b. Multiplying a row of inside scores by
+        it on the right adds in everything reachable by unary rules.
+
+        :type probs: numpy.ndarray
+        :param probs: rule probabilities to use, defaults to self.probs
+        :rtype: numpy.ndarray
+        :return: the (symbols x symbols) closure matrix
+        '''
+        if probs is None:
+            probs=self.probs
+        size=len(self.symbols)
+        u=np.zeros((size,size))
+        np.add.at(u,(self.un_child,self.un_lhs),probs[self.un_rules])
+        return np.linalg.inv(np.eye(size)-u)
+
+    def productionString(self,rid,prob=None):
+        '''One rule in the [p] format read by cfg_fix, e.g. A -> B 'c' [0.5]'''
+        lhs,rhs=self._long.get(rid) or self.rules[rid]
+        if prob is None:
+            prob=self.probs[rid]
+        return '%s -> %s [%s]'%(lhs,' '.join(_symbolString(sym)
+                                             for sym in rhs),
+                                _probString(prob))
+
+    def grammarString(self,probs=None):
+        '''The whole grammar in the [p] format read by cfg_fix, one rule
+        per line, start symbol first'''
+        if probs is None:
+            probs=self.probs
+        order=sorted(self.written,
+                     key=lambda rid:(self.rule_lhs[rid]!=self.start,rid))
+        return '\n'.join(self.productionString(rid,probs[rid])
+                         for rid in order)+'\n'
+
+    def write(self,filename,probs=None):
+        '''Write the grammar, in the [p] format, to filename'''
+        with open(filename,'w') as f:
+            f.write(self.grammarString(probs))
+
+    def toPCFG(self,probs=None):
+        '''The grammar with the given (or its own) probabilities, as an
+        NLTK PCFG which CKY can load'''
+        return PCFG.fromstring(self.grammarString(probs))
+
+def _probString(prob):
+    '''A probability written as cfg_fix reads it: digits and a point, no
+    exponent'''
+    res=('%.15f'%prob).rstrip('0')
+    if res.endswith('.'):
+        res+='0'
+    return res
+
+def _symbolString(sym):
+    '''How a symbol is written in a grammar: non-terminals bare, terminals
+    quoted'''
+    if isinstance(sym,Nonterminal):
+        return str(sym)
+    if "'" in sym:
+        return '"%s"'%sym
+    return "'%s'"%sym
@@ -0,0 +1,184 @@
+'''Trimming useless symbols and rules from a grammar before indexing it
+
+A grammar merged from several sources can carry rules which can never
+be part of a parse: rules using a non-terminal which cannot derive any
+string of words (unproductive), and rules for a non-terminal which no
+derivation from the start symbol can reach (unreachable). CKY still
+indexes them and maybeBuild still probes them, and unreachable ones
+still fill cells with labels nothing complete is ever built from.
+
+Trimming removes them, the standard way round: first every rule with an
+unproductive symbol, then every rule for a symbol the rules left cannot
+reach. (The other order can leave useless rules behind.) No parse of
+any sentence uses a removed rule, so results are unchanged; a PCFG's
+probabilities are left as they are, so tree probabilities are too.
+
+It also finds unary cycles (X -> Y, Y -> X, and longer ones). CKY
+parses with them, but a sentence where one applies has infinitely many
+trees, so ParseResult.count() raises an error; it is better to know in
+advance.
+
+CKY trims every grammar it is given (CKY(grammar,trim=False) does not);
+its trimming attribute holds the report. To report on a grammar file,
+or grammar2:
+
+    python grammar_trim.py [grammar.cfg]
+'''
+from nltk.grammar import Nonterminal, CFG
+import cfg_fix
+
+class Trimming:
+    '''A grammar with its useless symbols and rules removed'''
+
+    def __init__(self,grammar):
+        '''Trim grammar
+
+        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+        :param grammar: the grammar
+        '''
+        self.original=grammar
+        productions=grammar.productions()
+        start=grammar.start()
+        # productive: every symbol of some rule's right-hand side is
+        productive=set()
+        changed=True
+        while changed:
+            changed=False
+            for production in productions:
+                lhs=production.lhs()
+                if lhs in productive:
+                    continue
+                if all(not isinstance(sym,Nonterminal) or sym in productive
+                       for sym in production.rhs()):
+                    productive.add(lhs)
+                    changed=True
+        useful=[production for production in productions
+                if production.lhs() in productive and
+                all(not isinstance(sym,Nonterminal) or sym in productive
+                    for sym in production.rhs())]
+        # reachable from start through the rules which are left
+        by_lhs={}
+        for production in useful:
+            by_lhs.setdefault(production.lhs(),[]).append(production)
+        reachable=set([start])
+        todo=[start]
+        while todo:
+            for production in by_lhs.get(todo.pop(),()):
+                for sym in production.rhs():
+                    if isinstance(sym,Nonterminal) and sym not in reachable:
+                        reachable.add(sym)
+                        todo.append(sym)
+        kept=[production for production in useful
+              if production.lhs() in reachable]
+        if not kept:
+            raise ValueError('%s derives no string of words: no rules are '
+                             'left'%start)
+        if len(kept)==len(productions):
+            # nothing to trim: keep the grammar itself (a PCFG stays one)
+            self.grammar=grammar
+        else:
+            self.grammar=CFG(start,kept)
+        symbols=_nonterminals(productions)|set([start])
+        self.unproductive=sorted(symbols-productive,key=str)
+        self.unreachable=sorted((symbols&productive)-reachable,key=str)
+        self.removed=len(productions)-len(kept)
+        self.before=index_size(productions)
+        self.after=index_size(kept)
+        self.cycles=unary_cycles(kept)
+
+    def report(self):
+        '''A summary of what was removed and found, one fact per line'''
+        lines=['%d rules removed; %d unproductive and %d unreachable '
+               'symbols'%(self.removed,len(self.unproductive),
+                          len(self.unreachable))]
+        if self.unproductive:
+            lines.append('  unproductive: '+' '.join(map(str,self.unproductive)))
+        if self.unreachable:
+            lines.append('  unreachable: '+' '.join(map(str,self.unreachable)))
+        lines.append('index before: %d unary keys, %d binary keys, %d rules'%
+                     self.before)
+        lines.append('index after:  %d unary keys, %d binary keys, %d rules'%
+                     self.after)
+        for cycle in self.cycles:
+            lines.append('unary cycle through: '+' '.join(map(str,cycle)))
+        return '\n'.join(lines)
+
+def index_size(productions):
+    '''The size of the CKY indices built from productions: (keys of the
+    unary index, keys of the binary index, rules)'''
+    unary=set()
+    binary=set()
+    for production in productions:
+        rhs=production.rhs()
+        if len(rhs)==1:
+            unary.add(rhs[0])
+        else:
+            binary.add(rhs)
+    return len(unary),len(binary),len(productions)
+
+def unary_cycles(productions):
+    '''The unary cycles of a grammar
+
+    How: Find the strongly connected components of the graph of unary
+    rules (non-terminal to non-terminal), by Tarjan's algorithm. Each
+    component with more than one symbol, or one symbol with a rule to
+    itself, is a set of symbols which can each be rewritten as all the
+    others by unary rules alone.
+
+    :type productions: list(nltk.grammar.Production)
+    :param productions: the rules
+    :rtype: list(list(nltk.grammar.Nonterminal))
+    :return: the symbols of each cycle
+    '''
+    down={}
+    for production in productions:
+        rhs=production.rhs()
+        if len(rhs)==1 and isinstance(rhs[0],Nonterminal):
+            down.setdefault(production.lhs(),[]).append(rhs[0])
+    index={}
+    low={}
+    stack=[]
+    on_stack=set()
+    cycles=[]
+    def visit(sym):
+        index[sym]=low[sym]=len(index)
+        stack.append(sym)
+        on_stack.add(sym)
+        for child in down.get(sym,()):
+            if child not in index:
+                visit(child)
+                low[sym]=min(low[sym],low[child])
+            elif child in on_stack:
+                low[sym]=min(low[sym],index[child])
+        if low[sym]==index[sym]:
+            component=[]
+            while True:
+                other=stack.pop()
+                on_stack.discard(other)
+                component.append(other)
+                if other==sym:
+                    break
+            if len(component)>1 or sym in down.get(sym,()):
+                cycles.append(sorted(component,key=str))
+    for sym in list(down):
+        if sym not in index:
+            visit(sym)
+    return cycles
+
+def _nonterminals(productions):
+    res=set()
+    for production in productions:
+        res.add(production.lhs())
+        res.update(sym for sym in production.rhs()
+                   if isinstance(sym,Nonterminal))
+    return res
+
+if __name__=='__main__':
+    import sys
+    from cfg_fix import parse_grammar
+    if len(sys.argv)>1:
+        with open(sys.argv[1]) as f:
+            grammar=parse_grammar(f.read())
+    else:
+        from hw2_5 import grammar2 as grammar
+    print(Trimming(grammar).report())
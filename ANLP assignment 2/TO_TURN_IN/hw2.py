@@ -2,7 +2,7 @@
 import re
 import cfg_fix
 from cfg_fix import parse_grammar, Tree
-from cky import CKY
+from cky_5 import CKY
 
 def tokenise(tokenstring):
   '''Split a string into a list of tokens
@@ -87,8 +87,8 @@ grammar2=parse_grammar([
 print(grammar) #the simpler grammar
 chart=CKY(grammar)
  #this illustrates tracing of a very simple sentence; feel free to try others.
-chart.recognise(tokenise("the frogs swim"),True)
-chart.pprint()
+result=chart.parse(tokenise("the frogs swim"),mode='trace')
+result.chart.pprint()
 
 #build a chart with the larger grammar
 chart2=CKY(grammar2)
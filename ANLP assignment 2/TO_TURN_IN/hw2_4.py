@@ -2,7 +2,7 @@
 import re
 import cfg_fix
 from cfg_fix import parse_grammar, Tree
-from cky_4 import CKY
+from cky_5 import CKY
 
 def tokenise(tokenstring):
   '''Split a string into a list of tokens
@@ -111,7 +111,9 @@ for s in ["John gave a book to Mary.",
            "Why did John book the flight?",
            "John told Mary that he will book a flight today."]:
     print(s)
-    chart2.recognise(tokenise(s))
+    result=chart2.parse(tokenise(s),want='count')
+    if result:
+        print('Number of successful analyses: ', result.count(), '\n')
 #    chart2.pprint()
 # Task 5
 # for s in [...]:
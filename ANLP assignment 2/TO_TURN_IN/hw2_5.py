@@ -11,6 +11,8 @@ import re
 import cfg_fix
 from cfg_fix import parse_grammar, Tree
 from cky_5 import CKY
+from earley import parser_for
+from token_stream import TOKEN
 
 def tokenise(tokenstring):
   '''Split a string into a list of tokens
@@ -24,16 +26,9 @@ def tokenise(tokenstring):
   :param tokenstring: the string to be tokenised
   :rtype: list(str)
   :return: the tokens found in tokenstring'''
-  return re.findall(
-        # We use three sub-patterns:
-        #   one for words and the first half of possessives
-        #   one for the rest of possessives
-        #   one for punctuation
-        r"[-\w]+|'\w+|[^-\w\s]+",
-        tokenstring,
-        re.U # Use unicode classes, otherwise we would split
-             # "são jaques" into ["s", "ão","jaques"]
-        )
+  # the pattern is compiled once, in token_stream, which also tokenises
+  #  whole files a chunk at a time
+  return TOKEN.findall(tokenstring)
 
 grammar=parse_grammar("""
 S -> NP VP
@@ -95,29 +90,29 @@ grammar2=parse_grammar([
 
 
 #build a chart with the larger grammar
-chart2=CKY(grammar2)
-
-
-
-
-for s in ["John gave a book to Mary.",
-           "John gave Mary a book.",
-           "John gave Mary a nice drawing book.",
-           "John ate salad with mushrooms with a fork.",
-           "Book a flight to NYC.",
-           "Can you book a flight to London?",
-           "Why did John book the flight?",
-           "John told Mary that he will book a flight today."]:
-    print(s, chart2.parse(tokenise(s)))
-    #The line below is unnecessary because the firstTree method uses pprint()
-    #and the parse() method calls firstTree()
-    #print(chart2.firstTree().pprint())
+# CKY, or Earley if the grammar has rules longer than two
+chart2=parser_for(grammar2)
+
+
+
+
+if __name__=='__main__':
+    for s in ["John gave a book to Mary.",
+               "John gave Mary a book.",
+               "John gave Mary a nice drawing book.",
+               "John ate salad with mushrooms with a fork.",
+               "Book a flight to NYC.",
+               "Can you book a flight to London?",
+               "Why did John book the flight?",
+               "John told Mary that he will book a flight today."]:
+        result=chart2.parse(tokenise(s))
+        print(s, result.recognised)
+        #parse() no longer prints anything itself: pprint() prints the number
+        #of analyses and the first tree
+        result.pprint()
   
-    #Uncomment the following to print the extremely large matrices
- #   chart2.pprint()
-     
-
-
-
-
-
+        #Uncomment the following to print the extremely large matrices
+     #   result.chart.pprint()
+        #or just a grid of how many labels each cell has (see chart_dump)
+     #   import chart_dump
+     #   print('\n'.join(chart_dump.summary(result.chart)))
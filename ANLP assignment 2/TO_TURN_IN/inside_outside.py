@@ -0,0 +1,276 @@
+'''Inside-outside (EM) estimation of PCFG rule probabilities from raw text
+
+Given a grammar (grammar2, say) and a file of sentences with no trees,
+re-estimate the probability of every rule: the E-step computes, for each
+sentence, the expected number of times each rule is used in its parses,
+weighted by the current probabilities; the M-step sets each rule's
+probability to its expected count over the total for its left-hand side.
+
+The charts are numpy arrays over the compiled GrammarTables, one
+(starts x symbols) array per span width, so each step of the inside and
+outside passes handles every start position and every rule at once.
+The E-step is spread over a pool of processes, each of which counts a
+share of the sentences.
+
+Usage:
+    python inside_outside.py grammar.cfg corpus.txt out.pcfg [iterations] [processes]
+
+The corpus has one sentence per line and is tokenised with hw2_5.tokenise.
+The output is written in the [p] format that cfg_fix reads, e.g.
+    NP -> Det N2sc [0.25]
+and the grammar read may be in it too (so training can go on from an
+earlier run's output), in which case its probabilities are the start.
+'''
+import re
+import sys
+import multiprocessing
+import numpy as np
+from nltk.grammar import PCFG
+import cfg_fix
+from cfg_fix import parse_grammar
+from grammar_tables import GrammarTables
+
+# a rule's [p] weight (not a quoted word that looks like one)
+_WEIGHT_RE=re.compile(r"(?<!['\"])\[\s*[0-9.]+\s*\](?!['\"])")
+
+def read_grammar(text):
+    '''A grammar's text as a PCFG if its rules have [p] weights, otherwise
+    as a CFG'''
+    if _WEIGHT_RE.search(text):
+        return PCFG.fromstring(text)
+    return parse_grammar(text)
+
+def _onehots(tables):
+    '''(binary rules x symbols) 0/1 matrices picking out the lhs, left
+    child and right child of each binary rule, so that summing rule
+    scores into symbols is a matrix product. Made once per tables.'''
+    onehot=getattr(tables,'_onehots',None)
+    if onehot is None:
+        size=len(tables.symbols)
+        onehot=[]
+        for ids in (tables.bin_lhs,tables.bin_left,tables.bin_right):
+            m=np.zeros((len(ids),size))
+            m[np.arange(len(ids)),ids]=1.0
+            onehot.append(m)
+        tables._onehots=onehot
+    return onehot
+
+def inside(tables,probs,closure,tokens):
+    '''Postcondition: the inside chart for tokens has been computed.
+
+    How: The width-1 cells get the probabilities of the words' lexical
+    rules (and 1.0 for a word which is itself a symbol of a binary rule,
+    such as '.'). Then, for increasing widths, every binary rule is
+    applied at every split point to every start position at once. After
+    each width, the unary closure matrix adds in all unary chains.
+
+    :type tables: GrammarTables
+    :param tables: the compiled grammar
+    :type probs: numpy.ndarray
+    :param probs: the rule probabilities
+    :type closure: numpy.ndarray
+    :param closure: tables.unaryClosure(probs)
+    :type tokens: list(str)
+    :param tokens: the sentence
+    :rtype: list(numpy.ndarray)
+    :return: chart, with chart[w][i] the inside scores (one per symbol)
+        of the span from i to i+w; chart[0] is unused
+    '''
+    n=len(tokens)
+    size=len(tables.symbols)
+    chart=[None]
+    base=np.zeros((n,size))
+    for i,word in enumerate(tokens):
+        if word in tables.lexicon:
+            rids,lhss=tables.lexicon[word]
+            np.add.at(base[i],lhss,probs[rids])
+        if word in tables.term_symbols:
+            base[i,tables.term_symbols[word]]=1.0
+    chart.append(base.dot(closure))
+    bin_p=probs[tables.bin_rules]
+    onehot=_onehots(tables)
+    for w in range(2,n+1):
+        starts=n-w+1
+        acc=np.zeros((starts,bin_p.shape[0]))
+        for k in range(1,w):
+            left=chart[k][:starts]
+            right=chart[w-k][k:k+starts]
+            acc+=left[:,tables.bin_left]*right[:,tables.bin_right]
+        # sum the rules into their left-hand sides
+        cell=(acc*bin_p).dot(onehot[0])
+        chart.append(cell.dot(closure))
+    return chart
+
+def outside(tables,probs,closure,ichart):
+    '''Postcondition: the outside chart matching ichart has been computed.
+
+    How: The whole-sentence cell starts with 1.0 for the start symbol.
+    Working down from the widest span, each width's outside scores are
+    completed by the (transposed) unary closure, and then passed down
+    through every binary rule at every split point to the two children.
+
+    :rtype: list(numpy.ndarray)
+    :return: chart, laid out as for inside()
+    '''
+    n=len(ichart)-1
+    size=len(tables.symbols)
+    pre=[None]+[np.zeros((n-w+1,size)) for w in range(1,n+1)]
+    pre[n][0,tables.start]=1.0
+    chart=[None]*(n+1)
+    bin_p=probs[tables.bin_rules]
+    onehot=_onehots(tables)
+    closure_t=closure.T
+    for w in range(n,0,-1):
+        chart[w]=pre[w].dot(closure_t)
+        if w==1:
+            break
+        starts=n-w+1
+        parent=chart[w][:,tables.bin_lhs]*bin_p
+        for k in range(1,w):
+            left=ichart[k][:starts]
+            right=ichart[w-k][k:k+starts]
+            pre[k][:starts]+=(parent*right[:,tables.bin_right]).dot(
+                onehot[1])
+            pre[w-k][k:k+starts]+=(parent*left[:,tables.bin_left]).dot(
+                onehot[2])
+    return chart
+
+def expected_counts(tables,probs,closure,tokens):
+    '''The expected number of uses of each rule in the parses of tokens
+
+    :rtype: tuple(numpy.ndarray, float)
+    :return: (counts indexed by rule id, log probability of tokens), or
+        (None, None) if the grammar cannot parse tokens
+    '''
+    n=len(tokens)
+    if n==0:
+        return None,None
+    ichart=inside(tables,probs,closure,tokens)
+    total=ichart[n][0,tables.start]
+    if total<=0.0:
+        return None,None
+    ochart=outside(tables,probs,closure,ichart)
+    counts=np.zeros(len(tables))
+    bin_p=probs[tables.bin_rules]
+    un_p=probs[tables.un_rules]
+    for w in range(1,n+1):
+        icell=ichart[w]
+        ocell=ochart[w]
+        starts=n-w+1
+        # unary rules, used anywhere in the chart
+        counts[tables.un_rules]+=un_p*(ocell[:,tables.un_lhs]*
+                                       icell[:,tables.un_child]).sum(0)
+        if w==1:
+            continue
+        parent=ocell[:,tables.bin_lhs]*bin_p
+        for k in range(1,w):
+            left=ichart[k][:starts]
+            right=ichart[w-k][k:k+starts]
+            counts[tables.bin_rules]+=(parent*left[:,tables.bin_left]*
+                                       right[:,tables.bin_right]).sum(0)
+    # lexical rules
+    for i,word in enumerate(tokens):
+        if word in tables.lexicon:
+            rids,lhss=tables.lexicon[word]
+            np.add.at(counts,rids,probs[rids]*ochart[1][i,lhss])
+    return counts/total,np.log(total)
+
+# Each worker process compiles nothing: it is handed the tables once,
+#  when the pool starts, and only the (small) probability vector with
+#  each batch of sentences
+_worker_tables=None
+
+def _init_worker(tables):
+    global _worker_tables
+    _worker_tables=tables
+
+def _count_batch(args):
+    '''E-step for one batch of sentences in a worker process'''
+    probs,sentences=args
+    return _count(_worker_tables,probs,sentences)
+
+def _count(tables,probs,sentences):
+    closure=tables.unaryClosure(probs)
+    counts=np.zeros(len(tables))
+    loglik=0.0
+    parsed=0
+    for tokens in sentences:
+        c,ll=expected_counts(tables,probs,closure,tokens)
+        if c is not None:
+            counts+=c
+            loglik+=ll
+            parsed+=1
+    return counts,loglik,parsed
+
+def e_step(tables,probs,sentences,pool=None,batch_size=500):
+    '''Expected rule counts summed over sentences
+
+    :type pool: multiprocessing.Pool
+    :param pool: a pool made by make_pool(tables), or None to count in
+        this process
+    :rtype: tuple(numpy.ndarray, float, int)
+    :return: (counts, total log likelihood, number of sentences parsed)
+    '''
+    if pool is None:
+        return _count(tables,probs,sentences)
+    batches=[(probs,sentences[i:i+batch_size])
+             for i in range(0,len(sentences),batch_size)]
+    counts=np.zeros(len(tables))
+    loglik=0.0
+    parsed=0
+    for c,ll,p in pool.imap_unordered(_count_batch,batches):
+        counts+=c
+        loglik+=ll
+        parsed+=p
+    return counts,loglik,parsed
+
+def make_pool(tables,processes=None):
+    '''A pool of worker processes, each holding a copy of tables'''
+    return multiprocessing.Pool(processes,_init_worker,(tables,))
+
+def train(tables,sentences,iterations=10,processes=None,log=None):
+    '''Re-estimate the rule probabilities of tables by EM
+
+    :type tables: GrammarTables
+    :param tables: the grammar; its probabilities are the starting point
+        (uniform, for a plain CFG) and are replaced by the final estimate
+    :type sentences: list(list(str))
+    :param sentences: the tokenised training sentences
+    :type iterations: int
+    :param iterations: how many rounds of EM to run
+    :type processes: int
+    :param processes: number of worker processes for the E-step; 1 counts
+        in this process, None uses one per CPU
+    :type log: function
+    :param log: called with (iteration, log likelihood, sentences parsed)
+        after each E-step, if given
+    :rtype: numpy.ndarray
+    :return: the final rule probabilities
+    '''
+    pool=None if processes==1 else make_pool(tables,processes)
+    try:
+        for it in range(iterations):
+            counts,loglik,parsed=e_step(tables,tables.probs,sentences,pool)
+            if log is not None:
+                log(it,loglik,parsed)
+            tables.probs=tables.normalise(counts)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return tables.probs
+
+if __name__=='__main__':
+    from hw2_5 import tokenise
+    grammar_file,corpus_file,out_file=sys.argv[1:4]
+    iterations=int(sys.argv[4]) if len(sys.argv)>4 else 10
+    processes=int(sys.argv[5]) if len(sys.argv)>5 else None
+    with open(grammar_file) as f:
+        tables=GrammarTables(read_grammar(f.read()))
+    with open(corpus_file) as f:
+        sentences=[tokenise(line) for line in f if line.strip()]
+    def report(it,loglik,parsed):
+        print('iteration %d: log likelihood %.4f over %d/%d sentences'%(
+            it,loglik,parsed,len(sentences)))
+    train(tables,sentences,iterations,processes,report)
+    tables.write(out_file)
@@ -0,0 +1,299 @@
+'''A resident parsing service, batching requests into a process pool
+
+Every short-lived client which parses a few sentences pays for
+importing NLTK, cfg_fix's patches and building the parser's indices,
+which is far more than parsing them takes. This service does all that
+once, in each of a pool of worker processes, and then parses sentences
+sent to it over a local TCP or Unix socket.
+
+The protocol is one JSON object per line each way. A request is
+
+    {"id": 1, "sentence": "John gave a book to Mary."}
+
+(or "tokens": [...] instead of "sentence"), and its reply is
+
+    {"id": 1, "recognised": true, "count": 3, "tree": "(S ...)",
+     "score": -12.5, "unknown": [], "latency_ms": 4.2}
+
+("score" is null when the best tree has probability 0, as JSON has no
+-Infinity.)
+
+A client can send any number of requests without waiting for replies;
+replies come back as they are ready, so they carry the request's id.
+{"stats": true} gets the service's figures instead (see Metrics). A
+request which is not an object, or whose "tokens" is not a list of
+strings or "sentence" not a string, is answered with {"error": ...}.
+
+Requests are put on a bounded queue. A batcher takes the first one
+waiting, then whatever else arrives within a few milliseconds (up to a
+batch size), and has a worker parse them all with CKY.parseMany, so
+under load the cost of handing work to a process is shared by many
+sentences. Each worker has at most two batches at a time, one being
+parsed and the next ready; while they are all busy the queue fills, and
+when it is full a request is not queued but answered at once with
+{"id": ..., "error": "busy"}, so a flood of requests cannot make the
+service grow without bound.
+
+To serve grammar2 on a port (default 8765) or a Unix socket path:
+
+    python parse_service.py [port|path] [workers]
+'''
+import os
+import sys
+import time
+import math
+import json
+import asyncio
+import concurrent.futures
+from token_stream import TOKEN
+
+# how long to wait for more requests to fill a batch, in seconds
+WINDOW=0.005
+# the most sentences in a batch
+MAX_BATCH=32
+# the most requests waiting to be batched
+QUEUE_SIZE=1024
+
+# the parser in a worker process, made once by start_worker
+_parser=None
+
+def request_tokens(request):
+    '''The words of a request: its "tokens", or its "sentence" tokenised
+
+    :raises ValueError: if "tokens" is not a list of strings (a string
+        would otherwise be taken a character at a time), or "sentence"
+        is not a string
+    '''
+    if 'tokens' in request:
+        tokens=request['tokens']
+        if not (isinstance(tokens,list) and
+                all(isinstance(token,str) for token in tokens)):
+            raise ValueError('"tokens" must be a list of strings')
+        return tokens
+    sentence=request.get('sentence','')
+    if not isinstance(sentence,str):
+        raise ValueError('"sentence" must be a string')
+    return TOKEN.findall(sentence)
+
+def start_worker(parser):
+    '''Run in each worker process when it starts: keep its parser'''
+    global _parser
+    _parser=parser
+
+def parse_batch(batch):
+    '''Run in a worker process: parse a batch of token lists and
+    summarise the results (charts stay in the worker)'''
+    return [summarise(result) for result in _parser.parseMany(batch)]
+
+def summarise(result):
+    '''What a reply says about a ParseResult
+
+    :rtype: dict
+    :return: whether it was recognised, the number of analyses, the best
+        tree (on one line) and, with a PCFG, its log probability (None
+        if it is -inf, which JSON cannot carry), and any unknown words
+    '''
+    reply={'recognised':result.recognised,
+           'unknown':[token for i,token in result.unknown]}
+    try:
+        reply['count']=result.count()
+    except ValueError:
+        # a unary cycle: infinitely many analyses
+        reply['count']=None
+    best=result.kBest(1)
+    if best:
+        tree,score=best[0]
+        reply['tree']=' '.join(str(tree).split())
+        reply['score']=score if math.isfinite(score) else None
+    return reply
+
+class Metrics:
+    '''Running figures for a service: requests answered and turned away,
+    batches and their sizes, and request latencies'''
+
+    def __init__(self,keep=10000):
+        self.answered=0
+        self.rejected=0
+        self.batches=0
+        self.batched=0
+        # the most recent latencies, in seconds
+        self.latencies=[]
+        self.keep=keep
+
+    def record(self,latency):
+        self.answered+=1
+        self.latencies.append(latency)
+        if len(self.latencies)>self.keep:
+            del self.latencies[:len(self.latencies)-self.keep]
+
+    def report(self):
+        '''The figures, as a dict; latencies are in milliseconds'''
+        res={'answered':self.answered,'rejected':self.rejected,
+             'batches':self.batches,
+             'mean_batch':(self.batched/self.batches if self.batches
+                           else 0.0)}
+        ordered=sorted(self.latencies)
+        for name,fraction in (('p50',0.5),('p90',0.9),('p99',0.99)):
+            if ordered:
+                index=min(len(ordered)-1,int(fraction*len(ordered)))
+                res[name+'_ms']=ordered[index]*1000
+        return res
+
+class ParseService:
+    '''The service: a request queue, a batcher and a pool of workers'''
+
+    def __init__(self,parser,workers=None,window=WINDOW,
+                 max_batch=MAX_BATCH,queue_size=QUEUE_SIZE):
+        '''
+        :type parser: CKY, or any picklable parser with parseMany()
+        :param parser: the parser, copied to each worker once
+        :type workers: int
+        :param workers: how many worker processes, or None for one per
+            CPU
+        :type window: float
+        :param window: how long to wait for a batch to fill, in seconds
+        :type max_batch: int
+        :param max_batch: the most sentences in a batch
+        :type queue_size: int
+        :param queue_size: the most requests waiting to be batched
+        '''
+        self.parser=parser
+        self.workers=workers
+        self.window=window
+        self.max_batch=max_batch
+        self.queue_size=queue_size
+        self.metrics=Metrics()
+        self.pool=None
+        self.queue=None
+
+    async def start(self):
+        '''Postcondition: the pool and the batcher are running'''
+        workers=self.workers or os.cpu_count() or 1
+        self.pool=concurrent.futures.ProcessPoolExecutor(
+            workers,initializer=start_worker,initargs=(self.parser,))
+        self.queue=asyncio.Queue(self.queue_size)
+        # one for each batch the pool may have at once
+        self.slots=asyncio.Semaphore(2*workers)
+        self.batcher=asyncio.ensure_future(self.batch())
+
+    async def stop(self):
+        self.batcher.cancel()
+        self.pool.shutdown()
+
+    async def batch(self):
+        '''Take requests off the queue in batches and send each batch to
+        the pool, without waiting for one to finish before the next, as
+        long as the pool has room for it'''
+        loop=asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch=[await self.queue.get()]
+            deadline=loop.time()+self.window
+            while len(batch)<self.max_batch:
+                timeout=deadline-loop.time()
+                if timeout<=0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.metrics.batches+=1
+            self.metrics.batched+=len(batch)
+            job=loop.run_in_executor(self.pool,parse_batch,
+                                     [tokens for tokens,future in batch])
+            job.add_done_callback(
+                lambda job,batch=batch:self.deliver(job,batch))
+
+    def deliver(self,job,batch):
+        '''Hand each request in a finished batch its reply'''
+        self.slots.release()
+        try:
+            replies=job.result()
+        except Exception as error:
+            replies=[{'error':str(error)}]*len(batch)
+        for (tokens,future),reply in zip(batch,replies):
+            if not future.done():
+                future.set_result(reply)
+
+    async def parse(self,tokens):
+        '''The reply for one sentence
+
+        :raises asyncio.QueueFull: if too many requests are waiting
+        '''
+        future=asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((tokens,future))
+        return await future
+
+    async def answer(self,request,writer):
+        '''Postcondition: the reply to one request has been written'''
+        started=time.time()
+        if not isinstance(request,dict):
+            reply={'error':'a request must be a JSON object'}
+            request={}
+        elif request.get('stats'):
+            reply=self.metrics.report()
+        else:
+            try:
+                tokens=request_tokens(request)
+            except ValueError as error:
+                tokens,reply=None,{'error':str(error)}
+            if tokens is not None:
+                try:
+                    reply=dict(await self.parse(tokens))
+                    self.metrics.record(time.time()-started)
+                except asyncio.QueueFull:
+                    self.metrics.rejected+=1
+                    reply={'error':'busy'}
+                reply['latency_ms']=(time.time()-started)*1000
+        if 'id' in request:
+            reply['id']=request['id']
+        try:
+            line=json.dumps(reply,allow_nan=False)
+        except ValueError:
+            # a NaN or infinity (in the request's id, say) is not JSON
+            line=json.dumps({'error':'the reply is not valid JSON'})
+        writer.write((line+'\n').encode('utf-8'))
+        await writer.drain()
+
+    async def serve(self,reader,writer):
+        '''Answer the requests of one connection until it closes'''
+        tasks=set()
+        try:
+            while True:
+                line=await reader.readline()
+                if not line:
+                    break
+                try:
+                    request=json.loads(line)
+                except ValueError:
+                    writer.write(b'{"error": "not JSON"}\n')
+                    continue
+                task=asyncio.ensure_future(self.answer(request,writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+async def main(address,workers):
+    from hw2_5 import grammar2
+    from cky_5 import CKY
+    service=ParseService(CKY(grammar2),workers)
+    await service.start()
+    if address.isdigit():
+        server=await asyncio.start_server(service.serve,'127.0.0.1',
+                                          int(address))
+    else:
+        server=await asyncio.start_unix_server(service.serve,address)
+    print('serving on',address)
+    try:
+        await server.serve_forever()
+    finally:
+        await service.stop()
+
+if __name__=='__main__':
+    address=sys.argv[1] if len(sys.argv)>1 else '8765'
+    workers=int(sys.argv[2]) if len(sys.argv)>2 else None
+    asyncio.run(main(address,workers))
@@ -0,0 +1,207 @@
+'''The fewest constituents which together cover a sentence
+
+When the start symbol is not in the top cell the sentence is not
+recognised, but the chart still holds every constituent found over its
+parts. cover() picks from it a partial analysis: the fewest
+constituents which tile the sentence, one after the other, so a
+sentence which is nearly grammatical comes out as a few big chunks
+rather than nothing, without parsing it again.
+
+It is a shortest path over the positions between the words: the best
+cover of the first j words is the best, over every cell (i, j) with a
+non-terminal in it, of the best cover of the first i words and one
+more piece. Each cell offers its maximal label: one which is not just
+the unary child of another label in the same cell (so NP rather than
+the PropN under it), the start symbol if it is there, and with a PCFG
+the most probable. A word with no non-terminal over it is a piece on
+its own. Ties are broken by fewer bare words and then by the higher
+total log probability, so the cost is O(n^2) in the number of words,
+after one look at each cell's labels.
+
+Binarisation intermediates are not constituents of the grammar, so
+they are never pieces. Charts built with a width (see segment) work as
+well as any: their widest cells are just narrower.
+
+    result=parser.parse(tokens)
+    if not result:
+        result.partial().pprint()
+
+To show the covers of some ungrammatical sentences with grammar2:
+
+    python partial_parse.py [sentence ...]
+'''
+import nltk
+from nltk.grammar import Nonterminal
+from cky_kbest import KBest
+
+# the label of the tree put over the pieces
+PARTIAL='PARTIAL'
+
+def cover(result):
+    '''The fewest pieces covering a parsed sentence
+
+    :type result: cky_5.ParseResult
+    :param result: the result of parsing the sentence
+    :rtype: PartialParse or None
+    :return: the pieces, or None if there is no chart (the sentence had
+        words the grammar does not have)
+    '''
+    chart=result.chart
+    if chart is None:
+        return None
+    n=chart.n-1
+    start_symbol=chart.grammar.start()
+    binarisation=getattr(chart.parser,'binarisation',None)
+    intermediates=binarisation.symbols if binarisation is not None else ()
+    logprob=chart.parser.logprob
+    def maximal(cell):
+        '''The label to use for a cell, and its score, or None'''
+        labels=[label for label in cell.labels()
+                if isinstance(label.symbol(),Nonterminal) and
+                label.symbol() not in intermediates]
+        if not labels:
+            return None
+        below=set(id(children[0]) for label in labels
+                  for children in label.backpointers() if len(children)==1)
+        tops=[label for label in labels if id(label) not in below] or labels
+        for label in tops:
+            if label.symbol()==start_symbol:
+                return label,label.score(logprob)
+        # the first of the best, so a plain CFG takes the first added
+        return max(((label,label.score(logprob)) for label in tops),
+                   key=lambda entry:entry[1])
+    # best[j]: (pieces, bare words, -log probability) of the best cover
+    #  of the first j words, and back[j] its last piece
+    best=[(0,0,0.0)]+[None]*n
+    back=[None]*(n+1)
+    for end in range(1,n+1):
+        for start in range(end):
+            cell=chart.matrix[start][end]
+            if cell is None or best[start] is None:
+                continue
+            chosen=maximal(cell)
+            if chosen is None:
+                if end-start>1:
+                    continue
+                # a word on its own
+                label,cost=None,(1,1,0.0)
+            else:
+                label,score=chosen
+                cost=(1,0,-score)
+            pieces,bare,minus=best[start]
+            total=(pieces+cost[0],bare+cost[1],minus+cost[2])
+            if best[end] is None or total<best[end]:
+                best[end]=total
+                back[end]=(start,label)
+    pieces=[]
+    end=n
+    while end>0:
+        start,label=back[end]
+        pieces.append((start,end,label))
+        end=start
+    pieces.reverse()
+    return PartialParse(result,pieces,-best[n][2])
+
+class PartialParse:
+    '''The pieces of a partial analysis, left to right'''
+
+    def __init__(self,result,pieces,score=0.0):
+        '''
+        :type result: cky_5.ParseResult
+        :param result: the result whose chart the pieces are from
+        :type pieces: list(tuple(int, int, Label))
+        :param pieces: the (start, end) of each piece and its label (None
+            for a word on its own)
+        :type score: float
+        :param score: the total log probability of the pieces' best trees
+        '''
+        self.result=result
+        self.pieces=pieces
+        self.score=score
+        self._trees=None
+
+    def __len__(self):
+        return len(self.pieces)
+
+    def __repr__(self):
+        return '<PartialParse %s>'%' '.join(
+            '[%s %s]'%(name if name is not None else '-',
+                       ' '.join(self.result.tokens[start:end]))
+            for (start,end,label),name in zip(self.pieces,self.names()))
+
+    def complete(self):
+        '''Whether the cover is a full analysis: the start symbol over
+        everything'''
+        if len(self.pieces)!=1 or self.pieces[0][2] is None:
+            return False
+        return self.pieces[0][2].symbol()==self.result.chart.grammar.start()
+
+    def trees(self):
+        '''The best tree of each piece (a word on its own is just the
+        word), over the sentence as it was given'''
+        if self._trees is None:
+            chart=self.result.chart
+            kbest=KBest(chart)
+            tokens=self.result.tokens
+            self._trees=[]
+            for start,end,label in self.pieces:
+                if label is None:
+                    self._trees.append(tokens[start])
+                    continue
+                tree=chart.parser.restoreTree(kbest.best(label,1)[0][0])
+                leaves=iter(tokens[start:end])
+                def relabel(t):
+                    if not isinstance(t,nltk.tree.Tree):
+                        return next(leaves)
+                    return nltk.tree.Tree(t.label(),
+                                          [relabel(child) for child in t])
+                self._trees.append(relabel(tree))
+        return self._trees
+
+    def tree(self):
+        '''The pieces' trees under one PARTIAL node'''
+        return nltk.tree.Tree(PARTIAL,list(self.trees()))
+
+    def names(self):
+        '''The symbol at the top of each piece's tree, as a str (None for
+        a word on its own): a compound of collapsed unary rules (see
+        unary_collapse) is shown as the symbol it restores to'''
+        return [None if label is None else tree.label()
+                for (start,end,label),tree in zip(self.pieces,self.trees())]
+
+    def labels(self):
+        '''(label, start, end) of each piece, the label as a str (None for
+        a word on its own)'''
+        return [(name,start,end) for (start,end,label),name in
+                zip(self.pieces,self.names())]
+
+    def pprint(self):
+        '''Print the pieces and the tree over them'''
+        print('%d pieces: %r'%(len(self),self))
+        print(self.tree())
+
+if __name__=='__main__':
+    import sys
+    import time
+    from hw2_5 import grammar2, tokenise
+    from cky_5 import CKY
+    sentences=sys.argv[1:] or [
+        'John John gave a book.',
+        'John gave Mary a book John ate salad.',
+        'a flight with gave told Mary.',
+        'the the book to with fork.',
+        'Can you book a flight to London?']
+    parser=CKY(grammar2)
+    collapsed=CKY(grammar2,collapse=True)
+    for sentence in sentences:
+        result=parser.parse(tokenise(sentence))
+        start=time.time()
+        partial=result.partial()
+        took=time.time()-start
+        print(sentence,result.recognised,'(cover in %.2fms)'%(took*1000))
+        partial.pprint()
+        print()
+        # collapsing unary chains shows the same symbols
+        other=collapsed.parse(tokenise(sentence)).partial()
+        assert len(other)==len(partial)
+        assert all(name is None or '+' not in name for name in other.names())
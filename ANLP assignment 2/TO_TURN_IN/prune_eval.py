@@ -0,0 +1,140 @@
+'''Compare beam/threshold pruning with exhaustive CKY parsing
+
+For each pruning setting, parse every held-out sentence and report how
+long it took, how many sentences were still recognised, how many best
+trees were exactly the exhaustive parser's best tree, and the labelled
+bracket F1 of the best trees against the exhaustive ones.
+
+Usage:
+    python prune_eval.py [grammar.pcfg sentences.txt]
+
+With no arguments, grammar2 is given probabilities by a few rounds of
+inside-outside on TRAINING, sentences of grammar2's words written for
+the purpose, and the held-out set is SENTENCES: the hw2_5 sentences and
+two longer ones, none of which is in TRAINING. grammar2's cells are
+small, so
+there pruning mostly shows what it costs; it pays off on grammars whose
+cells hold many labels.
+'''
+import sys
+from timing import best_time
+from nltk.grammar import PCFG
+from nltk.tree import Tree
+import cfg_fix
+from cky_5 import CKY
+
+SETTINGS=[('exhaustive',{}),
+          ('beam 20',{'beam':20}),
+          ('beam 10',{'beam':10}),
+          ('beam 10 + fom',{'beam':10,'fom':True}),
+          ('threshold 1e-4',{'threshold':1e-4}),
+          ('threshold 1e-4 + fom',{'threshold':1e-4,'fom':True}),
+          ('threshold 1e-2 + fom',{'threshold':1e-2,'fom':True})]
+
+# the default held-out set: the hw2_5 sentences, and some long ones,
+#  where pruning has most to save
+SENTENCES=["John gave a book to Mary.",
+           "John gave Mary a book.",
+           "John gave Mary a nice drawing book.",
+           "John ate salad with mushrooms with a fork.",
+           "Book a flight to NYC.",
+           "Can you book a flight to London?",
+           "Why did John book the flight?",
+           "John told Mary that he will book a flight today.",
+           "John ate salad with mushrooms with a fork with a fork"
+           " with mushrooms with a fork today.",
+           "John told Mary that he will book a flight to London with a fork"
+           " with Mary with Mary with Mary with Mary."]
+
+# the default training set, kept apart from SENTENCES so that the
+#  evaluation is of sentences the probabilities were not fitted to
+TRAINING=["Mary gave John a book.",
+          "Mary told John that he will book a flight.",
+          "he ate salad with a fork.",
+          "Book the flight to London.",
+          "Can you book a flight to NYC?",
+          "Why did Mary book a nice flight?",
+          "John ate today.",
+          "Mary gave the drawing book to John with a fork.",
+          "John told Mary a book.",
+          "Mary ate a salad with mushrooms.",
+          "he will book the flight today."]
+
+def brackets(tree):
+    '''The labelled spans of a tree, as a set of (label, start, end)'''
+    res=set()
+    def walk(t,start):
+        if not isinstance(t,Tree):
+            return start+1
+        end=start
+        for child in t:
+            end=walk(child,end)
+        res.add((t.label(),start,end))
+        return end
+    walk(tree,0)
+    return res
+
+def evaluate(parser,sentences,settings=SETTINGS,repeat=5):
+    '''Parse sentences under each setting and compare with the first
+
+    Each setting is timed repeat times and the fastest run is reported,
+    so a small held-out set still gives steady timings.
+
+    :rtype: list(dict)
+    :return: one dict of figures per setting
+    '''
+    gold=None
+    report=[]
+    for name,options in settings:
+        def run():
+            results=[parser.parse(tokens,**options) for tokens in sentences]
+            return results,[r.bestTree() for r in results]
+        elapsed,(results,best)=best_time(run,repeat)
+        if gold is None:
+            gold=best
+        matched=correct=proposed=wanted=0
+        for mine,ref in zip(best,gold):
+            if ref is None:
+                continue
+            ref_b=brackets(ref)
+            wanted+=len(ref_b)
+            if mine is None:
+                continue
+            mine_b=brackets(mine)
+            proposed+=len(mine_b)
+            correct+=len(mine_b&ref_b)
+            matched+=mine==ref
+        f1=2.0*correct/(proposed+wanted) if proposed+wanted else 0.0
+        report.append({'setting':name,'seconds':elapsed,
+                       'recognised':sum(1 for r in results if r),
+                       'exact':matched,'f1':f1,
+                       'pruned':sum(r.chart.pruned for r in results)})
+    return report
+
+def print_report(report,total):
+    base=report[0]['seconds']
+    print('%-24s %8s %7s %10s %8s %7s %9s'%(
+        'setting','seconds','speedup','recognised','exact','F1','pruned'))
+    for row in report:
+        print('%-24s %8.3f %7.2f %6d/%-3d %4d/%-3d %7.3f %9d'%(
+            row['setting'],row['seconds'],
+            base/row['seconds'] if row['seconds'] else 0.0,
+            row['recognised'],total,row['exact'],total,row['f1'],
+            row['pruned']))
+
+if __name__=='__main__':
+    from hw2_5 import tokenise
+    if len(sys.argv)>2:
+        with open(sys.argv[1]) as f:
+            grammar=PCFG.fromstring(f.read())
+        with open(sys.argv[2]) as f:
+            sentences=[tokenise(line) for line in f if line.strip()]
+    else:
+        from hw2_5 import grammar2
+        from grammar_tables import GrammarTables
+        import inside_outside
+        sentences=[tokenise(s) for s in SENTENCES]
+        tables=GrammarTables(grammar2)
+        inside_outside.train(tables,[tokenise(s) for s in TRAINING],5,1)
+        grammar=tables.toPCFG()
+    print_report(evaluate(CKY(grammar),sentences),len(sentences))
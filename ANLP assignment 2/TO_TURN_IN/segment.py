@@ -0,0 +1,227 @@
+'''Splitting long inputs into sentences, and parsing them separately
+
+CKY takes time cubic in the length of its input, so a paragraph given
+to it as one token list costs far more than its sentences parsed one at
+a time, and with grammar2 it is not recognised anyway: S only spans a
+single sentence, ending in its final punctuation (S -> Sdecl '.').
+
+A Segmenter splits a token list after every token which can end a
+sentence. Those are found from the grammar: the words which are the last
+symbol of a rule for the start symbol ('.' and '?' for grammar2). The
+segments are parsed separately, in parallel if an executor is given,
+and put back together in a SegmentedResult, which knows where each one
+starts.
+
+A segment which cannot be split any further, but is longer than the
+Segmenter's width, is parsed with CKY.parse's width, so it costs time
+linear in its length: it is not recognised, but its chart still holds
+every constituent up to that width.
+
+Parsing is pure Python, so only a process pool parses segments at the
+same time; each result comes back with a copy of its chart (and of the
+parser), which costs a few milliseconds, so it only pays for segments
+which take longer than that to parse. To compare parsing prune_eval's
+sentences as one span, one at a time and in four processes:
+
+    python segment.py [text]
+'''
+import concurrent.futures
+from nltk.grammar import Nonterminal
+from nltk.tree import Tree
+import cfg_fix
+
+# the label of the tree put over the segments' trees
+TEXT='TEXT'
+
+class Segmenter:
+    '''Splits token lists into sentences for a parser, and parses them'''
+
+    def __init__(self,parser,boundaries=None,width=None):
+        '''Create a segmenter for parser
+
+        :type parser: CKY, or any parser with the same parse()
+        :param parser: the parser for the segments
+        :type boundaries: iter(str)
+        :param boundaries: the tokens after which to split, or None for
+            the sentence-final words of the grammar (see final_words)
+        :type width: int
+        :param width: the widest span to build in a segment, or None for
+            no limit
+        '''
+        self.parser=parser
+        if boundaries is None:
+            # the rules as given, not as CKY binarised them
+            if hasattr(parser,'productions'):
+                productions=parser.productions()
+            else:
+                productions=parser.grammar.productions()
+            boundaries=final_words(parser.grammar.start(),productions)
+        self.boundaries=frozenset(boundaries)
+        self.width=width
+
+    def split(self,tokens):
+        '''Where to split tokens
+
+        :type tokens: list(str)
+        :param tokens: the words of one or more sentences
+        :rtype: list(tuple(int, int))
+        :return: the (start, end) of each segment, in order, together
+            covering all of tokens
+        '''
+        res=[]
+        start=0
+        for i,token in enumerate(tokens):
+            if token in self.boundaries:
+                res.append((start,i+1))
+                start=i+1
+        if start<len(tokens) or not res:
+            res.append((start,len(tokens)))
+        return res
+
+    def parse(self,tokens,executor=None,**options):
+        '''Postcondition: every segment of tokens has been parsed, and a
+        SegmentedResult for them returned.
+
+        How: Split tokens (see split) and parse each segment with the
+        parser, in an executor if one is given, with the segmenter's
+        width for a segment longer than it. CKY.parse only reads the
+        parser, so a thread pool can share it; a process pool is sent a
+        copy of it with each segment, and sends the result back.
+
+        :type tokens: list(str)
+        :param tokens: the words of one or more sentences
+        :type executor: concurrent.futures.Executor
+        :param executor: where to parse the segments, or None to parse
+            them one after the other here
+        :param options: passed on to the parser's parse()
+        :rtype: SegmentedResult
+        :return: the segments and their results
+        '''
+        spans=self.split(tokens)
+        jobs=[]
+        for start,end in spans:
+            kwargs=dict(options)
+            if self.width is not None and end-start>self.width:
+                kwargs['width']=self.width
+            jobs.append((tokens[start:end],kwargs))
+        if executor is None:
+            results=[self.parser.parse(words,**kwargs)
+                     for words,kwargs in jobs]
+        else:
+            futures=[executor.submit(self.parser.parse,words,**kwargs)
+                     for words,kwargs in jobs]
+            results=[future.result() for future in futures]
+        return SegmentedResult(tokens,[(start,end,result) for (start,end),result
+                                       in zip(spans,results)])
+
+class SegmentedResult:
+    '''The results for the segments of one input
+
+    Like a ParseResult, it is true if the input was recognised, which
+    here means every segment was.'''
+
+    def __init__(self,tokens,segments):
+        '''
+        :type tokens: list(str)
+        :param tokens: the whole input
+        :type segments: list(tuple(int, int, ParseResult))
+        :param segments: the (start, end) of each segment in tokens, and
+            its result
+        '''
+        self.tokens=tokens
+        self.segments=segments
+        self.recognised=all(result.recognised
+                            for start,end,result in segments)
+
+    def __bool__(self):
+        return self.recognised
+
+    def __repr__(self):
+        return '<SegmentedResult %d segments: %s>'%(len(self.segments),
+                                                    self.recognised)
+
+    def count(self):
+        '''The number of analyses of the whole input: the product of the
+        segments' counts'''
+        total=1
+        for start,end,result in self.segments:
+            total*=result.count()
+        return total
+
+    def bestTree(self):
+        '''The best tree of each segment, in order, under one TEXT node,
+        or None if some segment was not recognised'''
+        if not self.recognised:
+            return None
+        return Tree(TEXT,[result.bestTree()
+                          for start,end,result in self.segments])
+
+    def brackets(self):
+        '''The labelled spans of the segments' best trees, as positions in
+        the whole input
+
+        :rtype: set(tuple(str, int, int))
+        :return: (label, start, end) of every constituent of a recognised
+            segment
+        '''
+        res=set()
+        for offset,end,result in self.segments:
+            tree=result.bestTree()
+            if tree is None:
+                continue
+            def walk(t,start):
+                if not isinstance(t,Tree):
+                    return start+1
+                end=start
+                for child in t:
+                    end=walk(child,end)
+                res.add((t.label(),start,end))
+                return end
+            walk(tree,offset)
+        return res
+
+    def pprint(self):
+        '''Print each segment with where it starts, how many analyses it
+        has and its best tree (as much of that as the segments' mode
+        kept, see ParseResult.pprint)'''
+        for start,end,result in self.segments:
+            if result.answers('count'):
+                found=result.count()
+            else:
+                found=result.recognised
+            print('%d-%d %s: %s'%(start,end,' '.join(result.tokens),found))
+            if result.recognised and result.answers('tree'):
+                print(result.bestTree())
+
+def final_words(start,productions):
+    '''The words which can end a sentence: those which are the last
+    symbol of a rule for the start symbol'''
+    res=set()
+    for production in productions:
+        last=production.rhs()[-1]
+        if production.lhs()==start and not isinstance(last,Nonterminal):
+            res.add(last)
+    return res
+
+if __name__=='__main__':
+    import sys
+    from hw2_5 import grammar2, tokenise
+    from prune_eval import SENTENCES
+    from cky_5 import CKY
+    from timing import best_time
+    text=' '.join(sys.argv[1:]) or ' '.join(SENTENCES)
+    tokens=tokenise(text)
+    parser=CKY(grammar2)
+    segmenter=Segmenter(parser,width=20)
+    print('%d words, %d segments'%(len(tokens),len(segmenter.split(tokens))))
+    took,whole=best_time(lambda:parser.parse(tokens),1)
+    print('as one span:    %8.2fms, recognised: %s'%(took*1000,
+                                                     whole.recognised))
+    took,result=best_time(lambda:segmenter.parse(tokens))
+    print('one at a time:  %8.2fms, recognised: %s'%(took*1000,
+                                                     result.recognised))
+    with concurrent.futures.ProcessPoolExecutor(4) as executor:
+        took,parallel=best_time(lambda:segmenter.parse(tokens,executor))
+        print('in 4 processes: %8.2fms'%(took*1000))
+    assert parallel.brackets()==result.brackets()
+    result.pprint()
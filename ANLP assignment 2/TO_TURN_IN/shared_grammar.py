@@ -0,0 +1,568 @@
+'''CKY grammar indices in one read-only block of shared memory
+
+A pool of parser processes forked from one with a CKY parser starts
+out sharing its indices, but the dictionaries and lists of symbols are
+Python objects: looking one up changes its reference count, which
+writes to its page, and the page is copied. Before long every worker
+has its own copy of the grammar.
+
+SharedGrammar lays the indices out as flat arrays of numbers in a
+single buffer, with no Python objects in it, so nothing ever writes to
+it once it is built. The buffer is a multiprocessing.shared_memory
+block, which any process can attach to by name, or a file, which any
+process can map; either way there is one copy in memory however many
+workers use it. Its layout:
+
+ symbols     every non-terminal (numbered first) and word, as UTF-8
+             names in one blob with an array of offsets, and an open
+             addressing hash table (CRC-32 of the name) from name to number
+ unary       for each child symbol, a run of parents and log probabilities
+             (the runs located by an array of offsets)
+ binary      the sorted (left, right) pairs as left*symbols+right, and
+             for each a run of parents and log probabilities
+ outside     each non-terminal's outside estimate
+ flags       which non-terminals are binarisation intermediates
+
+SharedCKY parses with it: it has CKY's parse(), and stands in for CKY's
+dictionaries with objects which look symbols up in the buffer (keeping
+only a small cache of them). Charts, results and trees are CKY's own.
+Its grammar has the real start symbol, and rebuilds the rules from the
+buffer only if they are asked for (by Segmenter, say). A grammar with
+collapsed unary chains cannot be shared, and a SharedCKY's grammar
+cannot be changed.
+
+To compare memory and parses on grammar2 with a large synthetic
+lexicon, with four workers attached to one block:
+
+    python shared_grammar.py [extra words]
+'''
+import sys
+import bisect
+import math
+import mmap
+import zlib
+from array import array
+from multiprocessing import shared_memory, resource_tracker
+from nltk.grammar import Nonterminal, Production, ProbabilisticProduction, CFG
+import cfg_fix
+from cky_5 import CKY
+
+MAGIC=0x434b5947  # 'CKYG'
+# the header: MAGIC, then these counts, then the byte offset of each
+#  section
+COUNTS=('symbols','nonterminals','table_size','unary','binary_keys',
+        'binary_rules','start','probabilistic')
+SECTIONS=(('names','q'),('blob','B'),('table','q'),('unary_start','q'),
+          ('unary_lhs','q'),('unary_logprob','d'),('binary_keys','q'),
+          ('binary_start','q'),('binary_lhs','q'),('binary_logprob','d'),
+          ('outside','d'),('intermediate','q'))
+HEADER=1+len(COUNTS)+2*len(SECTIONS)
+
+# symbols looked up by a SharedCKY which it keeps the numbers of
+CACHE_SIZE=4096
+
+class SharedGrammar:
+    '''A CKY parser's indices as flat arrays in one buffer'''
+
+    def __init__(self,buffer,owner=None):
+        '''Read the arrays from a buffer built by build(); use create,
+        attach or load rather than calling this
+
+        :type buffer: buffer
+        :param buffer: the bytes, in shared memory or a mapped file
+        :param owner: what holds the buffer (closed by close())
+        '''
+        self.owner=owner
+        self._views=[]
+        view=self.view(memoryview(buffer))
+        header=self.view(view[:8*HEADER].cast('q'))
+        if header[0]!=MAGIC:
+            raise ValueError('not a shared CKY grammar')
+        for i,name in enumerate(COUNTS):
+            setattr(self,name,header[1+i])
+        base=1+len(COUNTS)
+        for i,(name,code) in enumerate(SECTIONS):
+            start,length=header[base+2*i],header[base+2*i+1]
+            size=array(code).itemsize
+            setattr(self,name,self.view(
+                view[start:start+length*size].cast(code)))
+
+    def view(self,view):
+        '''Keep a read-only view, so that close() can release it'''
+        view=view.toreadonly()
+        self._views.append(view)
+        return view
+
+    @classmethod
+    def create(cls,parser,name=None):
+        '''A SharedGrammar for parser in a new block of shared memory,
+        which this process must unlink when the workers are done
+
+        :type parser: CKY
+        :param parser: the parser whose indices to share
+        :type name: str
+        :param name: the block's name, or None for a new one
+        '''
+        data=build(parser)
+        block=shared_memory.SharedMemory(name,create=True,size=len(data))
+        block.buf[:len(data)]=data
+        return cls(block.buf,block)
+
+    @classmethod
+    def attach(cls,name):
+        '''A SharedGrammar for the block created with that name'''
+        # only the process which made the block may remove it: before
+        #  Python 3.13 every process attaching also registers it, and
+        #  removes it when it exits
+        if sys.version_info>=(3,13):
+            block=shared_memory.SharedMemory(name,track=False)
+        else:
+            block=shared_memory.SharedMemory(name)
+            resource_tracker.unregister(_tracked(block),'shared_memory')
+        return cls(block.buf,block)
+
+    @staticmethod
+    def save(parser,path):
+        '''Write parser's indices to a file, for load'''
+        with open(path,'wb') as f:
+            f.write(build(parser))
+
+    @classmethod
+    def load(cls,path):
+        '''A SharedGrammar mapping a file written by save'''
+        with open(path,'rb') as f:
+            mapped=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        return cls(mapped,mapped)
+
+    @property
+    def name(self):
+        '''The shared memory block's name, for attach'''
+        return self.owner.name
+
+    def close(self):
+        '''Postcondition: this process no longer uses the buffer'''
+        for view in reversed(self._views):
+            view.release()
+        self._views=[]
+        if self.owner is not None:
+            self.owner.close()
+
+    def unlink(self):
+        '''Postcondition: the shared memory block is gone, once every
+        process has closed it'''
+        self.close()
+        # a worker attaching may have unregistered the block from the
+        #  resource tracker it shares with this process (see attach), and
+        #  unlink() unregisters it again
+        if sys.version_info<(3,13):
+            resource_tracker.register(_tracked(self.owner),'shared_memory')
+        self.owner.unlink()
+
+    def symbolName(self,i):
+        '''The name of symbol i, as a str'''
+        return bytes(self.blob[self.names[i]:self.names[i+1]]).decode(
+            'utf-8')
+
+    def symbolId(self,symbol):
+        '''The number of a symbol (a Nonterminal or a word), or -1'''
+        nonterminal=isinstance(symbol,Nonterminal)
+        key=(symbol.symbol() if nonterminal else symbol).encode('utf-8')
+        table=self.table
+        mask=self.table_size-1
+        slot=_hash(key,nonterminal)&mask
+        names=self.names
+        blob=self.blob
+        while True:
+            i=table[slot]
+            if i<0:
+                return -1
+            if ((i<self.nonterminals)==nonterminal and
+                blob[names[i]:names[i+1]]==key):
+                return i
+            slot=(slot+1)&mask
+
+class SharedCKY:
+    '''A CKY parser whose indices are in a SharedGrammar'''
+
+    # CKY's methods which only use the indices
+    parse=CKY.parse
+    parseMany=CKY.parseMany
+    lexicalise=CKY.lexicalise
+    chooseMode=CKY.chooseMode
+    recognise=CKY.recognise
+
+    def __init__(self,shared):
+        '''
+        :type shared: SharedGrammar
+        :param shared: the indices
+        '''
+        self.shared=shared
+        # the only Python objects per symbol: one Nonterminal for each
+        #  non-terminal, made when first needed
+        self._nonterminals=[None]*shared.nonterminals
+        self._ids={}
+        self.grammar=_Grammar(self)
+        self.unary=_Unary(self)
+        self.binary=_Binary(self)
+        self.logprob=_Logprob(self)
+        self.outsideEstimate=_Outside(self)
+        self.lexicon=_Lexicon(self)
+        self.probabilistic=bool(shared.probabilistic)
+
+    def symbolId(self,symbol):
+        '''The number of a symbol, or -1, through a small cache'''
+        i=self._ids.get(symbol)
+        if i is None:
+            if len(self._ids)>=CACHE_SIZE:
+                self._ids.clear()
+            i=self._ids[symbol]=self.shared.symbolId(symbol)
+        return i
+
+    def nonterminal(self,i):
+        '''The Nonterminal numbered i'''
+        res=self._nonterminals[i]
+        if res is None:
+            res=self._nonterminals[i]=Nonterminal(self.shared.symbolName(i))
+        return res
+
+    def restoreTree(self,tree):
+        '''A tree from a chart of this parser, with the children of any
+        binarisation intermediate spliced into its parent (see
+        binarise.Binarisation.restore)'''
+        if not isinstance(tree,cfg_fix.Tree):
+            return tree
+        children=[]
+        for child in tree:
+            child=self.restoreTree(child)
+            if (isinstance(child,cfg_fix.Tree) and
+                self.isIntermediate(child.label())):
+                children.extend(child)
+            else:
+                children.append(child)
+        return cfg_fix.Tree(tree.label(),children)
+
+    def isIntermediate(self,label):
+        i=self.symbolId(Nonterminal(label))
+        return i>=0 and self.shared.intermediate[i]==1
+
+    def symbol(self,i):
+        '''Symbol i: a Nonterminal, or a word'''
+        if i<self.shared.nonterminals:
+            return self.nonterminal(i)
+        return self.shared.symbolName(i)
+
+    def productions(self):
+        '''The grammar's rules, with binarised rules whole again, as CKY's
+        productions() gives them (less any the trimming removed)
+
+        How: Read every rule out of the unary and binary runs, then
+        splice into each right-hand side the one rule of any
+        binarisation intermediate in it. A long rule keeps the
+        probability of its top rule, the intermediates' being 1.0.
+
+        :rtype: list(nltk.grammar.Production)
+        '''
+        shared=self.shared
+        rules=[]
+        for i in range(shared.symbols):
+            for k in range(shared.unary_start[i],shared.unary_start[i+1]):
+                rules.append((shared.unary_lhs[k],(i,),
+                              shared.unary_logprob[k]))
+        for j,key in enumerate(shared.binary_keys):
+            rhs=divmod(key,shared.symbols)
+            for k in range(shared.binary_start[j],shared.binary_start[j+1]):
+                rules.append((shared.binary_lhs[k],rhs,
+                              shared.binary_logprob[k]))
+        def intermediate(i):
+            return i<shared.nonterminals and shared.intermediate[i]==1
+        chains=dict((lhs,rhs) for lhs,rhs,lp in rules if intermediate(lhs))
+        def whole(rhs):
+            return [sym for i in rhs
+                    for sym in (whole(chains[i]) if intermediate(i)
+                                else [self.symbol(i)])]
+        res=[]
+        for lhs,rhs,lp in rules:
+            if intermediate(lhs):
+                continue
+            if self.probabilistic:
+                res.append(ProbabilisticProduction(self.nonterminal(lhs),
+                                                   whole(rhs),prob=2**lp))
+            else:
+                res.append(Production(self.nonterminal(lhs),whole(rhs)))
+        return res
+
+class _Grammar:
+    '''Stands in for the grammar: a chart only asks for the start symbol,
+    which is answered at once; anything else is asked of an NLTK grammar
+    of the rules, built the first time it is needed'''
+    def __init__(self,parser):
+        self._parser=parser
+        self._start=parser.nonterminal(parser.shared.start)
+        self._grammar=None
+    def start(self):
+        return self._start
+    def __getattr__(self,name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._grammar is None:
+            # CKY's transforms also keep a PCFG as a CFG of
+            #  ProbabilisticProductions, as its probabilities may not
+            #  quite sum to one
+            self._grammar=CFG(self._start,self._parser.productions())
+        return getattr(self._grammar,name)
+
+class _Unary:
+    '''CKY.unary: child symbol -> parents'''
+    def __init__(self,parser):
+        self.parser=parser
+        self.start=parser.shared.unary_start
+        self.lhs=parser.shared.unary_lhs
+    def __contains__(self,symbol):
+        i=self.parser.symbolId(symbol)
+        return i>=0 and self.start[i]<self.start[i+1]
+    def __getitem__(self,symbol):
+        i=self.parser.symbolId(symbol)
+        if i<0 or self.start[i]==self.start[i+1]:
+            raise KeyError(symbol)
+        nonterminal=self.parser.nonterminal
+        return [nonterminal(a) for a in self.lhs[self.start[i]:
+                                                  self.start[i+1]]]
+    def run(self,rhs):
+        '''Where the rules for a one-symbol rhs are, or None'''
+        i=self.parser.symbolId(rhs[0])
+        if i<0:
+            return None
+        return self.start[i],self.start[i+1]
+
+class _Binary:
+    '''CKY.binary: (left, right) -> parents'''
+    def __init__(self,parser):
+        shared=parser.shared
+        self.parser=parser
+        self.size=shared.symbols
+        self.keys=shared.binary_keys
+        self.start=shared.binary_start
+        self.lhs=shared.binary_lhs
+    def find(self,rhs):
+        '''The position of rhs among the keys, or -1'''
+        left=self.parser.symbolId(rhs[0])
+        right=self.parser.symbolId(rhs[1])
+        if left<0 or right<0:
+            return -1
+        key=left*self.size+right
+        i=bisect.bisect_left(self.keys,key)
+        if i<len(self.keys) and self.keys[i]==key:
+            return i
+        return -1
+    def __contains__(self,rhs):
+        return self.find(rhs)>=0
+    def __getitem__(self,rhs):
+        i=self.find(rhs)
+        if i<0:
+            raise KeyError(rhs)
+        nonterminal=self.parser.nonterminal
+        return [nonterminal(a) for a in self.lhs[self.start[i]:
+                                                  self.start[i+1]]]
+    def run(self,rhs):
+        '''Where the rules for a two-symbol rhs are, or None'''
+        i=self.find(rhs)
+        if i<0:
+            return None
+        return self.start[i],self.start[i+1]
+
+class _Logprob:
+    '''CKY.logprob: (lhs, rhs) -> log probability'''
+    def __init__(self,parser):
+        shared=parser.shared
+        self.parser=parser
+        self.unary=(parser.unary,shared.unary_lhs,shared.unary_logprob)
+        self.binary=(parser.binary,shared.binary_lhs,shared.binary_logprob)
+    def get(self,rule,default=None):
+        if not self.parser.probabilistic:
+            return default
+        lhs,rhs=rule
+        index,lhss,logprobs=self.unary if len(rhs)==1 else self.binary
+        run=index.run(rhs)
+        if run is None:
+            return default
+        a=self.parser.symbolId(lhs)
+        for j in range(*run):
+            if lhss[j]==a:
+                return logprobs[j]
+        return default
+
+class _Outside:
+    '''CKY.outsideEstimate: non-terminal -> estimate'''
+    def __init__(self,parser):
+        self.parser=parser
+        self.outside=parser.shared.outside
+    def get(self,symbol,default=None):
+        i=self.parser.symbolId(symbol)
+        if i<0 or i>=len(self.outside) or self.outside[i]==-math.inf:
+            return default
+        return self.outside[i]
+
+class _Lexicon:
+    '''CKY.lexicon, for the words in: the words of the grammar'''
+    def __init__(self,parser):
+        self.parser=parser
+    def __contains__(self,word):
+        return self.parser.symbolId(word)>=0
+
+def _tracked(block):
+    '''The name the resource tracker knows a block by: on POSIX, where it
+    is used, its name with a leading slash'''
+    return '/'+block.name
+
+def _hash(key,nonterminal):
+    return zlib.crc32(key,1 if nonterminal else 0)
+
+def build(parser):
+    '''The bytes of a SharedGrammar for a CKY parser's indices
+
+    :type parser: CKY
+    :param parser: the parser
+    :rtype: bytes
+    '''
+    if parser.collapse is not None:
+        raise ValueError('a grammar with collapsed unary chains cannot '
+                         'be shared')
+    nonterminals=set([parser.grammar.start()])
+    words=set()
+    def note(sym):
+        (nonterminals if isinstance(sym,Nonterminal) else words).add(sym)
+    for child,lhss in parser.unary.items():
+        note(child)
+        nonterminals.update(lhss)
+    for rhs,lhss in parser.binary.items():
+        for sym in rhs:
+            note(sym)
+        nonterminals.update(lhss)
+    symbols=sorted(nonterminals,key=str)+sorted(words)
+    number=dict((sym,i) for i,sym in enumerate(symbols))
+    count=len(symbols)
+    # names and their hash table, at most half full
+    names=array('q',[0])
+    blob=bytearray()
+    table_size=1
+    while table_size<2*count:
+        table_size*=2
+    table=array('q',[-1])*table_size
+    for i,sym in enumerate(symbols):
+        nonterminal=isinstance(sym,Nonterminal)
+        key=(sym.symbol() if nonterminal else sym).encode('utf-8')
+        blob+=key
+        names.append(len(blob))
+        slot=_hash(key,nonterminal)&(table_size-1)
+        while table[slot]>=0:
+            slot=(slot+1)&(table_size-1)
+        table[slot]=i
+    logprob=parser.logprob
+    def lp(lhs,rhs):
+        return logprob.get((lhs,rhs),0.0)
+    # unary runs, by child
+    unary_start=array('q',[0])
+    unary_lhs=array('q')
+    unary_logprob=array('d')
+    for sym in symbols:
+        for lhs in parser.unary.get(sym,()):
+            unary_lhs.append(number[lhs])
+            unary_logprob.append(lp(lhs,(sym,)))
+        unary_start.append(len(unary_lhs))
+    # binary runs, by sorted key
+    keyed=sorted((number[rhs[0]]*count+number[rhs[1]],rhs)
+                 for rhs in parser.binary)
+    binary_keys=array('q',[key for key,rhs in keyed])
+    binary_start=array('q',[0])
+    binary_lhs=array('q')
+    binary_logprob=array('d')
+    for key,rhs in keyed:
+        for lhs in parser.binary[rhs]:
+            binary_lhs.append(number[lhs])
+            binary_logprob.append(lp(lhs,rhs))
+        binary_start.append(len(binary_lhs))
+    outside=array('d',[parser.outsideEstimate.get(sym,-math.inf)
+                       for sym in symbols[:len(nonterminals)]])
+    inter=set()
+    if parser.binarisation is not None:
+        inter=parser.binarisation.symbols
+    intermediate=array('q',[1 if sym in inter else 0
+                            for sym in symbols[:len(nonterminals)]])
+    sections=dict(names=names,blob=array('B',bytes(blob)),table=table,
+                  unary_start=unary_start,unary_lhs=unary_lhs,
+                  unary_logprob=unary_logprob,binary_keys=binary_keys,
+                  binary_start=binary_start,binary_lhs=binary_lhs,
+                  binary_logprob=binary_logprob,outside=outside,
+                  intermediate=intermediate)
+    header=array('q',[MAGIC,count,len(nonterminals),table_size,
+                      len(unary_lhs),len(binary_keys),len(binary_lhs),
+                      number[parser.grammar.start()],
+                      1 if parser.probabilistic else 0])
+    data=bytearray(8*HEADER)
+    for name,code in SECTIONS:
+        section=sections[name]
+        # every section starts on an 8-byte boundary
+        data+=bytes(-len(data)%8)
+        header.extend([len(data),len(section)])
+        data+=section.tobytes()
+    data[:8*HEADER]=header.tobytes()
+    return bytes(data)
+
+# run in each worker of the demonstration below
+_worker=None
+
+def _attach(name):
+    global _worker
+    _worker=SharedCKY(SharedGrammar.attach(name))
+
+def _counts(sentences):
+    return [_worker.parse(tokens).count() for tokens in sentences]
+
+if __name__=='__main__':
+    import sys
+    import tracemalloc
+    import concurrent.futures
+    from hw2_5 import grammar2, tokenise
+    from prune_eval import SENTENCES
+    from segment import Segmenter
+    extra=int(sys.argv[1]) if len(sys.argv)>1 else 50000
+    # grammar2 with a large lexicon, as a treebank grammar would have
+    productions=list(grammar2.productions())
+    for i in range(extra):
+        productions.append(Production(Nonterminal(['Nsc','Nmp','Adj',
+                                                   'PropN'][i%4]),
+                                      ['w%d'%i]))
+    grammar=CFG(grammar2.start(),productions)
+    tracemalloc.start()
+    parser=CKY(grammar)
+    own=tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    shared=SharedGrammar.create(parser)
+    print('%d rules: CKY indices %.1fMB of Python objects per process, '
+          'shared block %.1fMB in all'%(len(productions),own/1e6,
+                                        len(shared.owner.buf)/1e6))
+    tracemalloc.start()
+    attached=SharedCKY(SharedGrammar.attach(shared.name))
+    sentences=[tokenise(s) for s in SENTENCES]
+    want=[parser.parse(tokens).count() for tokens in sentences]
+    got=[attached.parse(tokens).count() for tokens in sentences]
+    print('attached, after parsing: %.2fMB of Python objects'%(
+        tracemalloc.get_traced_memory()[0]/1e6))
+    tracemalloc.stop()
+    assert got==want
+    # the grammar as the rest of the code reads it
+    assert attached.grammar.start()==parser.grammar.start()
+    assert (sorted(map(str,attached.productions()))==
+            sorted(map(str,parser.productions())))
+    text=[token for tokens in sentences for token in tokens]
+    assert (Segmenter(attached).parse(text).brackets()==
+            Segmenter(parser).parse(text).brackets())
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                4,initializer=_attach,initargs=(shared.name,)) as pool:
+            for counts in pool.map(_counts,[sentences]*4):
+                assert counts==want
+        print('4 workers attached and agree with CKY')
+    finally:
+        attached.shared.close()
+        shared.unlink()
@@ -0,0 +1,28 @@
+'''Timing for the benchmarks: the fastest of several runs
+
+The first run of anything pays for warming caches (and the odd run is
+slowed by something else on the machine), so the benchmarks report the
+fastest of a few runs rather than one, or the mean.
+
+    took,results=best_time(lambda:[parser.parse(t) for t in sentences])
+'''
+import time
+
+def best_time(run,repeat=5):
+    '''The fastest of repeat calls of run, and what the last one returned
+
+    :type run: function
+    :param run: what to time, called with no arguments
+    :type repeat: int
+    :param repeat: how many times to call it
+    :rtype: tuple(float, object)
+    :return: (the fastest time in seconds, run's result)
+    '''
+    elapsed=None
+    for i in range(repeat):
+        start=time.time()
+        result=run()
+        took=time.time()-start
+        if elapsed is None or took<elapsed:
+            elapsed=took
+    return elapsed,result
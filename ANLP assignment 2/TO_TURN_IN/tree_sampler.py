@@ -0,0 +1,204 @@
+'''Drawing parse trees at random from a chart's packed forest
+
+A very ambiguous sentence has far too many trees to list, but a sample
+of them can be drawn without listing any others. Each label's
+back-pointers are weighted by how much of the forest is under them, so
+that going down from the goal and picking one back-pointer at a time by
+weight gives every tree its due chance:
+
+ uniform       a back-pointer's weight is the number of trees under it,
+               the product of its children's counts (Label.count), so
+               every tree is equally likely; the counts are exact
+               integers, and the choices are made with exact integers too
+
+ proportional  a back-pointer's weight is the rule's probability times
+               the children's inside probabilities (the sums over all
+               their trees, in log space), so each tree is drawn with its
+               probability under the PCFG given the sentence
+
+The weights of the labels under the goal are worked out once, in time
+linear in the size of the forest, and kept, so drawing one tree costs
+time linear in its size (a binary search among each label's
+back-pointers), however many trees there are.
+
+    sampler=result.sampler(seed=1)
+    trees=sampler.samples(100)
+
+A unary cycle gives a label infinitely many trees, and then sampling
+raises ValueError, as counting does.
+
+To draw trees from a very ambiguous sentence and compare how often each
+one came up with how often it should have:
+
+    python tree_sampler.py [samples]
+'''
+import math
+import bisect
+import random
+import itertools
+import nltk
+
+class TreeSampler:
+    '''Draws trees from one recognised sentence's forest'''
+
+    def __init__(self,result,proportional=False,seed=None):
+        '''
+        :type result: cky_5.ParseResult
+        :param result: a result whose sentence was recognised
+        :type proportional: bool
+        :param proportional: draw trees in proportion to their PCFG
+            probability if True, otherwise all equally likely
+        :type seed: int
+        :param seed: seeds the sampler's own random number generator, so
+            that the same seed draws the same trees
+        :raises ValueError: if the sentence was not recognised, or its
+            forest has a unary cycle
+        '''
+        if not result.recognised:
+            raise ValueError('no trees to sample: %r'%(result,))
+        self.result=result
+        self.proportional=proportional
+        self.random=random.Random(seed)
+        self.logprob=result.chart.parser.logprob
+        # label -> the running totals of its back-pointers' weights
+        self._cumulative={}
+        # label -> its inside log probability (proportional only)
+        self._inside={}
+        self.goal=result.goal()
+        if proportional:
+            self.inside(self.goal)
+        else:
+            self.goal.count()
+        self.weigh()
+
+    def inside(self,label):
+        '''The log (base 2) of the total probability of every tree under
+        label, kept for each label worked out
+
+        How: 0.0 for a word; otherwise the log of the sum, over the
+        back-pointers, of the rule's probability times the children's
+        inside probabilities, added up relative to the biggest term so
+        that nothing underflows.
+        '''
+        inside=self._inside.get(label)
+        if inside is None:
+            if not label.backpointers():
+                inside=0.0
+            else:
+                # mark as in progress, to catch a unary cycle
+                self._inside[label]=math.nan
+                terms=[self.ruleScore(label,children)+
+                       sum(self.inside(child) for child in children)
+                       for children in label.backpointers()]
+                top=max(terms)
+                if top==-math.inf:
+                    inside=top
+                else:
+                    inside=top+math.log2(sum(2**(term-top)
+                                             for term in terms))
+            self._inside[label]=inside
+        elif math.isnan(inside):
+            raise ValueError('unary cycle through %s: '
+                             'infinitely many trees'%label.symbol())
+        return inside
+
+    def ruleScore(self,label,children):
+        '''The log probability of the rule building label from children
+        (0.0 for a plain CFG)'''
+        rhs=tuple(child.symbol() for child in children)
+        return self.logprob.get((label.symbol(),rhs),0.0)
+
+    def weigh(self):
+        '''Postcondition: every label under the goal has the running
+        totals of its back-pointers' weights.
+
+        How: Visit the forest from the goal down, once per label. For the
+        uniform sampler a weight is the product of the children's counts;
+        for the proportional one it is the rule's probability times the
+        children's inside probabilities, relative to the label's own
+        inside probability, so the totals come to about 1.
+        '''
+        todo=[self.goal]
+        cumulative=self._cumulative
+        while todo:
+            label=todo.pop()
+            if label in cumulative or not label.backpointers():
+                continue
+            if self.proportional:
+                inside=self._inside[label]
+                weights=(2**(self.ruleScore(label,children)+
+                             sum(self._inside[child] for child in children)
+                             -inside)
+                         for children in label.backpointers())
+            else:
+                weights=(math.prod(child.count() for child in children)
+                         for children in label.backpointers())
+            cumulative[label]=list(itertools.accumulate(weights))
+            for children in label.backpointers():
+                todo.extend(children)
+
+    def choose(self,label):
+        '''One of label's back-pointers, picked by weight'''
+        totals=self._cumulative[label]
+        if self.proportional:
+            point=self.random.random()*totals[-1]
+        else:
+            point=self.random.randrange(totals[-1])
+        # the first whose running total is past the point; a rounding
+        #  error can only leave it at the end
+        return label.backpointers()[min(bisect.bisect_right(totals,point),
+                                        len(totals)-1)]
+
+    def sample(self):
+        '''One tree, drawn at random
+
+        :rtype: nltk.tree.Tree
+        :return: the tree, as a tree of the grammar over the sentence as
+            it was given (see ParseResult.restoreTree)
+        '''
+        return self.result.restoreTree(self.draw(self.goal))
+
+    def draw(self,label):
+        '''A tree under label, drawn at random, as it is in the chart'''
+        if not label.backpointers():
+            return label.symbol()
+        return nltk.tree.Tree(str(label.symbol()),
+                              [self.draw(child)
+                               for child in self.choose(label)])
+
+    def samples(self,k):
+        '''k trees drawn at random, independently (so perhaps with some
+        the same)
+
+        :type k: int
+        :param k: how many
+        :rtype: list(nltk.tree.Tree)
+        '''
+        return [self.sample() for i in range(k)]
+
+if __name__=='__main__':
+    import sys
+    import time
+    import collections
+    from hw2_5 import grammar2, tokenise
+    from cky_5 import CKY
+    k=int(sys.argv[1]) if len(sys.argv)>1 else 20000
+    parser=CKY(grammar2)
+    result=parser.parse(tokenise('John ate salad with mushrooms with a fork '
+                                 'with a fork with mushrooms today.'))
+    start=time.time()
+    sampler=TreeSampler(result,seed=0)
+    prepared=time.time()-start
+    start=time.time()
+    trees=sampler.samples(k)
+    took=time.time()-start
+    print('%d trees; forest weighed in %.1fms, %d drawn in %.2fs'%(
+        result.count(),prepared*1000,k,took))
+    seen=collections.Counter(str(tree) for tree in trees)
+    expected=k/result.count()
+    chi2=sum((seen.get(str(tree),0)-expected)**2/expected
+             for tree in result.trees())
+    print('%d different trees drawn; chi-squared %.1f on %d degrees of '
+          'freedom'%(len(seen),chi2,result.count()-1))
+    assert [str(t) for t in TreeSampler(result,seed=0).samples(5)]==[
+        str(t) for t in trees[:5]]
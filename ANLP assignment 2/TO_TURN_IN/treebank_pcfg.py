@@ -0,0 +1,313 @@
+'''Relative-frequency PCFG induction from bracketed trees
+
+Reads trees in the usual bracketed form, as printed by Chart.firstTree
+or found in a treebank, e.g.
+
+    (S (Sdecl (NP (PropN John)) (VP (VPi (Vi ate)))) .)
+
+and counts the productions they use. The trees are read as a stream of
+brackets and words, a line at a time, and counted as each constituent
+is closed, so no tree (let alone the whole treebank) is ever held in
+memory. Symbols and rules are numbered as they are first seen, and the
+counts are kept per rule number, so memory grows with the size of the
+grammar, not with the number of trees.
+
+A big treebank is given as several shard files. Each shard is counted
+in its own process and the counts are merged, after which every rule's
+probability is its count over the count of its left-hand side.
+
+A constituent with more than two children is counted as one long rule:
+CKY and GrammarTables binarise long rules themselves (see binarise), and
+take the intermediates back out of the trees they give.
+
+Treebank labels such as . and PRP$ are not names NLTK's grammar reader
+can read back, so each label is given a name which it can (see
+safe_name): the characters it does not allow are written /xx, with xx
+the character's code in hex (. is /2e, PRP$ is PRP/24), and / itself is
+/2f, so that label_name can undo it. The grammar written out can then
+be read in again with PCFG.fromstring.
+
+Usage:
+    python treebank_pcfg.py out.pcfg shard1.mrg [shard2.mrg ...]
+
+(with no arguments, it checks that a grammar it writes reads back in)
+'''
+import re
+import sys
+import pickle
+import multiprocessing
+from nltk.grammar import Nonterminal, PCFG, ProbabilisticProduction
+import cfg_fix
+from grammar_tables import GrammarTables
+
+_BRACKET_RE=re.compile(r"\(|\)|[^\s()]+")
+# the characters a non-terminal's name may have, after its first one,
+#  less the / used to escape the rest
+_NAME_CHAR_RE=re.compile(r"[\w^<>-]")
+_ESCAPE_RE=re.compile(r"/(u[0-9a-f]{4}|[0-9a-f]{2})")
+
+def safe_name(label):
+    '''A treebank label as a non-terminal name NLTK's grammar reader can
+    read, e.g. PRP/24 for PRP$
+
+    :type label: str
+    :rtype: str
+    '''
+    res=[]
+    for i,char in enumerate(label):
+        if char!='/' and _NAME_CHAR_RE.match(char) and (
+                i>0 or char not in '^<>-'):
+            res.append(char)
+        elif ord(char)<256:
+            res.append('/%02x'%ord(char))
+        else:
+            res.append('/u%04x'%ord(char))
+    return ''.join(res)
+
+def label_name(name):
+    '''The treebank label a safe_name stands for'''
+    return _ESCAPE_RE.sub(lambda m:chr(int(m.group(1).lstrip('u'),16)),name)
+
+class RuleCounts:
+    '''Production counts with integer-numbered symbols and rules
+
+    Non-terminals are numbered 0, 1, 2, ... and words -1, -2, ..., so a
+    rule is a tuple of small ints (lhs first) and is itself numbered.
+    counts[r] is the number of times rule r was seen.'''
+
+    def __init__(self):
+        self.nonterminals=[]
+        self.nt_index={}
+        self.words=[]
+        self.word_index={}
+        self.rules=[]
+        self.rule_index={}
+        self.counts=[]
+        # how often each non-terminal was the root of a tree
+        self.roots={}
+        self.trees=0
+
+    def nonterminal(self,label):
+        '''The number of a non-terminal, given its (safe) name'''
+        i=self.nt_index.get(label)
+        if i is None:
+            i=len(self.nonterminals)
+            self.nt_index[label]=i
+            self.nonterminals.append(label)
+        return i
+
+    def word(self,word):
+        '''The (negative) number of a word'''
+        i=self.word_index.get(word)
+        if i is None:
+            self.words.append(word)
+            i=-len(self.words)
+            self.word_index[word]=i
+        return i
+
+    def add(self,rule,count=1):
+        '''Count a rule, given as a tuple of symbol numbers'''
+        r=self.rule_index.get(rule)
+        if r is None:
+            r=len(self.rules)
+            self.rule_index[rule]=r
+            self.rules.append(rule)
+            self.counts.append(count)
+        else:
+            self.counts[r]+=count
+
+    def addConstituent(self,lhs,children):
+        '''Postcondition: the rule(s) for one constituent have been counted.
+
+        How: A constituent is one rule, however many children it has.
+
+        :type lhs: int
+        :param lhs: the constituent's non-terminal number
+        :type children: list(int)
+        :param children: its children's symbol numbers
+        '''
+        self.add((lhs,)+tuple(children))
+
+    def symbol(self,i):
+        '''A symbol number as an NLTK grammar symbol'''
+        if i>=0:
+            return Nonterminal(self.nonterminals[i])
+        return self.words[-1-i]
+
+    def countStream(self,lines):
+        '''Postcondition: every tree in lines has been counted.
+
+        How: Split each line into brackets and words. An open bracket
+        starts a constituent, whose label is the next token (a treebank's
+        outer unlabelled bracket has none, and is skipped); any other
+        token is a word. A close bracket ends the innermost constituent:
+        its rule is counted and its symbol becomes a child of the one
+        around it. Trees may span lines, and a line may hold several.
+
+        :type lines: iter(str)
+        :param lines: the text, e.g. an open file
+        '''
+        # each entry is [label number or None, child symbol numbers]
+        stack=[]
+        expect_label=False
+        for line in lines:
+            for token in _BRACKET_RE.findall(line):
+                if token=='(':
+                    if expect_label:
+                        # an unlabelled bracket, e.g. ( (S ...) )
+                        stack[-1][0]=None
+                    stack.append([None,[]])
+                    expect_label=True
+                elif token==')':
+                    expect_label=False
+                    if not stack:
+                        raise ValueError('unbalanced ")" in treebank')
+                    label,children=stack.pop()
+                    if label is None:
+                        # unlabelled: pass its only child straight up
+                        if stack:
+                            stack[-1][1].extend(children)
+                        elif len(children)==1 and children[0]>=0:
+                            self.noteRoot(children[0])
+                        continue
+                    if children:
+                        self.addConstituent(label,children)
+                    if stack:
+                        stack[-1][1].append(label)
+                    else:
+                        self.noteRoot(label)
+                elif expect_label:
+                    stack[-1][0]=self.nonterminal(safe_name(token))
+                    expect_label=False
+                else:
+                    if not stack:
+                        raise ValueError('word %r outside any tree'%token)
+                    stack[-1][1].append(self.word(token))
+        if stack:
+            raise ValueError('treebank ends inside a tree')
+
+    def noteRoot(self,label):
+        self.roots[label]=self.roots.get(label,0)+1
+        self.trees+=1
+
+    def merge(self,other):
+        '''Postcondition: other's counts have been added to these
+
+        How: Renumber each of other's rules with this object's symbol
+        numbers (adding any new symbols), then add its count.'''
+        def remap(i):
+            if i>=0:
+                return self.nonterminal(other.nonterminals[i])
+            return self.word(other.words[-1-i])
+        for rule,count in zip(other.rules,other.counts):
+            self.add(tuple(remap(i) for i in rule),count)
+        for label,count in other.roots.items():
+            mine=remap(label)
+            self.roots[mine]=self.roots.get(mine,0)+count
+        self.trees+=other.trees
+
+    def toPCFG(self,start=None):
+        '''The relative-frequency estimate of the grammar
+
+        :type start: str
+        :param start: the start symbol's treebank label, defaults to the
+            commonest root
+        :rtype: nltk.grammar.PCFG
+        :return: the PCFG
+        '''
+        if start is None:
+            if not self.roots:
+                raise ValueError('no trees have been counted')
+            start=self.nonterminals[max(self.roots,key=self.roots.get)]
+        else:
+            start=safe_name(start)
+        totals={}
+        for rule,count in zip(self.rules,self.counts):
+            totals[rule[0]]=totals.get(rule[0],0)+count
+        productions=[ProbabilisticProduction(
+                         self.symbol(rule[0]),
+                         [self.symbol(i) for i in rule[1:]],
+                         prob=count/totals[rule[0]])
+                     for rule,count in zip(self.rules,self.counts)]
+        return PCFG(Nonterminal(start),productions)
+
+def count_file(filename):
+    '''Count the productions in one shard file'''
+    counts=RuleCounts()
+    with open(filename) as f:
+        counts.countStream(f)
+    return counts
+
+def count_shards(filenames,processes=None):
+    '''Count every shard, in parallel, and merge the counts
+
+    :type filenames: list(str)
+    :param filenames: the shard files
+    :type processes: int
+    :param processes: number of worker processes; 1 counts in this
+        process, None uses one per CPU
+    :rtype: RuleCounts
+    :return: the merged counts
+    '''
+    total=RuleCounts()
+    if processes==1 or len(filenames)<2:
+        for filename in filenames:
+            total.merge(count_file(filename))
+        return total
+    with multiprocessing.Pool(processes) as pool:
+        for counts in pool.imap_unordered(count_file,filenames):
+            total.merge(counts)
+    return total
+
+def induce(filenames,start=None,processes=None):
+    '''Induce a PCFG from treebank shards
+
+    :rtype: GrammarTables
+    :return: the compiled relative-frequency PCFG; CKY can load its
+        grammar attribute (or tables.toPCFG())
+    '''
+    return GrammarTables(count_shards(filenames,processes).toPCFG(start))
+
+# a few trees with the labels and long constituents of a real treebank
+_SAMPLE='''
+( (S (NP-SBJ (PRP$ Their) (NN plan)) (VP (VBD was) (ADJP (JJ simple)))
+     (. .)) )
+( (S (NP-SBJ (PRP It)) (VP (VBD gave) (NP (PRP him)) (NP (DT a) (NN book))
+     (PP (IN in) (NP (-NONE- *T*)))) (, ,) (`` ``) (NP (NN Mary)) ('' '')
+     (. .)) )
+( (S (NP-SBJ (PRP He)) (VP (VBD ate) (NP (NNS salad) (CC and) (NNS beans)))
+     (. .)) )
+'''
+
+def check_round_trip():
+    '''Postcondition: a grammar induced from _SAMPLE has been written out
+    and read back in as the same grammar, and CKY parses with it to trees
+    with no intermediates in them.'''
+    counts=RuleCounts()
+    counts.countStream(_SAMPLE.splitlines())
+    tables=GrammarTables(counts.toPCFG())
+    back=PCFG.fromstring(tables.grammarString())
+    def rules(grammar):
+        return sorted((str(p.lhs()),tuple(str(sym) for sym in p.rhs()),
+                       round(p.prob(),12)) for p in grammar.productions())
+    assert back.start()==tables.grammar.start()
+    assert rules(back)==rules(tables.grammar)
+    assert rules(tables.toPCFG())==rules(tables.grammar)
+    from cky_5 import CKY
+    tokens='He ate salad and beans .'.split()
+    tree=next(CKY(back).parse(tokens).trees())
+    assert all('<' not in label_name(t.label()) for t in tree.subtrees())
+    assert [label_name(t.label()) for t in tree]==['NP-SBJ','VP','.']
+    print('%d rules written and read back; %s'%(len(back.productions()),
+                                                tree))
+
+if __name__=='__main__':
+    if len(sys.argv)<3:
+        check_round_trip()
+        sys.exit()
+    out_file=sys.argv[1]
+    tables=induce(sys.argv[2:])
+    tables.write(out_file)
+    # the compiled tables too, ready to load without re-reading the text
+    with open(out_file+'.tables','wb') as f:
+        pickle.dump(tables,f,pickle.HIGHEST_PROTOCOL)
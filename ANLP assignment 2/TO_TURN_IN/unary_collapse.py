@@ -0,0 +1,246 @@
+'''Collapsing unary chains into compound symbols, and undoing it in trees
+
+grammar2 has long chains of unary rules, such as VP -> VPi -> Vi, and
+every link of a chain is a label of its own in a CKY cell. Many of the
+symbols in those chains are only ever the single child of a unary rule:
+they never appear in a binary rule and are not the start symbol, so
+their labels are only there to be passed up to their parents. Call them
+pass-through symbols.
+
+This transform takes them out of the grammar. A unary chain from a
+symbol which is not pass-through (its top) down through pass-through
+symbols becomes one compound symbol, named after the whole chain as
+NLTK's Tree.collapse_unary names it:
+
+    VP -> VPi,  VPi -> Vi,  Vi -> 'ate'    becomes    VP+VPi+Vi -> 'ate'
+
+with one rule for each rule of the bottom of the chain (its probability
+is the product of the chain's). A chain from the start symbol keeps the
+start symbol out of the compound, S -> A+B, so that the chart's goal is
+still the start symbol itself. A compound stands for its top wherever
+the top is a child of a rule, so each such rule gets a copy with the
+compound in its place. In the chart, the whole chain is one label, so
+cells hold fewer labels and maybeBuild tries fewer pairs.
+
+Every tree of the original grammar corresponds to exactly one of the
+collapsed one, so counts and probabilities are unchanged, and restore()
+splits every compound back into its chain. Pass-through symbols on a
+unary cycle are left alone (their chains would never end).
+
+CKY(grammar,collapse=True) applies the transform, after binarising, and
+gives trees back in terms of the original grammar. To compare chart
+sizes with and without it on grammar2:
+
+    python unary_collapse.py
+'''
+import itertools
+from nltk.grammar import Nonterminal, Production, ProbabilisticProduction, CFG
+from nltk.tree import Tree
+import cfg_fix
+
+JOIN='+'
+
+class UnaryCollapse:
+    '''A grammar with its unary chains collapsed, and how to undo it'''
+
+    def __init__(self,grammar):
+        '''Collapse the unary chains of grammar
+
+        :type grammar: nltk.grammar.CFG, as fixed by cfg_fix
+        :param grammar: a grammar with at most two symbols on the
+            right-hand side of any rule (see binarise)
+        '''
+        self.original=grammar
+        productions=grammar.productions()
+        probabilistic=any(hasattr(p,'prob') for p in productions)
+        rules=[(p.lhs(),p.rhs(),p.prob() if probabilistic else None)
+               for p in productions]
+        for lhs,rhs,prob in rules:
+            if JOIN in lhs.symbol():
+                raise ValueError('%s: symbols joined with %r cannot be told '
+                                 'from compounds'%(lhs,JOIN))
+        self.passthrough=_passthrough(grammar.start(),rules)
+        by_lhs={}
+        for rule in rules:
+            by_lhs.setdefault(rule[0],[]).append(rule)
+        # compound symbol -> its chain, top first
+        self.chains={}
+        # top symbol -> its compounds
+        compounds={}
+        new_rules=[]
+        for lhs,rhs,prob in rules:
+            if lhs in self.passthrough:
+                continue
+            if len(rhs)==1 and rhs[0] in self.passthrough:
+                if lhs==grammar.start():
+                    # the start symbol must stay a label of its own, for
+                    #  the chart's goal: collapse the rest of the chain,
+                    #  under a unary rule from the start symbol
+                    for chain,bottom_rhs,chain_prob in self.follow(
+                            [],rhs[0],1.0 if prob is not None else None,
+                            by_lhs):
+                        compound=self.compound(chain,None)
+                        new_rules.append((lhs,(compound,),prob))
+                        new_rules.append((compound,bottom_rhs,chain_prob))
+                    continue
+                # the start of one or more chains
+                for chain,bottom_rhs,chain_prob in self.follow(
+                        [lhs],rhs[0],prob,by_lhs):
+                    compound=self.compound(chain,compounds)
+                    new_rules.append((compound,bottom_rhs,chain_prob))
+            else:
+                new_rules.append((lhs,rhs,prob))
+        # the same rule can come from more than one chain through the start
+        #  symbol: keep one of each
+        new_rules=list(dict(((lhs,rhs),(lhs,rhs,prob))
+                            for lhs,rhs,prob in new_rules).values())
+        # let each compound stand for its top as a child
+        final=[]
+        for lhs,rhs,prob in new_rules:
+            options=[[sym]+compounds.get(sym,[]) for sym in rhs]
+            for choice in itertools.product(*options):
+                final.append(_production(lhs,choice,prob))
+        self.grammar=CFG(grammar.start(),final)
+        self.before=len(productions)
+        self.after=len(final)
+
+    def compound(self,chain,compounds):
+        '''The compound symbol for chain (the symbol itself for a chain of
+        one), recorded in self.chains and, if compounds is given, as one
+        of its top's compounds'''
+        if len(chain)==1:
+            return chain[0]
+        compound=Nonterminal(JOIN.join(sym.symbol() for sym in chain))
+        if compound not in self.chains:
+            self.chains[compound]=chain
+            if compounds is not None:
+                compounds.setdefault(chain[0],[]).append(compound)
+        return compound
+
+    def follow(self,chain,symbol,prob,by_lhs):
+        '''Generate every chain from chain down through symbol to a rule
+        whose right-hand side is not a pass-through symbol
+
+        :rtype: iter(tuple(list, tuple, float))
+        :return: (chain, the bottom rule's right-hand side, the product
+            of the probabilities along it, or None for a CFG)
+        '''
+        chain=chain+[symbol]
+        for lhs,rhs,rule_prob in by_lhs.get(symbol,()):
+            total=None if prob is None else prob*rule_prob
+            if len(rhs)==1 and rhs[0] in self.passthrough:
+                for res in self.follow(chain,rhs[0],total,by_lhs):
+                    yield res
+            else:
+                yield chain,rhs,total
+
+    def restore(self,tree):
+        '''The original grammar's tree for a tree of the collapsed one
+
+        :type tree: nltk.tree.Tree
+        :param tree: a tree of self.grammar
+        :rtype: nltk.tree.Tree
+        :return: the same tree with every compound split into its chain
+        '''
+        if not isinstance(tree,Tree):
+            return tree
+        children=[self.restore(child) for child in tree]
+        chain=self.chains.get(Nonterminal(tree.label()))
+        if chain is None:
+            return Tree(tree.label(),children)
+        for symbol in reversed(chain):
+            children=[Tree(symbol.symbol(),children)]
+        return children[0]
+
+    def report(self):
+        '''A one-line summary of what collapsing did'''
+        return ('%d pass-through symbols removed, %d compound symbols '
+                'added, rules %d -> %d'%(len(self.passthrough),
+                                         len(self.chains),self.before,
+                                         self.after))
+
+def _passthrough(start,rules):
+    '''The non-terminals which are only ever the single child of a unary
+    rule, are not start and are not on a unary cycle'''
+    lhss=set(lhs for lhs,rhs,prob in rules)
+    used=set()
+    for lhs,rhs,prob in rules:
+        if len(rhs)>1:
+            used.update(rhs)
+    res=set(sym for sym in lhss if sym not in used and sym!=start)
+    # drop any on a unary cycle
+    unary={}
+    for lhs,rhs,prob in rules:
+        if len(rhs)==1 and isinstance(rhs[0],Nonterminal):
+            unary.setdefault(lhs,set()).add(rhs[0])
+    for sym in list(res):
+        seen=set()
+        todo=list(unary.get(sym,()))
+        while todo:
+            other=todo.pop()
+            if other==sym:
+                res.discard(sym)
+                break
+            if other not in seen:
+                seen.add(other)
+                todo.extend(unary.get(other,()))
+    return res
+
+def _production(lhs,rhs,prob):
+    if prob is None:
+        return Production(lhs,rhs)
+    return ProbabilisticProduction(lhs,rhs,prob=prob)
+
+def chart_work(chart):
+    '''How big a filled chart is: (labels in it, pairs of labels
+    maybeBuild tried)'''
+    matrix=chart.matrix
+    n=chart.n
+    labels=sum(len(cell.labels()) for row in matrix for cell in row
+               if cell is not None)
+    pairs=0
+    for width in range(2,n):
+        for start in range(n-width):
+            end=start+width
+            if matrix[start][end] is None:
+                continue
+            for mid in range(start+1,end):
+                if matrix[start][mid] is None or matrix[mid][end] is None:
+                    continue
+                pairs+=(len(matrix[start][mid].labels())*
+                        len(matrix[mid][end].labels()))
+    return labels,pairs
+
+if __name__=='__main__':
+    from hw2_5 import grammar2, tokenise
+    from prune_eval import SENTENCES
+    from cky_5 import CKY
+    from timing import best_time
+    sentences=[tokenise(s) for s in SENTENCES]
+    plain=CKY(grammar2)
+    collapsed=CKY(grammar2,collapse=True)
+    print(collapsed.collapse.report())
+    print('%-10s %8s %8s %8s'%('','labels','pairs','ms'))
+    for name,parser in (('plain',plain),('collapsed',collapsed)):
+        took,results=best_time(lambda:[parser.parse(tokens)
+                                       for tokens in sentences])
+        work=[chart_work(r.chart) for r in results]
+        print('%-10s %8d %8d %8.2f'%(name,sum(w[0] for w in work),
+                                     sum(w[1] for w in work),took*1000))
+    for tokens in sentences:
+        a=plain.parse(tokens)
+        b=collapsed.parse(tokens)
+        assert a.count()==b.count()
+        assert set(map(str,a.trees()))==set(map(str,b.trees()))
+    # a unary chain from the start symbol: the start symbol stays a label
+    #  of its own, so the goal is still found
+    chain=cfg_fix.parse_grammar('''
+S -> A
+A -> B C
+B -> 'b'
+C -> 'c'
+''')
+    for grammar in (chain,):
+        a=CKY(grammar).parse(['b','c'])
+        b=CKY(grammar,collapse=True).parse(['b','c'])
+        assert a and b and list(map(str,a.trees()))==list(map(str,b.trees()))
@@ -0,0 +1,86 @@
+'''Signature classes for words a grammar does not have
+
+CKY.parse rejects a sentence with a word which is in no rule of the
+grammar before it makes a chart, since no chart could reach the start
+symbol (the ParseResult lists the words in result.unknown). Given a
+signature function, it parses the word's signature in its place
+instead, so a grammar with rules for signatures, such as
+
+    PropN -> '<Cap>'
+    Nsc -> '<unk>' | '<-ing>'
+
+can still parse sentences with unknown names and nouns. The trees keep
+the words themselves as leaves.
+
+signature() gives one of
+
+    <num>   has a digit in it
+    <Cap>   starts with a capital letter
+    <-ing> <-ed> <-ly> <-s>
+            lower case, with that ending
+    <unk>   anything else
+
+To see how much time rejecting sentences early saves on noisy input,
+and how many of them signatures recover with a few rules for grammar2:
+
+    python unknown_words.py
+'''
+import re
+from nltk.grammar import Nonterminal, Production
+import cfg_fix
+
+SUFFIXES=('ing','ed','ly','s')
+
+def signature(word):
+    '''The word standing for word's class, see above'''
+    if re.search(r'\d',word):
+        return '<num>'
+    if word[:1].isupper():
+        return '<Cap>'
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word)>len(suffix)+1:
+            return '<-%s>'%suffix
+    return '<unk>'
+
+# rules for signatures in grammar2: unknown capitalised words are names,
+#  anything else a singular or mass noun
+GRAMMAR2_SIGNATURES=[('PropN','<Cap>'),('Nsc','<unk>'),('Nsc','<-ing>'),
+                     ('Nmp','<-s>')]
+
+def add_signatures(parser,rules=GRAMMAR2_SIGNATURES):
+    '''Postcondition: parser has a rule lhs -> signature for each pair
+    in rules (see CKY.addProduction)'''
+    for lhs,word in rules:
+        parser.addProduction(Production(Nonterminal(lhs),[word]))
+
+if __name__=='__main__':
+    import random
+    from hw2_5 import grammar2, tokenise
+    from prune_eval import SENTENCES
+    from cky_5 import CKY, Chart
+    from timing import best_time
+    # noisy input: the prune_eval sentences with some words replaced
+    rand=random.Random(0)
+    noise=['Smith','Paris','sandwich','pencils','reading','qwerty']
+    sentences=[]
+    for s in SENTENCES*5:
+        tokens=tokenise(s)
+        if rand.random()<0.6:
+            tokens[rand.randrange(len(tokens)-1)]=rand.choice(noise)
+        sentences.append(tokens)
+    parser=CKY(grammar2)
+    took,results=best_time(lambda:[parser.parse(tokens)
+                                   for tokens in sentences])
+    # what filling a chart for every sentence anyway would cost
+    unchecked,charts=best_time(lambda:[Chart(parser,tokens).fill()
+                                       for tokens in sentences])
+    rejected=sum(1 for r in results if r.unknown)
+    print('%d sentences, %d rejected: %.2fms with the check, %.2fms '
+          'filling every chart'%(len(sentences),rejected,took*1000,
+                                 unchecked*1000))
+    add_signatures(parser)
+    results=[parser.parse(tokens,signature=signature)
+             for tokens in sentences]
+    print('with signatures: %d rejected, %d recognised'%(
+        sum(1 for r in results if r.unknown),
+        sum(1 for r in results if r.recognised)))